@@ -0,0 +1,86 @@
+import os
+import django
+
+# Set up Django environment
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'food_delivery_system.settings')
+django.setup()
+
+import time
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from food_delivery_system.users.models import CustomUser
+from food_delivery_system.orders.models import Order, OrderItem, MenuItem
+from food_delivery_system.restaurant.models import Restaurant
+from food_delivery_system.serializers.serializer import OrderSerializer
+
+BASKET_SIZES = [1, 5, 20, 50]
+ROUNDS = 20
+
+
+class Rollback(Exception):
+    """Raised to roll back the benchmark data once a measurement is taken."""
+
+
+def place_order_per_item(customer, restaurant, items):
+    """The previous placement path: one get_or_create and one insert per line item."""
+    order = Order.objects.create(customer=customer, restaurant=restaurant)
+    for item_data in items:
+        menu_item, _ = MenuItem.objects.get_or_create(
+            name=item_data["menu_item"],
+            defaults={"price": 0.00, "available": True}
+        )
+        OrderItem.objects.create(
+            order=order,
+            menu_item=menu_item,
+            quantity=item_data["quantity"],
+            price=menu_item.price * item_data["quantity"],
+        )
+    return order
+
+
+def place_order_batched(customer, restaurant, items):
+    """The batched placement path of OrderSerializer.create."""
+    serializer = OrderSerializer(data={"restaurant": restaurant.id, "items": items})
+    serializer.is_valid(raise_exception=True)
+    return serializer.save(customer=customer)
+
+
+def measure(place_order, customer, restaurant, items):
+    """Return (queries, average milliseconds) for placing the same order ROUNDS times."""
+    queries = 0
+    elapsed = 0.0
+    for _ in range(ROUNDS):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            place_order(customer, restaurant, items)
+            elapsed += time.perf_counter() - start
+        queries = len(context.captured_queries)
+    return queries, elapsed / ROUNDS * 1000
+
+
+def run_benchmark():
+    try:
+        with transaction.atomic():
+            customer = CustomUser.objects.create(username="bench-order-customer", email="bench@example.com")
+            restaurant = Restaurant.objects.create(name="Bench Restaurant", address="Bench Address")
+            MenuItem.objects.bulk_create([
+                MenuItem(name=f"Bench Dish {i}", price=Decimal("4.20"), available=True)
+                for i in range(max(BASKET_SIZES))
+            ])
+
+            print(f"{'items':>6} | {'per-item queries':>16} | {'per-item ms':>11} | {'batched queries':>15} | {'batched ms':>10}")
+            for size in BASKET_SIZES:
+                items = [{"menu_item": f"Bench Dish {i}", "quantity": 2} for i in range(size)]
+                legacy_queries, legacy_ms = measure(place_order_per_item, customer, restaurant, items)
+                batched_queries, batched_ms = measure(place_order_batched, customer, restaurant, items)
+                print(f"{size:>6} | {legacy_queries:>16} | {legacy_ms:>11.2f} | {batched_queries:>15} | {batched_ms:>10.2f}")
+            raise Rollback()
+    except Rollback:
+        pass
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -77,7 +77,7 @@ class CreateUser(BaseMutation):
             # user = request.user
             token = kwargs.get("token", None)
             try:
-                user_authentication = user_auth.get_user_authentication(token)
+                user_authentication = user_auth.get_user_authentication(token, info.context)
                 if not user_authentication:
                     raise GraphQLError(f"Authentication is required. Please check if the token is valid.")
 
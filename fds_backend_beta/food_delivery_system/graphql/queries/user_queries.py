@@ -51,16 +51,16 @@ class UserQueries(graphene.ObjectType):
     user_by_id = graphene.Field(CustomUserType, id=graphene.Int(required=True), token=graphene.String(required=True))
 
     @silk_profile(name="GraphQL - Fetch All Users")
-    def resolve_all_users(self, root, token):
-        user = user_auth.get_user_authentication(token)
+    def resolve_all_users(self, info, token):
+        user = user_auth.get_user_authentication(token, info.context)
         if not user:
             raise GraphQLError(f"User '{user}' not found.")
         return get_user_model().objects.all()
 
-    def resolve_user_by_id(self, root, info, id, token):
+    def resolve_user_by_id(self, info, id, token):
         return get_user_model().objects.get(pk=id)
     
-    def resolve_current_user(self, root, info, token):
+    def resolve_current_user(self, info, token):
         user = info.context.user
         if not user.is_authenticated:
             return None  # Explicitly handle unauthenticated users
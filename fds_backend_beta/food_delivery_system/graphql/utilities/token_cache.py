@@ -0,0 +1,157 @@
+"""
+In-process cache of verified GraphQL tokens.
+
+`UserAuthentication` decodes the JWT and loads its user on every resolver call taking a `token`.
+Verified tokens are remembered here, keyed by their signature, with the row of their user: a
+client repeating calls with the same token neither decodes it again nor reads the users table.
+
+An entry lives until the `exp` claim of its token, at most `GRAPHQL_TOKEN_CACHE_TTL` seconds,
+and the least recently used entries are evicted beyond `GRAPHQL_TOKEN_CACHE_SIZE`.
+
+The cache is per worker, revocations go through the shared cache (`CACHES`, which must be
+shared by all the workers, see settings.py). Every user has a random revocation stamp there,
+under their id and their username, created when missing and replaced once a save or delete of
+the user (deactivation, password change...), or a change of their permissions or groups,
+commits. An entry keeps the stamp of its username read before its user was loaded, and is only
+served while the stamp under the user's id is the same: one shared-cache read per hit, no query.
+A save made by any worker is seen by all of them on the next call, even one committed while the
+user was being loaded. A stamp evicted or expired from the shared cache is a miss, never a
+match: replacements are random, so entries cached before an eviction are never served again.
+Queryset updates, which send no signal, are still only seen when entries expire.
+"""
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from food_delivery_system.permissions.bitsets import permission_version_changed
+
+User = get_user_model()
+
+
+def stamp_key(kind, value):
+    return f"token-users:stamp:{kind}:{value}"
+
+
+class TokenUserCache:
+    """
+    LRU mapping of token signatures to the user of the token, each entry expiring on its own.
+    """
+
+    def __init__(self, max_size, max_ttl):
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        # signature -> (signing input, expires at, user id, field names, values, revocation stamp)
+        self._entries = OrderedDict()
+        self._by_user = {}  # user id -> signatures of the user's cached tokens
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, token):
+        """
+        The user of a token verified before, a new instance on every call, or None.
+        """
+        signing_input, _, signature = token.rpartition(".")
+        with self._lock:
+            entry = self._entries.get(signature)
+            if entry is None:
+                return None
+            # The signature only vouches for the header and payload it was computed over
+            if entry[0] != signing_input or entry[1] <= time.time():
+                self._discard(signature)
+                return None
+            self._entries.move_to_end(signature)
+        current = cache.get(stamp_key("id", entry[2]))
+        if current is None or current != entry[5]:
+            # Revoked since, possibly by another worker, or the stamp was evicted
+            with self._lock:
+                if self._entries.get(signature) is entry:
+                    self._discard(signature)
+            return None
+        return User.from_db(None, entry[3], entry[4])
+
+    def stamp_of(self, username):
+        """
+        The revocation stamp of a username, to be read before loading the user of a token. A
+        missing stamp is created, ``None`` if it could not be stored.
+        """
+        key = stamp_key("username", username)
+        # `add`, not `set`: a stamp written meanwhile by a revocation must not be overwritten
+        cache.add(key, secrets.token_hex(8), self.max_ttl)
+        return cache.get(key)
+
+    def set(self, token, payload, user, stamp):
+        """
+        Remember the user of a token verified with ``payload``, ``stamp`` being the revocation
+        stamp of their username read before the user was loaded. Nothing is remembered without
+        a stamp.
+        """
+        if stamp is None:
+            return
+        # The stamp of their id, when missing. A different one there means a revocation since
+        # the stamp was read, and the entry is never served.
+        cache.add(stamp_key("id", user.pk), stamp, self.max_ttl)
+        signing_input, _, signature = token.rpartition(".")
+        expires_at = time.time() + self.max_ttl
+        if payload.get("exp") is not None:
+            expires_at = min(expires_at, payload["exp"])
+        names = [field.attname for field in User._meta.concrete_fields]
+        values = tuple(getattr(user, name) for name in names)
+        with self._lock:
+            self._discard(signature)
+            self._entries[signature] = (signing_input, expires_at, user.pk, names, values, stamp)
+            self._by_user.setdefault(user.pk, set()).add(signature)
+            while len(self._entries) > self.max_size:
+                self._discard(next(iter(self._entries)))
+
+    def revoke(self, user_id, username):
+        """
+        Drop the entries of a user, in every worker: a new stamp outliving the entries cached
+        before it.
+        """
+        stamp = secrets.token_hex(8)
+        cache.set_many({stamp_key("id", user_id): stamp, stamp_key("username", username): stamp}, self.max_ttl)
+        self.invalidate_user(user_id)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for signature in list(self._by_user.get(user_id, ())):
+                self._discard(signature)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def _discard(self, signature):
+        entry = self._entries.pop(signature, None)
+        if entry is not None:
+            signatures = self._by_user.get(entry[2])
+            signatures.discard(signature)
+            if not signatures:
+                del self._by_user[entry[2]]
+
+
+token_users = TokenUserCache(settings.GRAPHQL_TOKEN_CACHE_SIZE, settings.GRAPHQL_TOKEN_CACHE_TTL)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_cached_tokens_of_user(sender, instance, **kwargs):
+    user_id, username = instance.pk, instance.username
+    transaction.on_commit(lambda: token_users.revoke(user_id, username))
+
+
+@receiver(permission_version_changed)
+def drop_cached_tokens_of_users(sender, user_ids, **kwargs):
+    for user_id, username in User.objects.filter(pk__in=user_ids).values_list("pk", "username"):
+        token_users.revoke(user_id, username)
@@ -1,7 +1,8 @@
 import jwt
 import graphene
 from graphql import GraphQLError
-from graphql_jwt.utils import get_payload, get_user_by_payload, jwt_decode
+from graphql_jwt.backends import JSONWebTokenBackend
+from graphql_jwt.utils import get_credentials, get_payload, get_user_by_payload, jwt_decode
 from jwt.exceptions import (
     DecodeError,
     ExpiredSignatureError,
@@ -11,6 +12,8 @@ from jwt.exceptions import (
 from django.contrib.auth import get_user_model
 
 from food_delivery_system import settings
+from food_delivery_system.graphql.utilities.token_cache import token_users
+from food_delivery_system.utils.auth_context import get_auth_context, load_user
 
 
 User = get_user_model()
@@ -20,7 +23,15 @@ class UserAuthentication():
     """
     Enforce JWT token based authentication on graphql requests.
     """
-    def get_user_authentication(self, token):
+    def get_user_authentication(self, token, request=None):
+        # Within a request, each token is resolved once for the middleware and all resolvers
+        if request is not None:
+            return get_auth_context(request).resolve(token, self.get_user_authentication)
+
+        # Tokens verified before are answered from the cache, without decoding or a query
+        cached_user = token_users.get(token) if token else None
+        if cached_user is not None:
+            return cached_user
         try:
             # manually decode the JWT token
             payload = jwt.decode(
@@ -32,15 +43,21 @@ class UserAuthentication():
             if not username:
                 raise GraphQLError("Token does not contain a valid username.")
             
-            # Get the user from the token
-            user_from_token = User.objects.get(username=username)
+            # Read before loading the user, a revocation committed meanwhile is not missed
+            stamp = token_users.stamp_of(username)
+            # Get the user from the token, with their staff role
+            user_from_token = load_user(username=username)
 
             if not user_from_token or not user_from_token.is_authenticated:
                 raise GraphQLError("Authentication credentials were not provided. If they are, then they must be wrong!")
 
             if user_from_token.is_anonymous:
                 raise GraphQLError("Authentication required to view users.")
-            
+
+            if not user_from_token.is_active:
+                raise GraphQLError("User is disabled.")
+
+            token_users.set(token, payload, user_from_token, stamp)
             return user_from_token
         except jwt.exceptions.DecodeError:
             raise GraphQLError("Invalid token: Signature decode error.")
@@ -51,4 +68,20 @@ class UserAuthentication():
         except User.DoesNotExist:
             raise GraphQLError("User in token does not exist.")
         except Exception as e:
-            raise GraphQLError(f"error: {str(e)}")
\ No newline at end of file
+            raise GraphQLError(f"error: {str(e)}")
+
+
+class JSONWebTokenContextBackend(JSONWebTokenBackend):
+    """
+    graphql_jwt's authentication backend, resolving the token through the request's
+    authentication context: the JWT middleware runs for every root field, the token is still
+    decoded and its user loaded once per request.
+    """
+    def authenticate(self, request=None, **kwargs):
+        if request is None or getattr(request, "_jwt_token_auth", False):
+            return None
+
+        token = get_credentials(request, **kwargs)
+        if token is None:
+            return None
+        return UserAuthentication().get_user_authentication(token, request)
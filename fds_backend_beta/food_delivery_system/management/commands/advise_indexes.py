@@ -0,0 +1,122 @@
+import re
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver
+from rest_framework.test import APIRequestFactory, force_authenticate
+from silk.models import SQLQuery
+
+from food_delivery_system.orders.models import Staff
+from food_delivery_system.utils.index_advisor import advise, tracked_tables, write_migrations
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+class Command(BaseCommand):
+    help = "Propose indexes for the order, menu, staff and user tables from EXPLAIN plans of captured queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", choices=["silk", "views"], default="silk",
+                            help="Explain the queries recorded by silk, or run the list endpoint of every viewset")
+        parser.add_argument("--samples", type=int, default=500, help="Number of slowest silk queries to sample")
+        parser.add_argument("--user", action="append", dest="users", default=[],
+                            help="Username to run the viewsets as (repeatable), defaults to one user per role")
+        parser.add_argument("--write", action="store_true", help="Write migrations for the indexes that lower the cost")
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        using = options["database"]
+        if connections[using].vendor != "postgresql":
+            raise CommandError("The index advisor relies on EXPLAIN (FORMAT JSON) and requires PostgreSQL.")
+
+        if options["source"] == "silk":
+            statements = self.silk_statements(options["samples"])
+        else:
+            statements = self.view_statements(options["users"], using)
+        if not statements:
+            raise CommandError("No captured queries touch the tracked tables.")
+
+        candidates, unexplained = advise(statements, using)
+        self.stdout.write(f"Explained {len(statements) - len(unexplained)} distinct queries, "
+                          f"skipped {len(unexplained)} that could not be explained.")
+
+        accepted = []
+        for candidate in sorted(candidates, key=lambda candidate: candidate.gain, reverse=True):
+            index = candidate.index
+            verdict = self.style.SUCCESS("propose") if candidate.gain > 0 else self.style.WARNING("no gain")
+            self.stdout.write(
+                f"[{verdict}] {candidate.model._meta.label}.{index.name} {candidate.fields}"
+                f"{f' WHERE {candidate.condition}' if candidate.condition else ''}: "
+                f"cost {candidate.before:.2f} -> {candidate.after:.2f} over {len(candidate.queries)} queries"
+            )
+            if candidate.gain > 0:
+                accepted.append(candidate)
+
+        if not accepted:
+            self.stdout.write(self.style.SUCCESS("No index would lower the estimated cost."))
+            return
+
+        if options["write"]:
+            for path in write_migrations(accepted, using):
+                self.stdout.write(self.style.SUCCESS(f"Wrote {path}"))
+        self.stdout.write("Declare the accepted indexes in the models so makemigrations keeps them:")
+        for candidate in accepted:
+            self.stdout.write(f"    {candidate.model.__name__}.Meta.indexes: {candidate.declaration()}")
+
+    def touches_tracked_tables(self, sql):
+        return sql.lstrip().upper().startswith("SELECT") and any(f'"{table}"' in sql for table in tracked_tables())
+
+    def group(self, queries):
+        """
+        Group statements by shape (literals stripped), keep one example per shape with its count.
+        """
+        examples, counts = {}, Counter()
+        for sql in queries:
+            if not self.touches_tracked_tables(sql):
+                continue
+            shape = _LITERALS.sub("?", sql)
+            examples.setdefault(shape, sql)
+            counts[shape] += 1
+        return {examples[shape]: count for shape, count in counts.most_common()}
+
+    def silk_statements(self, samples):
+        queries = SQLQuery.objects.order_by("-time_taken").values_list("query", flat=True)[:samples]
+        return self.group(queries)
+
+    def view_statements(self, usernames, using):
+        """
+        Run the list action of every viewset routed in the URLconf as each user, and capture the
+        SQL it executes (pagination count, page and prefetch queries).
+        """
+        User = get_user_model()
+        if usernames:
+            users = list(User.objects.filter(username__in=usernames))
+        else:
+            users = [user for user in [
+                User.objects.filter(is_superuser=True).first(),
+                User.objects.filter(staff__isnull=True, is_superuser=False).first(),
+            ] + [User.objects.filter(staff__role=role).first() for role, _ in Staff.ROLE_CHOICES] if user]
+
+        factory = APIRequestFactory()
+        captured = []
+        for path, view in self.list_views(get_resolver().url_patterns):
+            for user in users:
+                request = factory.get(path)
+                force_authenticate(request, user=user)
+                with CaptureQueriesContext(connections[using]) as context:
+                    view(request)
+                captured.extend(query["sql"] for query in context.captured_queries)
+        return self.group(captured)
+
+    def list_views(self, patterns, prefix=""):
+        for pattern in patterns:
+            route = str(pattern.pattern).lstrip("^").rstrip("$")
+            if isinstance(pattern, URLResolver):
+                yield from self.list_views(pattern.url_patterns, prefix + route)
+            elif isinstance(pattern, URLPattern):
+                actions = getattr(pattern.callback, "actions", None) or {}
+                if actions.get("get") == "list" and "<" not in route and "(" not in route:
+                    yield "/" + prefix + route, pattern.callback
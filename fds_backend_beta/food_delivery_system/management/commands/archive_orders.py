@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from food_delivery_system.orders.archive import archive_batch
+
+
+class Command(BaseCommand):
+    help = "Move completed and canceled orders past the retention period to the archive tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--retention-days", type=int, default=None,
+                            help="Archive orders finished more than this many days ago "
+                                 "(defaults to ORDER_ARCHIVE_RETENTION)")
+        parser.add_argument("--batch-size", type=int, default=500, help="Number of orders moved per transaction")
+
+    def handle(self, *args, **options):
+        retention = settings.ORDER_ARCHIVE_RETENTION
+        if options["retention_days"] is not None:
+            retention = timedelta(days=options["retention_days"])
+        cutoff = timezone.now() - retention
+
+        archived = 0
+        while moved := archive_batch(cutoff, options["batch_size"]):
+            archived += moved
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} orders finished before {cutoff:%Y-%m-%d %H:%M}."))
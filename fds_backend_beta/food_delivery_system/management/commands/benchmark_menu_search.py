@@ -0,0 +1,91 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+
+from food_delivery_system.orders.models import MenuItem
+from food_delivery_system.restaurant.search import refresh_search_vectors, search_menu_items
+
+DISHES = [
+    "margherita pizza", "pepperoni pizza", "pad thai", "green curry", "chicken tikka masala", "butter chicken",
+    "lamb biryani", "beef burger", "veggie burger", "caesar salad", "greek salad", "ramen", "pho", "sushi platter",
+    "fish and chips", "falafel wrap", "chicken shawarma", "carbonara", "lasagna", "tiramisu", "cheesecake",
+    "burrito", "tacos al pastor", "quesadilla", "dim sum", "kung pao chicken", "mapo tofu", "bibimbap",
+]
+CATEGORIES = ["Starters", "Mains", "Desserts", "Drinks", "Specials", "Sides", "Salads", "Noodles"]
+BENCH_PREFIX = "Bench kitchen "
+QUERIES = ["pizza", "chicken curry", "tikka masala", "margarita piza", "burger -veggie", "noodles"]
+
+
+class Command(BaseCommand):
+    help = "Time the menu search against ILIKE scans over synthetic menus (PostgreSQL, rolled back)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=2_000_000, help="Number of synthetic menu items")
+        parser.add_argument("--restaurants", type=int, default=20_000, help="Number of synthetic restaurants")
+        parser.add_argument("--query", action="append", dest="queries", default=[],
+                            help="Search text to time (repeatable), defaults to a fixed set of queries")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per query, the best time is reported")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("The menu search benchmark requires PostgreSQL (tsvector and trigram indexes).")
+
+        with transaction.atomic():
+            self.seed(options["restaurants"], options["items"])
+            for text in options["queries"] or QUERIES:
+                search = search_menu_items(text)[:20]
+                # What the admin's search_fields do: substring scans over every searched column
+                baseline = MenuItem.objects.filter(available=True, category__isnull=False).filter(
+                    Q(name__icontains=text) | Q(description__icontains=text)
+                    | Q(category__name__icontains=text) | Q(category__restaurant__name__icontains=text)
+                ).order_by("id")[:20]
+                search_ms, hits = self.best_of(search, options["repeat"])
+                baseline_ms, _ = self.best_of(baseline, options["repeat"])
+                self.stdout.write(f"{text!r:>24}: search {search_ms:8.1f} ms ({hits} hits)   "
+                                  f"ILIKE {baseline_ms:8.1f} ms")
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("Benchmark data rolled back."))
+
+    def seed(self, restaurants, items):
+        started = time.monotonic()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO "restaurant_restaurant" ("name", "created_at", "updated_at", "menu_version") '
+                "SELECT %s || n, now(), now(), 1 FROM generate_series(1, %s) AS n",
+                [BENCH_PREFIX, restaurants],
+            )
+            cursor.execute(
+                'INSERT INTO "orders_category" ("restaurant_id", "name", "updated_at") '
+                'SELECT r."id", c.name, now() FROM "restaurant_restaurant" r CROSS JOIN unnest(%s::text[]) AS c(name) '
+                'WHERE r."name" LIKE %s',
+                [CATEGORIES, f"{BENCH_PREFIX}%"],
+            )
+            cursor.execute(
+                'CREATE TEMPORARY TABLE bench_category ON COMMIT DROP AS '
+                'SELECT row_number() OVER (ORDER BY c."id") AS n, c."id" FROM "orders_category" c '
+                'JOIN "restaurant_restaurant" r ON r."id" = c."restaurant_id" WHERE r."name" LIKE %s',
+                [f"{BENCH_PREFIX}%"],
+            )
+            cursor.execute(
+                'INSERT INTO "orders_menuitem" ("category_id", "name", "description", "price", "available", "created_at", "updated_at") '
+                "SELECT c.id, (%s::text[])[1 + n %% %s], 'House ' || (%s::text[])[1 + (n * 7) %% %s] || ' recipe', "
+                '       5 + n %% 30, n %% 10 <> 0, now(), now() '
+                'FROM generate_series(1, %s) AS n '
+                'JOIN bench_category c ON c.n = 1 + n %% (SELECT count(*) FROM bench_category)',
+                [DISHES, len(DISHES), DISHES, len(DISHES), items],
+            )
+        refresh_search_vectors(MenuItem.objects.filter(category__isnull=False, search_vector__isnull=True))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE "orders_menuitem", "orders_category", "restaurant_restaurant"')
+        self.stdout.write(f"Seeded {items} menu items in {time.monotonic() - started:.0f} s.")
+
+    def best_of(self, queryset, repeat):
+        best, hits = None, 0
+        for _ in range(repeat):
+            started = time.perf_counter()
+            hits = len(list(queryset.all()))
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best, hits
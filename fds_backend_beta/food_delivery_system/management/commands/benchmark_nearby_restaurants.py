@@ -0,0 +1,63 @@
+import math
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from food_delivery_system.restaurant.models import Restaurant
+from food_delivery_system.restaurant.nearby import nearest_restaurants
+from food_delivery_system.utils.geo import KM_PER_DEGREE, cell_of
+
+BENCH_PREFIX = "Bench kitchen "
+
+
+class Command(BaseCommand):
+    help = "Time nearest restaurant searches over synthetic restaurants around a city (rolled back)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--restaurants", type=int, default=100_000, help="Number of synthetic restaurants")
+        parser.add_argument("--queries", type=int, default=1000, help="Number of searches to time")
+        parser.add_argument("--k", type=int, default=10, help="Restaurants per search")
+        parser.add_argument("--center", type=float, nargs=2, default=(48.8566, 2.3522), metavar=("LAT", "LNG"),
+                            help="Center of the synthetic city")
+        parser.add_argument("--spread-km", type=float, default=30, help="Standard deviation of the locations")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        latitude, longitude = options["center"]
+
+        def point():
+            # Denser downtown, sparser in the suburbs
+            spread = options["spread_km"] / KM_PER_DEGREE
+            return (latitude + rng.gauss(0, spread),
+                    longitude + rng.gauss(0, spread / math.cos(math.radians(latitude))))
+
+        with transaction.atomic():
+            started = time.monotonic()
+            batch = []
+            for n in range(options["restaurants"]):
+                lat, lng = point()
+                batch.append(Restaurant(name=f"{BENCH_PREFIX}{n}", latitude=lat, longitude=lng, geo_cell=cell_of(lat, lng)))
+                if len(batch) == 5000:
+                    Restaurant.objects.bulk_create(batch)
+                    batch = []
+            Restaurant.objects.bulk_create(batch)
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE "restaurant_restaurant"')
+            self.stdout.write(f"Seeded {options['restaurants']} restaurants in {time.monotonic() - started:.0f} s.")
+
+            timings, found = [], 0
+            for _ in range(options["queries"]):
+                lat, lng = point()
+                started = time.perf_counter()
+                found += len(nearest_restaurants(lat, lng, k=options["k"]))
+                timings.append((time.perf_counter() - started) * 1000)
+            p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+            self.stdout.write(f"{options['queries']} searches, {found / options['queries']:.1f} restaurants each: "
+                              f"p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms")
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("Benchmark data rolled back."))
@@ -0,0 +1,75 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+
+from food_delivery_system.middleware import brotli
+from food_delivery_system.orders.models import Category, MenuItem, Order, OrderItem
+from food_delivery_system.restaurant.models import Restaurant
+from food_delivery_system.serializers.serializer import OrderSerializer
+from food_delivery_system.users.models import CustomUser
+from food_delivery_system.utils.prefetch import apply_prefetch_plan
+from food_delivery_system.utils.renderers import ORJSONRenderer
+
+BENCH_PREFIX = "bench-renderers-"
+
+
+class Command(BaseCommand):
+    help = "Compare render time and size of OrderSerializer pages across JSON renderers and encodings (rolled back)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=700, help="Orders per page")
+        parser.add_argument("--items", type=int, default=5, help="Items per order")
+        parser.add_argument("--repeat", type=int, default=10, help="Runs per measure, the best time is reported")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options["orders"], options["items"])
+            orders = Order.objects.filter(customer__username__startswith=BENCH_PREFIX).order_by("id")
+            started = time.perf_counter()
+            data = OrderSerializer(apply_prefetch_plan(orders, OrderSerializer()), many=True).data
+            self.stdout.write(f"Serialized {len(data)} orders in {(time.perf_counter() - started) * 1000:.0f} ms.")
+            transaction.set_rollback(True)
+
+        rendered = {}
+        for name, renderer in (("DRF JSONRenderer", JSONRenderer()), ("ORJSONRenderer", ORJSONRenderer())):
+            elapsed, rendered[name] = self.best_of(lambda: renderer.render(data), options["repeat"])
+            self.stdout.write(f"{name:>20}: {elapsed:8.1f} ms {len(rendered[name]):>10} bytes")
+
+        body = rendered["ORJSONRenderer"]
+        encoders = {"gzip": lambda: compress_string(body, max_random_bytes=100)}
+        if brotli is not None:
+            encoders["br"] = lambda: brotli.compress(body, quality=5)
+        for name, encode in encoders.items():
+            elapsed, compressed = self.best_of(encode, options["repeat"])
+            self.stdout.write(f"{name:>20}: {elapsed:8.1f} ms {len(compressed):>10} bytes "
+                              f"({len(compressed) / len(body):.0%} of the body)")
+        self.stdout.write(self.style.SUCCESS("Benchmark data rolled back."))
+
+    def seed(self, orders, items):
+        customer = CustomUser.objects.create(username=f"{BENCH_PREFIX}customer")
+        restaurant = Restaurant.objects.create(name="Bench kitchen")
+        category = Category.objects.create(restaurant=restaurant, name="Mains")
+        menu_items = MenuItem.objects.bulk_create([
+            MenuItem(category=category, name=f"Dish {n}", description="House recipe", price=Decimal("9.50"))
+            for n in range(items)
+        ])
+        created = Order.objects.bulk_create([
+            Order(customer=customer, restaurant=restaurant, total_price=Decimal("9.50") * items) for _ in range(orders)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, menu_item=menu_item, quantity=1, price=menu_item.price)
+            for order in created for menu_item in menu_items
+        ])
+
+    def best_of(self, function, repeat):
+        best, result = None, None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = function()
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
@@ -0,0 +1,85 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from food_delivery_system.orders.models import Category, MenuItem, Order, OrderItem, Staff
+from food_delivery_system.restaurant.models import Restaurant
+from food_delivery_system.users.models import CustomUser
+
+BENCH_PREFIX = "bench-serializers-"
+# (endpoint, variants of its query string), "{restaurant}" is replaced by a restaurant id
+ENDPOINTS = [
+    ("/api/restaurant/", ["", "?expand=owner", "?fields=id,name", "?fields=id,name,owner.username"]),
+    ("/api/restaurant/{restaurant}/", ["", "?fields=id,name,owner", "?fields=id,owner.username"]),
+    ("/api/orders/categories/", ["", "?expand=restaurant", "?expand=*", "?fields=id,name"]),
+    ("/api/orders/", ["", "?expand=customer", "?fields=id,status,total_price", "?expand=*"]),
+    ("/api/users/", ["", "?fields=id,username", "?fields=id,username,role"]),
+]
+
+
+class Command(BaseCommand):
+    help = "Report payload sizes and query counts of the API endpoints per field selection (rolled back)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--restaurants", type=int, default=20, help="Number of synthetic restaurants")
+        parser.add_argument("--page-size", type=int, default=20, help="Page size of the list endpoints")
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=["testserver"]):
+            restaurant = self.seed(options["restaurants"])
+            admin = CustomUser.objects.create(username=f"{BENCH_PREFIX}admin", is_staff=True, is_superuser=True)
+
+            self.stdout.write(f"{'endpoint':<55} {'bytes':>9} {'queries':>8}")
+            for endpoint, variants in ENDPOINTS:
+                for variant in variants:
+                    url = endpoint.format(restaurant=restaurant.id) + variant
+                    separator = "&" if "?" in url else "?"
+                    size, queries = self.measure(admin, f"{url}{separator}page_size={options['page_size']}")
+                    self.stdout.write(f"{url:<55} {size:>9} {queries:>8}")
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("Benchmark data rolled back."))
+
+    def seed(self, restaurants):
+        owners = CustomUser.objects.bulk_create([
+            CustomUser(username=f"{BENCH_PREFIX}owner-{n}", email=f"owner-{n}@example.com", is_restaurant=True)
+            for n in range(restaurants)
+        ])
+        created = Restaurant.objects.bulk_create([
+            Restaurant(owner=owner, name=f"Bench kitchen {n}", address=f"{n} Bench street")
+            for n, owner in enumerate(owners)
+        ])
+        Staff.objects.bulk_create([
+            Staff(user=owner, restaurant=restaurant, role="manager") for owner, restaurant in zip(owners, created)
+        ])
+        categories = Category.objects.bulk_create([
+            Category(restaurant=restaurant, name=name) for restaurant in created for name in ("Mains", "Desserts")
+        ])
+        menu_items = MenuItem.objects.bulk_create([
+            MenuItem(category=category, name=f"{category.name} {n}", price=Decimal("9.50"))
+            for category in categories for n in range(3)
+        ])
+        orders = Order.objects.bulk_create([
+            Order(customer=owners[(n + 1) % len(owners)], restaurant=restaurant, total_price=Decimal("19.00"))
+            for n, restaurant in enumerate(created)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, menu_item=menu_items[n * 6], quantity=2, price=Decimal("19.00"))
+            for n, order in enumerate(orders)
+        ])
+        return created[0]
+
+    def measure(self, user, url):
+        client = APIClient()
+        # A fresh user per request, as the authentication would load it
+        client.force_authenticate(user=CustomUser.objects.get(pk=user.pk))
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        # Without silk's own profiling writes
+        app_queries = [query for query in queries.captured_queries
+                       if not any(marker in query["sql"] for marker in ("silk_", "SAVEPOINT", "EXPLAIN"))]
+        if response.status_code != 200:
+            return f"HTTP {response.status_code}", len(app_queries)
+        return len(response.content), len(app_queries)
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from food_delivery_system.orders.history import (HISTORY_FIELDS, build_order_history, load_orders_for_history,
+                                                 store_order_history)
+from food_delivery_system.orders.models import CustomerOrderHistory, Order
+
+
+class Command(BaseCommand):
+    help = "Check the customer order-history read model against the order tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of orders compared per batch")
+        parser.add_argument("--fix", action="store_true", help="Rewrite missing and stale history rows")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        missing, stale = [], []
+
+        last_id = 0
+        while True:
+            order_ids = list(
+                Order.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:batch_size]
+            )
+            if not order_ids:
+                break
+            last_id = order_ids[-1]
+
+            stored = {row.order_id: row for row in CustomerOrderHistory.objects.filter(order_id__in=order_ids)}
+            repairs = []
+            for order in load_orders_for_history(order_ids):
+                expected = build_order_history(order, order.order_items.all())
+                row = stored.get(order.id)
+                if row is None:
+                    missing.append(order.id)
+                elif self.differs(row, expected):
+                    stale.append(order.id)
+                else:
+                    continue
+                repairs.append(expected)
+
+            if options["fix"] and repairs:
+                with transaction.atomic():
+                    store_order_history(repairs)
+
+        for order_id in missing:
+            self.stdout.write(self.style.WARNING(f"Order {order_id}: history row is missing."))
+        for order_id in stale:
+            self.stdout.write(self.style.WARNING(f"Order {order_id}: history row is stale."))
+
+        if not missing and not stale:
+            self.stdout.write(self.style.SUCCESS("Order history is consistent."))
+        elif options["fix"]:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {len(missing)} missing and {len(stale)} stale rows."))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f"Found {len(missing)} missing and {len(stale)} stale rows, run with --fix to repair them."
+            ))
+
+    @staticmethod
+    def differs(row, expected):
+        for field in HISTORY_FIELDS:
+            attname = CustomerOrderHistory._meta.get_field(field).attname
+            if getattr(row, attname) != getattr(expected, attname):
+                return True
+        return False
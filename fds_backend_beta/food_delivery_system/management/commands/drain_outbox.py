@@ -0,0 +1,38 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from food_delivery_system.orders.outbox import drain_outbox, purge_processed_events
+
+
+class Command(BaseCommand):
+    help = "Deliver pending order outbox events to their handlers"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100, help="Number of events claimed per transaction")
+        parser.add_argument("--interval", type=float, default=1.0, help="Seconds to sleep when the outbox is empty")
+        parser.add_argument("--once", action="store_true", help="Drain the pending events and exit")
+        parser.add_argument("--retain-days", type=int, default=7,
+                            help="Delete delivered events older than this many days (0 keeps them)")
+
+    def handle(self, *args, **options):
+        delivered = 0
+        last_purge = None
+        while True:
+            close_old_connections()
+            if options["retain_days"] and (last_purge is None or time.monotonic() - last_purge > 3600):
+                purge_processed_events(timezone.now() - timedelta(days=options["retain_days"]))
+                last_purge = time.monotonic()
+
+            claimed = drain_outbox(options["batch_size"])
+            delivered += claimed
+            if claimed:
+                continue
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {delivered} outbox events."))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from food_delivery_system.restaurant.menu_import import FORMATS, import_menu
+
+
+class Command(BaseCommand):
+    help = "Bulk import menus from a CSV or NDJSON file (restaurant, category, name, description, price, available)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Menu file")
+        parser.add_argument("--format", choices=FORMATS, help="File format, defaults to the file extension")
+        parser.add_argument("--strict", action="store_true", help="Import nothing if any row is invalid")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv")
+        try:
+            with open(path, "rb") as stream:
+                summary = import_menu(stream, fmt, strict=options["strict"])
+        except OSError as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+
+        for error in summary["errors"]:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        if summary["error_count"] > len(summary["errors"]):
+            self.stderr.write(f"... {summary['error_count'] - len(summary['errors'])} more invalid rows")
+        if options["strict"] and summary["error_count"]:
+            raise CommandError(f"{summary['error_count']} invalid rows, nothing was imported.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {summary['rows']} rows: {summary['categories_created']} categories created, "
+            f"{summary['items_created']} menu items created, {summary['items_updated']} updated, "
+            f"{summary['error_count']} invalid rows skipped."
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from food_delivery_system.orders.archive import ensure_partitions, month_start, next_month
+
+
+class Command(BaseCommand):
+    help = "Create the monthly partitions of the order archive tables ahead of time"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months-ahead", type=int, default=3,
+                            help="Number of months after the current one to create partitions for")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            self.stdout.write(f"The archive tables are not partitioned on {connection.vendor}, nothing to do.")
+            return
+
+        months = [month_start(timezone.now())]
+        for _ in range(options["months_ahead"]):
+            months.append(next_month(months[-1]))
+        created = ensure_partitions(months)
+        for name in created:
+            self.stdout.write(f"Created partition {name}")
+        self.stdout.write(self.style.SUCCESS(f"Created {len(created)} partitions."))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from food_delivery_system.users.onboarding import FORMATS, format_of, onboard_users, read_rows
+
+
+class Command(BaseCommand):
+    help = "Bulk onboard users from a CSV, NDJSON or JSON file (username, email, password, phone_number, address, role, restaurant)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Onboarding file")
+        parser.add_argument("--format", choices=FORMATS, help="File format, defaults to the file extension")
+        parser.add_argument("--strict", action="store_true", help="Create nobody if any row is invalid")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or format_of(path)
+        try:
+            with open(path, "rb") as stream:
+                summary = onboard_users(read_rows(stream, fmt), strict=options["strict"])
+        except OSError as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+        except (ValueError, IntegrityError) as exc:
+            raise CommandError(str(exc))
+
+        for error in summary["errors"]:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        if summary["error_count"] > len(summary["errors"]):
+            self.stderr.write(f"... {summary['error_count'] - len(summary['errors'])} more invalid rows")
+        if options["strict"] and summary["error_count"]:
+            raise CommandError(f"{summary['error_count']} invalid rows, nobody was onboarded.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {summary['rows']} rows: {summary['created']} users created, "
+            f"{summary['error_count']} invalid rows skipped."
+        ))
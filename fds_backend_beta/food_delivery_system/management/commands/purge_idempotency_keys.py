@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from food_delivery_system.orders.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = "Delete idempotency keys whose stored response has expired"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of keys deleted per statement")
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_keys(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Purged {deleted} expired idempotency keys."))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from food_delivery_system.orders.history import refresh_order_history
+from food_delivery_system.orders.models import CustomerOrderHistory, Order
+
+
+class Command(BaseCommand):
+    help = "Rebuild the customer order-history read model from the order tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of orders rendered per batch")
+        parser.add_argument("--customer", type=int, help="Only rebuild the history of this customer id")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        orders = Order.objects.order_by("id")
+        if options["customer"]:
+            orders = orders.filter(customer_id=options["customer"])
+
+        rebuilt = 0
+        last_id = 0
+        while True:
+            # Walk the orders by primary key so every batch is an index-range read
+            order_ids = list(orders.filter(id__gt=last_id).values_list("id", flat=True)[:batch_size])
+            if not order_ids:
+                break
+            with transaction.atomic():
+                rebuilt += len(refresh_order_history(order_ids))
+            last_id = order_ids[-1]
+            self.stdout.write(f"Rebuilt history up to order {last_id} ({rebuilt} rows).")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Order history rebuilt: {rebuilt} rows, {CustomerOrderHistory.objects.count()} rows in total."
+        ))
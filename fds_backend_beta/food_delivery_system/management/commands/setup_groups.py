@@ -18,8 +18,8 @@ class Command(BaseCommand):
                             "can_update_order_status", "can_manage_staff"
                         ],
             "Chefs": [
-                        "can_manage_menuitems", "can_mark_unavailable",
-                        "can_update_order_status"
+                        "can_manage_menuitems", "can_mark_available",
+                        "can_mark_unavailable", "can_update_order_status"
                     ],
             "Delivery Personnel": [
                                     "can_mark_delivered"
@@ -2,10 +2,18 @@ import logging
 import time
 import json
 import uuid
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
 from graphql.execution.execute import ExecutionResult
 
 from food_delivery_system.utils.utilities import generate_request_id
 
+try:
+    import brotli
+except ImportError:     # Optional, responses are only gzipped without it
+    brotli = None
+
 
 logger = logging.getLogger("data.log")
 
@@ -30,8 +38,8 @@ class LogRequestMiddleware:
             logger.info(f"[{request_id}] - Incoming request to {request.path}:\n{request.method} call\n{json.dumps(request_data, indent=2)}")
 
         response = self.get_response(request)
-        # Only log non-GraphQL responses
-        if request.path != "/graphql/":
+        # Only log non-GraphQL responses, streamed bodies (e.g. the kitchen feed) never end
+        if request.path != "/graphql/" and not response.streaming:
             try:
                 # response_data = response.content.decode("utf-8")
                 response_body = response.content.decode("utf-8")
@@ -104,6 +112,66 @@ class QueryProfilerMiddleware:
         logger.info(f"[{request_id}] - Total Duration: {duration:.4f} sec")
 
 
+class CompressionMiddleware:
+    """
+    Compress responses with the best encoding the client accepts (Accept-Encoding, with
+    q-values): brotli when installed, else gzip. Responses smaller than COMPRESSION_MIN_SIZE,
+    already encoded, streamed (the server-sent event feeds must not be buffered) or of a
+    non-text content type are sent as they are.
+    """
+    COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml")
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.encoders = {"gzip": lambda content: compress_string(content, max_random_bytes=100)}
+        if brotli is not None:
+            self.encoders["br"] = lambda content: brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)
 
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (response.streaming or response.has_header("Content-Encoding")
+                or not response.get("Content-Type", "").startswith(self.COMPRESSIBLE_TYPES)):
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        encoding = self.negotiate(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return response
+        compressed = self.encoders[encoding](response.content)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response.headers["Content-Length"] = str(len(compressed))
+        response.headers["Content-Encoding"] = encoding
+        # The representation changed, a strong ETag becomes weak (RFC 9110 8.8.1)
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        return response
 
+    def negotiate(self, accept_encoding):
+        """
+        The accepted encoding with the highest q-value, brotli first on ties, or None.
+        """
+        weights = {}
+        for part in accept_encoding.split(","):
+            coding, _, params = part.strip().partition(";")
+            quality = 1.0
+            for param in params.split(";"):
+                name, _, value = param.strip().partition("=")
+                if name == "q":
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+            weights[coding.strip().lower()] = quality
+        best, best_quality = None, 0.0
+        for coding in ("br", "gzip"):     # Server preference on ties
+            quality = weights.get(coding, weights.get("*", 0.0))
+            if coding in self.encoders and quality > best_quality:
+                best, best_quality = coding, quality
+        return best
 
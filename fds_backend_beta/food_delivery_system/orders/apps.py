@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class OrdersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'food_delivery_system.orders'
+
+    def ready(self):
+        # Keep the read models in sync with order writes
+        from food_delivery_system.orders import signals  # noqa: F401
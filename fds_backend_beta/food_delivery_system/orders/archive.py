@@ -0,0 +1,121 @@
+"""
+Archival of finished orders.
+
+The hot `Order` and `OrderItem` tables only keep live and recently finished orders: completed
+and canceled orders untouched for `ORDER_ARCHIVE_RETENTION` are moved, in batches, to
+`ArchivedOrder` and `ArchivedOrderItem`. On PostgreSQL the archive tables are range partitioned
+by month of `created_at`; the monthly partitions are created ahead of time by
+`manage_order_partitions` and on demand before a batch is archived. A default partition catches
+anything else.
+
+`Order` itself cannot be partitioned: its primary key is the target of the foreign keys from
+`OrderItem` and the other order tables, and a partitioned table's unique keys must include the
+partition key.
+
+The customer's order history row is kept, so archived orders stay in the customer's list.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection, transaction
+
+from food_delivery_system.orders.history import skip_order_history_signals
+from food_delivery_system.orders.models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+ARCHIVED_STATUSES = ("completed", "canceled")
+PARTITIONED_TABLES = {
+    ArchivedOrder._meta.db_table: "created_at",
+    ArchivedOrderItem._meta.db_table: "order_created_at",
+}
+
+
+def month_start(moment):
+    moment = moment.astimezone(dt_timezone.utc)
+    return datetime(moment.year, moment.month, 1, tzinfo=dt_timezone.utc)
+
+
+def next_month(month):
+    return month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(month=month.month + 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y%m}"
+
+
+def existing_partitions():
+    if connection.vendor != "postgresql":
+        return set()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = ANY(%s)",
+            [list(PARTITIONED_TABLES)],
+        )
+        return {name for name, in cursor.fetchall()}
+
+
+def ensure_partitions(months):
+    """
+    Create the monthly partitions of the archive tables that do not exist yet, returns their
+    names. A no-op on databases without declarative partitioning.
+    """
+    if connection.vendor != "postgresql":
+        return []
+    existing = existing_partitions()
+    created = []
+    with connection.cursor() as cursor:
+        for month in sorted(set(months)):
+            for table in PARTITIONED_TABLES:
+                name = partition_name(table, month)
+                if name in existing:
+                    continue
+                # Bounds are generated here, DDL does not take bind parameters.
+                cursor.execute(
+                    f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" '
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+                )
+                created.append(name)
+    return created
+
+
+def archivable_orders(cutoff):
+    return Order.objects.filter(status__in=ARCHIVED_STATUSES, updated_at__lt=cutoff)
+
+
+def archive_batch(cutoff, batch_size=500):
+    """
+    Move one batch of finished orders older than ``cutoff`` with their items to the archive,
+    returns the number of archived orders.
+    """
+    candidates = list(archivable_orders(cutoff).order_by("id").values_list("id", "created_at")[:batch_size])
+    if not candidates:
+        return 0
+    # Partitions are created outside the moving transaction, DDL on the parent locks it.
+    ensure_partitions(month_start(created_at) for _, created_at in candidates)
+
+    with transaction.atomic(), skip_order_history_signals():
+        orders = list(
+            archivable_orders(cutoff).filter(id__in=[order_id for order_id, _ in candidates])
+            .select_for_update(skip_locked=True)
+        )
+        if not orders:
+            return 0
+        created = {order.id: order.created_at for order in orders}
+        ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(
+                id=order.id, customer_id=order.customer_id, restaurant_id=order.restaurant_id, status=order.status,
+                total_price=order.total_price, created_at=order.created_at, updated_at=order.updated_at,
+                version=order.version, ready_at=order.ready_at,
+            )
+            for order in orders
+        ])
+        ArchivedOrderItem.objects.bulk_create([
+            ArchivedOrderItem(
+                id=item.id, order_id=item.order_id, order_created_at=created[item.order_id],
+                menu_item_id=item.menu_item_id, quantity=item.quantity, price=item.price,
+            )
+            for item in OrderItem.objects.filter(order_id__in=created)
+        ])
+        Order.objects.filter(id__in=created).delete()
+    return len(orders)
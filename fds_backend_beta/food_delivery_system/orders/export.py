@@ -0,0 +1,130 @@
+"""
+Streamed exports of orders with their items, as CSV (one line per item) or NDJSON (one line per
+order).
+
+The export is a query over orders left-joined to their items, read as plain tuples
+through a server-side cursor (`iterator(chunk_size=...)`), so neither the export size nor the
+number of orders changes the memory used: rows are encoded and sent as they arrive. Rows come
+ordered by (created_at, order id, item id), the items of an order are consecutive and the
+NDJSON encoder groups them without buffering more than one order.
+
+Completed and canceled orders moved to `ArchivedOrder` (see orders/archive.py) are read the same
+way from the archive tables, and the two streams merged on (created_at, order id).
+
+Filters read the order indexes: a restaurant's export the (restaurant, status, created_at) one,
+the all-restaurants export of admins the created_at one; in the archive, the (restaurant,
+created_at) one.
+"""
+import csv
+import heapq
+from datetime import datetime
+from itertools import groupby
+from operator import itemgetter
+
+import orjson
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+
+from food_delivery_system.orders.models import Order
+from food_delivery_system.utils.dates import parse_moment
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+ORDER_COLUMNS = ["id", "created_at", "updated_at", "status", "restaurant_id", "customer_id", "total_price"]
+ITEM_COLUMNS = ["id", "menu_item_id", "menu_item", "quantity", "price"]
+CSV_HEADER = ["order_id"] + ORDER_COLUMNS[1:] + ["item_" + column for column in ITEM_COLUMNS]
+# Database lookups of the columns above, in the same order
+LOOKUPS = ORDER_COLUMNS + ["order_items__id", "order_items__menu_item_id", "order_items__menu_item__name",
+                           "order_items__quantity", "order_items__price"]
+# Lines of output sent per chunk of the response
+LINES_PER_CHUNK = 500
+
+
+def filter_orders(orders, params):
+    """
+    Apply the export filters of a query string to orders or archived orders: placed from `from`
+    (inclusive) to `to` (exclusive) and with one of the comma separated `status`.
+    """
+    if params.get("from"):
+        orders = orders.filter(created_at__gte=parse_moment("from", params["from"]))
+    if params.get("to"):
+        orders = orders.filter(created_at__lt=parse_moment("to", params["to"]))
+    if params.get("status"):
+        statuses = [value.strip() for value in params["status"].split(",") if value.strip()]
+        unknown = set(statuses) - {choice for choice, _ in Order.STATUS_CHOICES}
+        if unknown:
+            raise ValidationError({"status": f"Unknown status: {', '.join(sorted(unknown))}."})
+        orders = orders.filter(status__in=statuses)
+    return orders
+
+
+def export_rows(orders):
+    """
+    Order and item columns (see `LOOKUPS`) of the orders, an order without items giving a single
+    row of empty item columns.
+    """
+    return (orders.order_by("created_at", "id", "order_items__id")
+                  .values_list(*LOOKUPS)
+                  .iterator(chunk_size=settings.ORDER_EXPORT_CHUNK_SIZE))
+
+
+def _chunked(lines):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= LINES_PER_CHUNK:
+            yield b"".join(chunk)
+            chunk = []
+    if chunk:
+        yield b"".join(chunk)
+
+
+class _Line:
+    """File-like that hands back what the csv writer writes."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def stream_csv(rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(CSV_HEADER).encode()
+    yield from _chunked(
+        writer.writerow([_csv_value(value) for value in row]).encode() for row in rows
+    )
+
+
+def _order_lines(rows):
+    order_width = len(ORDER_COLUMNS)
+    for _, order_rows in groupby(rows, key=itemgetter(0)):
+        first, *rest = order_rows
+        order = dict(zip(ORDER_COLUMNS, first[:order_width]))
+        order["items"] = [
+            dict(zip(ITEM_COLUMNS, row[order_width:])) for row in (first, *rest) if row[order_width] is not None
+        ]
+        yield orjson.dumps(order, default=str, option=orjson.OPT_UTC_Z | orjson.OPT_APPEND_NEWLINE)
+
+
+def stream_ndjson(rows):
+    yield from _chunked(_order_lines(rows))
+
+
+STREAMERS = {"csv": stream_csv, "ndjson": stream_ndjson}
+
+
+def stream_export(orders, export_format, archived_orders=None):
+    """
+    Encoded chunks of the export of ``orders`` in ``export_format`` (one of `EXPORT_FORMATS`),
+    merged in order with the rows of ``archived_orders``, an `ArchivedOrder` queryset.
+    """
+    rows = export_rows(orders)
+    if archived_orders is not None:
+        # Archived orders keep their id, the rows of an order stay consecutive
+        rows = heapq.merge(export_rows(archived_orders), rows, key=itemgetter(1, 0))
+    return STREAMERS[export_format](rows)
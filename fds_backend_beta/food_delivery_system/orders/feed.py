@@ -0,0 +1,300 @@
+"""
+In-process change feeds of orders and menus, fanned out to the kitchen and menu SSE streams.
+
+Every write to an order ends in `store_order_history`, which announces the changed orders once
+the transaction commits. On PostgreSQL the announcement is a `NOTIFY order_feed` and each worker
+runs a single `LISTEN` thread that loads the changed history rows (one query per notification
+batch, whatever the number of connected clients) and publishes them to the local subscribers.
+Other databases publish in-process from the writing worker.
+
+Event ids are ``<updated_at in microseconds>-<order id>`` so a client resuming with
+`Last-Event-ID` is served from the per-worker ring buffer, or from the history table when the
+buffer does not reach back that far.
+
+Menu availability changes travel the same way on their own channel (`NOTIFY menu_feed` with the
+changed items as payload). They are not buffered: a reconnecting client reloads the menu.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, connection, connections, transaction
+
+from food_delivery_system.orders.models import CustomerOrderHistory
+
+logger = logging.getLogger("data.log")
+
+FEED_CHANNEL = "order_feed"
+MENU_CHANNEL = "menu_feed"
+FEED_BUFFER_SIZE = getattr(settings, "ORDER_FEED_BUFFER_SIZE", 1000)
+FEED_KEEPALIVE = 15     # seconds between keep-alive comments
+
+
+def event_id(row):
+    return f"{int(row.updated_at.timestamp() * 1_000_000)}-{row.order_id}"
+
+
+def parse_event_id(value):
+    """
+    Return ``(updated_at microseconds, order id)`` of an event id, ``None`` if malformed.
+    """
+    try:
+        micros, order_id = value.split("-")
+        return int(micros), int(order_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def render_menu_event(change):
+    return {"restaurant": change["restaurant"], "event": "menu", "data": change}
+
+
+def render_event(row):
+    return {
+        "id": event_id(row),
+        "restaurant": row.restaurant_id,
+        "data": {
+            "id": row.order_id,
+            "customer": row.customer_id,
+            "status": row.status,
+            "total_price": row.total_price,
+            "items": row.items,
+            "created_at": row.created_at,
+            "updated_at": row.updated_at,
+        },
+    }
+
+
+class ChangeFeed(ABC):
+    """
+    Per-worker fan-out of change events to asyncio subscribers, keyed by restaurant. On
+    PostgreSQL a listener thread turns the notifications of ``channel`` into events.
+    """
+    channel = None
+
+    def __init__(self, buffer_size=FEED_BUFFER_SIZE):
+        self.buffer = deque(maxlen=buffer_size)
+        self.subscribers = {}
+        self.lock = threading.Lock()
+        self.listener = None
+
+    def subscribe(self, restaurant_id):
+        """
+        Register a subscriber on the running event loop, returns its queue.
+        """
+        self.ensure_listener()
+        queue = asyncio.Queue()
+        with self.lock:
+            self.subscribers.setdefault(restaurant_id, set()).add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, restaurant_id, queue):
+        with self.lock:
+            subscribers = self.subscribers.get(restaurant_id, set())
+            subscribers -= {entry for entry in subscribers if entry[1] is queue}
+            if not subscribers:
+                self.subscribers.pop(restaurant_id, None)
+
+    def publish(self, events):
+        """
+        Buffer the events and hand them to the subscribers of their restaurant. Thread-safe.
+        """
+        with self.lock:
+            for event in events:
+                self.buffer.append(event)
+                for loop, queue in self.subscribers.get(event["restaurant"], ()):
+                    loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    @abstractmethod
+    def receive(self, payloads):
+        """
+        Publish the events described by a batch of notification payloads.
+        """
+
+    def ensure_listener(self):
+        if connection.vendor != "postgresql" or self.listener is not None:
+            return
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(target=self.listen, name=f"{self.channel}-listener", daemon=True)
+                self.listener.start()
+
+    def listen(self):
+        """
+        LISTEN loop of the worker, reconnecting after database errors.
+        """
+        while True:
+            try:
+                self._listen_once()
+            except Exception:
+                logger.exception(f"{self.channel} listener lost its connection, reconnecting")
+                close_old_connections()
+                threading.Event().wait(1)
+
+    def _listen_once(self):
+        db = connections["default"]
+        db.ensure_connection()
+        db.set_autocommit(True)
+        raw = db.connection
+        with raw.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.channel}")
+
+        while True:
+            if callable(getattr(raw, "notifies", None)):     # psycopg 3
+                # The generator holds the connection, drain it before querying.
+                payloads = [notify.payload for notify in raw.notifies(timeout=5, stop_after=1)]
+            else:                                           # psycopg2
+                if select.select([raw], [], [], 5) == ([], [], []):
+                    continue
+                raw.poll()
+                payloads = [notify.payload for notify in raw.notifies]
+                raw.notifies.clear()
+            if payloads:
+                self.receive(payloads)
+
+
+class OrderChangeFeed(ChangeFeed):
+    """
+    Feed of the new and changed orders of each restaurant, for the kitchen.
+    """
+    channel = FEED_CHANNEL
+
+    def publish_orders(self, order_ids):
+        rows = CustomerOrderHistory.objects.filter(order_id__in=order_ids).order_by("updated_at", "order_id")
+        self.publish([render_event(row) for row in rows])
+
+    def receive(self, payloads):
+        order_ids = {int(order_id) for payload in payloads for order_id in payload.split(",") if order_id}
+        if order_ids:
+            self.publish_orders(order_ids)
+
+    def replay(self, restaurant_id, last_event_id):
+        """
+        Events of the restaurant after ``last_event_id``, from the buffer when it covers the
+        position, otherwise from the history table.
+        """
+        position = parse_event_id(last_event_id)
+        if position is None:
+            return []
+        with self.lock:
+            buffered = list(self.buffer)
+        if buffered and parse_event_id(buffered[0]["id"]) <= position:
+            return [
+                event for event in buffered
+                if event["restaurant"] == restaurant_id and parse_event_id(event["id"]) > position
+            ]
+        return None     # The caller catches up from the database
+
+    def catch_up(self, restaurant_id, last_event_id):
+        """
+        Events of the restaurant after ``last_event_id`` read from the history table, for clients
+        resuming from further back than the buffer reaches.
+        """
+        position = parse_event_id(last_event_id)
+        if position is None:
+            return []
+        since = datetime.fromtimestamp(position[0] / 1_000_000, tz=dt_timezone.utc)
+        rows = (
+            CustomerOrderHistory.objects.filter(restaurant_id=restaurant_id, updated_at__gte=since)
+            .order_by("updated_at", "order_id")[:self.buffer.maxlen]
+        )
+        return [event for event in map(render_event, rows) if parse_event_id(event["id"]) > position]
+
+
+class MenuChangeFeed(ChangeFeed):
+    """
+    Feed of the menu availability changes of each restaurant, for the customers' menus.
+    """
+    channel = MENU_CHANNEL
+
+    def __init__(self):
+        super().__init__(buffer_size=0)
+
+    def receive(self, payloads):
+        self.publish([render_menu_event(json.loads(payload)) for payload in payloads])
+
+
+order_feed = OrderChangeFeed()
+menu_feed = MenuChangeFeed()
+
+
+def announce_order_changes(order_ids):
+    """
+    Announce changed orders once the current transaction commits.
+    """
+    order_ids = sorted(set(order_ids))
+    if order_ids:
+        transaction.on_commit(lambda: notify_order_changes(order_ids))
+
+
+def notify_order_changes(order_ids):
+    if connection.vendor != "postgresql":
+        order_feed.publish_orders(order_ids)
+        return
+    with connection.cursor() as cursor:
+        # Notification payloads are capped at 8000 bytes.
+        for start in range(0, len(order_ids), 500):
+            payload = ",".join(map(str, order_ids[start:start + 500]))
+            cursor.execute("SELECT pg_notify(%s, %s)", [FEED_CHANNEL, payload])
+
+
+def announce_menu_changes(restaurant_id, items):
+    """
+    Announce the new availability of menu items, ``{menu item id: available}``, once the current
+    transaction commits.
+    """
+    items = sorted(items.items())
+    if items:
+        transaction.on_commit(lambda: notify_menu_changes(restaurant_id, items))
+
+
+def notify_menu_changes(restaurant_id, items):
+    changes = [
+        {"restaurant": restaurant_id, "items": [{"id": item_id, "available": available}
+                                                for item_id, available in items[start:start + 200]]}
+        for start in range(0, len(items), 200)
+    ]
+    if connection.vendor != "postgresql":
+        menu_feed.publish([render_menu_event(change) for change in changes])
+        return
+    with connection.cursor() as cursor:
+        # Notification payloads are capped at 8000 bytes.
+        for change in changes:
+            cursor.execute("SELECT pg_notify(%s, %s)", [MENU_CHANNEL, json.dumps(change, separators=(",", ":"))])
+
+
+def format_event(event):
+    data = json.dumps(event["data"], cls=DjangoJSONEncoder, separators=(",", ":"))
+    # Menu events carry no id, a resuming client's Last-Event-ID keeps pointing at an order.
+    event_id_line = f"id: {event['id']}\n" if "id" in event else ""
+    return f"{event_id_line}event: {event.get('event', 'order')}\ndata: {data}\n\n"
+
+
+async def stream_events(feed, restaurant_id, queue, backlog=()):
+    """
+    Server-sent events of a subscriber: the backlog, then the published events with keep-alive
+    comments in between. Unsubscribes when the client goes away.
+    """
+    try:
+        yield 'retry: 3000\n\n'
+        sent = set()
+        for event in backlog:
+            sent.add(event['id'])
+            yield format_event(event)
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=FEED_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            if event.get('id') not in sent:
+                yield format_event(event)
+    finally:
+        feed.unsubscribe(restaurant_id, queue)
@@ -0,0 +1,111 @@
+"""
+Maintenance of the customer order-history read model (CustomerOrderHistory).
+
+Every write to an Order or OrderItem refreshes the history row of the affected order in the
+same transaction. Writes that bypass model signals (bulk inserts, queryset updates) must call
+`refresh_order_history` or `store_order_history` themselves.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models import Prefetch
+
+from food_delivery_system.orders.feed import announce_order_changes
+from food_delivery_system.orders.models import CustomerOrderHistory, Order, OrderItem
+
+HISTORY_FIELDS = [
+    "customer", "restaurant", "restaurant_name", "status", "total_price", "items", "created_at", "updated_at",
+]
+
+_signals_skipped = ContextVar("order_history_signals_skipped", default=False)
+
+
+@contextmanager
+def skip_order_history_signals():
+    """
+    Disable the signal driven refresh inside the block, for callers that write the history
+    row themselves once all the order's rows are in place.
+    """
+    token = _signals_skipped.set(True)
+    try:
+        yield
+    finally:
+        _signals_skipped.reset(token)
+
+
+def order_history_signals_skipped():
+    return _signals_skipped.get()
+
+
+def render_order_items(order_items):
+    """
+    Render line items the way they are stored in `CustomerOrderHistory.items`.
+    """
+    return [
+        {
+            "id": order_item.id,
+            "menu_item_id": order_item.menu_item_id,
+            "menu_item": order_item.menu_item.name,
+            "quantity": order_item.quantity,
+            "price": str(order_item.price),
+        }
+        for order_item in order_items
+    ]
+
+
+def build_order_history(order, order_items):
+    """
+    Build the (unsaved) history row of an order, `order.restaurant` and the menu item of every
+    order item must already be loaded.
+    """
+    return CustomerOrderHistory(
+        order=order,
+        customer_id=order.customer_id,
+        restaurant_id=order.restaurant_id,
+        restaurant_name=order.restaurant.name,
+        status=order.status,
+        total_price=order.total_price,
+        items=render_order_items(order_items),
+        created_at=order.created_at,
+        updated_at=order.updated_at,
+    )
+
+
+def store_order_history(rows):
+    """
+    Upsert history rows with a single statement and announce the changed orders to the kitchen
+    feed.
+    """
+    if rows:
+        CustomerOrderHistory.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=["order"], update_fields=HISTORY_FIELDS,
+        )
+        announce_order_changes(row.order_id for row in rows)
+    return rows
+
+
+def load_orders_for_history(order_ids):
+    """
+    Load orders with everything their history row renders, in two queries.
+    """
+    return (
+        Order.objects.filter(id__in=order_ids)
+        .select_related("restaurant")
+        .prefetch_related(
+            Prefetch("order_items", queryset=OrderItem.objects.select_related("menu_item").order_by("id"))
+        )
+    )
+
+
+def refresh_order_history(order_ids):
+    """
+    Re-render and upsert the history rows of the given orders. Orders that no longer exist
+    are skipped, their rows are removed by the post_delete signal on `Order` (or kept, for
+    archived orders).
+    """
+    order_ids = set(order_ids)
+    if not order_ids:
+        return []
+    return store_order_history([
+        build_order_history(order, order.order_items.all()) for order in load_orders_for_history(order_ids)
+    ])
@@ -0,0 +1,80 @@
+"""
+Idempotent order submission.
+
+The key is claimed by inserting its row in the transaction that creates the order. A
+concurrent request with the same key blocks on the unique index until that transaction ends:
+it then either finds the committed response and replays it, or (when the first request failed
+and rolled back) claims the key itself. Replays only read the idempotency table.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from food_delivery_system.orders.models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'The Idempotency-Key was already used for a different request.'
+    default_code = 'idempotency_key_reused'
+
+
+def request_fingerprint(request):
+    payload = json.dumps(request.data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{request.method} {request.path}\n{payload}".encode()).hexdigest()
+
+
+def claim_idempotency_key(user, key, fingerprint):
+    """
+    Claim ``key`` for ``user`` inside the caller's transaction. Returns ``None`` when the key is
+    claimed (the caller goes on and stores its response), or the stored record to replay.
+    """
+    if len(key) > IdempotencyKey._meta.get_field("key").max_length:
+        raise ValidationError({'error': f'The {IDEMPOTENCY_HEADER} header is too long.'})
+
+    now = timezone.now()
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(
+                    user=user, key=key, fingerprint=fingerprint, created_at=now,
+                    expires_at=now + settings.IDEMPOTENCY_KEY_TTL,
+                )
+            return None
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(user=user, key=key).first()
+            if record is None:
+                continue    # The holder rolled back in the meantime
+            if record.expires_at <= now:
+                record.delete()
+                continue
+            if record.fingerprint != fingerprint:
+                raise IdempotencyKeyReused()
+            return record
+    raise IdempotencyKeyReused()
+
+
+def store_idempotent_response(user, key, response):
+    IdempotencyKey.objects.filter(user=user, key=key).update(status_code=response.status_code, response=response.data)
+
+
+def purge_expired_keys(batch_size=1000):
+    """
+    Delete expired keys in batches, returns the number of deleted rows.
+    """
+    deleted = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.20 on 2026-10-17 22:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0006_alter_restaurant_owner'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('orders', '0006_order_order_created_id_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerOrderHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('restaurant_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('preparing', 'Preparing'), ('picked up', 'Picked Up'), ('delivered', 'Delivered'), ('canceled', 'Canceled'), ('completed', 'Completed')], max_length=20)),
+                ('total_price', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('items', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_history', to=settings.AUTH_USER_MODEL)),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='history', to='orders.order')),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='restaurant.restaurant')),
+            ],
+            options={
+                'default_permissions': (),
+                'indexes': [models.Index(fields=['customer', '-created_at', '-id'], name='history_customer_created_idx')],
+            },
+        ),
+    ]
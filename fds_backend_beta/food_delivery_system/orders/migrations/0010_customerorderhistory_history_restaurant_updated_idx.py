@@ -0,0 +1,17 @@
+# Generated by Django 4.2.20 on 2026-10-17 23:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_idempotencykey_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customerorderhistory',
+            index=models.Index(fields=['restaurant', 'updated_at'], name='history_restaurant_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,119 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+# On PostgreSQL the archive tables are range partitioned by month. The partition key has to be
+# part of the primary key, the ORM keeps treating `id` as the primary key.
+ARCHIVED_ORDER_SQL = """
+CREATE TABLE "orders_archivedorder" (
+    "id" bigint NOT NULL,
+    "customer_id" bigint NOT NULL REFERENCES "users_customuser" ("id") DEFERRABLE INITIALLY DEFERRED,
+    "restaurant_id" bigint NOT NULL REFERENCES "restaurant_restaurant" ("id") DEFERRABLE INITIALLY DEFERRED,
+    "status" varchar(20) NOT NULL,
+    "total_price" numeric(10, 2) NOT NULL,
+    "created_at" timestamp with time zone NOT NULL,
+    "updated_at" timestamp with time zone NOT NULL,
+    "version" integer NOT NULL CHECK ("version" >= 0),
+    "ready_at" timestamp with time zone NULL,
+    "archived_at" timestamp with time zone NOT NULL,
+    PRIMARY KEY ("id", "created_at")
+) PARTITION BY RANGE ("created_at");
+CREATE TABLE "orders_archivedorder_default" PARTITION OF "orders_archivedorder" DEFAULT;
+"""
+
+ARCHIVED_ORDER_ITEM_SQL = """
+CREATE TABLE "orders_archivedorderitem" (
+    "id" bigint NOT NULL,
+    "order_id" bigint NOT NULL,
+    "order_created_at" timestamp with time zone NOT NULL,
+    "menu_item_id" bigint NOT NULL REFERENCES "orders_menuitem" ("id") DEFERRABLE INITIALLY DEFERRED,
+    "quantity" integer NOT NULL CHECK ("quantity" >= 0),
+    "price" numeric(10, 2) NOT NULL,
+    PRIMARY KEY ("id", "order_created_at")
+) PARTITION BY RANGE ("order_created_at");
+CREATE TABLE "orders_archivedorderitem_default" PARTITION OF "orders_archivedorderitem" DEFAULT;
+CREATE INDEX "orders_archivedorderitem_order_id_idx" ON "orders_archivedorderitem" ("order_id");
+CREATE INDEX "orders_archivedorderitem_menu_item_id_idx" ON "orders_archivedorderitem" ("menu_item_id");
+"""
+
+
+def create_archive_tables(apps, schema_editor):
+    ArchivedOrder = apps.get_model("orders", "ArchivedOrder")
+    ArchivedOrderItem = apps.get_model("orders", "ArchivedOrderItem")
+    if schema_editor.connection.vendor != "postgresql":
+        schema_editor.create_model(ArchivedOrder)
+        schema_editor.create_model(ArchivedOrderItem)
+        return
+
+    schema_editor.execute(ARCHIVED_ORDER_SQL)
+    schema_editor.execute(ARCHIVED_ORDER_ITEM_SQL)
+    for index in ArchivedOrder._meta.indexes:
+        schema_editor.add_index(ArchivedOrder, index)
+
+
+def drop_archive_tables(apps, schema_editor):
+    schema_editor.delete_model(apps.get_model("orders", "ArchivedOrderItem"))
+    schema_editor.delete_model(apps.get_model("orders", "ArchivedOrder"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0007_restauranthourlystats_restaurantdailystats_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('orders', '0012_order_ready_at_order_order_restaurant_created_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customerorderhistory',
+            name='order',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='history', to='orders.order'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ArchivedOrder',
+                    fields=[
+                        ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                        ('status', models.CharField(choices=[('pending', 'Pending'), ('preparing', 'Preparing'), ('picked up', 'Picked Up'), ('delivered', 'Delivered'), ('canceled', 'Canceled'), ('completed', 'Completed')], max_length=20)),
+                        ('total_price', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                        ('created_at', models.DateTimeField()),
+                        ('updated_at', models.DateTimeField()),
+                        ('version', models.PositiveIntegerField(default=1)),
+                        ('ready_at', models.DateTimeField(blank=True, null=True)),
+                        ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                        ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to=settings.AUTH_USER_MODEL)),
+                        ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to='restaurant.restaurant')),
+                    ],
+                    options={
+                        'default_permissions': (),
+                    },
+                ),
+                migrations.CreateModel(
+                    name='ArchivedOrderItem',
+                    fields=[
+                        ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                        ('order_created_at', models.DateTimeField()),
+                        ('quantity', models.PositiveIntegerField(default=1)),
+                        ('price', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                        ('menu_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_order_items', to='orders.menuitem')),
+                        ('order', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='order_items', to='orders.archivedorder')),
+                    ],
+                    options={
+                        'default_permissions': (),
+                    },
+                ),
+                migrations.AddIndex(
+                    model_name='archivedorder',
+                    index=models.Index(fields=['customer', '-created_at'], name='archivedorder_customer_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='archivedorder',
+                    index=models.Index(fields=['restaurant', 'created_at'], name='archivedorder_restaurant_idx'),
+                ),
+            ],
+        ),
+        migrations.RunPython(create_archive_tables, drop_archive_tables),
+    ]
@@ -0,0 +1,60 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Same weights as restaurant/search.py, written out so the migration does not depend on it.
+BACKFILL_SQL = """
+UPDATE "orders_menuitem" AS item SET "search_vector" =
+    setweight(to_tsvector(%(config)s, coalesce(item."name", '')), 'A') ||
+    setweight(to_tsvector(%(config)s, coalesce(category."name", '')), 'B') ||
+    setweight(to_tsvector(%(config)s, coalesce(restaurant."name", '')), 'B') ||
+    setweight(to_tsvector(%(config)s, coalesce(item."description", '')), 'C')
+FROM "orders_category" AS category
+JOIN "restaurant_restaurant" AS restaurant ON restaurant."id" = category."restaurant_id"
+WHERE category."id" = item."category_id"
+"""
+
+INDEXES = [
+    django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='menuitem_search_idx'),
+    django.contrib.postgres.indexes.GinIndex(fields=['name'], name='menuitem_name_trgm_idx', opclasses=['gin_trgm_ops']),
+]
+
+
+def add_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    MenuItem = apps.get_model("orders", "MenuItem")
+    for index in INDEXES:
+        schema_editor.add_index(MenuItem, index)
+    schema_editor.execute(BACKFILL_SQL, {"config": getattr(settings, "MENU_SEARCH_CONFIG", "english")})
+
+
+def remove_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    MenuItem = apps.get_model("orders", "MenuItem")
+    for index in INDEXES:
+        schema_editor.remove_index(MenuItem, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_order_archive'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='menuitem',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # GIN indexes only exist on PostgreSQL
+        migrations.SeparateDatabaseAndState(
+            state_operations=[migrations.AddIndex(model_name='menuitem', index=index) for index in INDEXES],
+            database_operations=[migrations.RunPython(add_search_indexes, remove_search_indexes)],
+        ),
+    ]
@@ -1,4 +1,7 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 
 from food_delivery_system.users.models import CustomUser
@@ -8,6 +11,7 @@ from food_delivery_system.restaurant.models import Restaurant
 class Category(models.Model):
     restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name="categories")
     name = models.CharField(max_length=100)
+    updated_at = models.DateTimeField(auto_now=True)    # Validator of conditional GETs
 
     class Meta:
         # No need to define default permissions like add, change, delete, view
@@ -26,6 +30,9 @@ class MenuItem(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     available = models.BooleanField(default=True)
     created_at = models.DateTimeField(default=timezone.now, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)    # Validator of conditional GETs
+    # Item, category and restaurant names with the description, maintained by restaurant/search.py
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         # No need to define default permissions like add, change, delete, view
@@ -34,6 +41,11 @@ class MenuItem(models.Model):
             ("can_mark_available", "Can mark menu items as available"),     # For Chefs
             ("can_mark_unavailable", "Can mark menu items as unavailable"),     # For Chefs
         ]
+        indexes = [
+            # Full-text search, and trigram matching of misspelled dish names (PostgreSQL only)
+            GinIndex(fields=["search_vector"], name="menuitem_search_idx"),
+            GinIndex(fields=["name"], name="menuitem_name_trgm_idx", opclasses=["gin_trgm_ops"]),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.price}"
@@ -48,12 +60,23 @@ class Order(models.Model):
         ('canceled', 'Canceled'),
         ('completed', 'Completed')
     ]
+    # Allowed status changes, terminal statuses have no outgoing transition.
+    STATUS_TRANSITIONS = {
+        'pending': ['preparing', 'canceled'],
+        'preparing': ['picked up', 'canceled'],
+        'picked up': ['delivered'],
+        'delivered': ['completed'],
+        'completed': [],
+        'canceled': [],
+    }
     customer = models.ForeignKey(CustomUser, on_delete=models.CASCADE, null=False, related_name="orders")
     restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name="orders")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     created_at = models.DateTimeField(default=timezone.now, editable=False)
     updated_at = models.DateTimeField(default=timezone.now, editable=False)
+    version = models.PositiveIntegerField(default=1, editable=False)     # Bumped by every conditional update
+    ready_at = models.DateTimeField(null=True, blank=True, editable=False)   # Set when the order is picked up
 
     class Meta:
         # No need to define default permissions like add, change, delete, view
@@ -62,10 +85,26 @@ class Order(models.Model):
             ("can_cancel_order", "Can cancel an order"),    # For Customers
             ("can_update_order_status", "Can update the status of an order"),   # For Managers and Chefs
         ]
+        indexes = [
+            # Keyset pagination on (created_at, id), for all orders and per customer
+            models.Index(fields=["-created_at", "-id"], name="order_created_id_idx"),
+            models.Index(fields=["customer", "-created_at", "-id"], name="order_customer_created_idx"),
+            # Analytics rollups recompute one restaurant's hour or day at a time
+            models.Index(fields=["restaurant", "created_at"], name="order_restaurant_created_idx"),
+            # Order exports of a restaurant filtered by status and creation date
+            models.Index(fields=["restaurant", "status", "created_at"], name="order_restaurant_status_idx"),
+        ]
 
     def __str__(self):
         return f"Order {self.id} - {self.status}"
 
+    def can_transition_to(self, status):
+        return status == self.status or status in self.STATUS_TRANSITIONS.get(self.status, [])
+
+    @property
+    def etag(self):
+        return f'"{self.id}-{self.version}"'
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="order_items")
@@ -78,6 +117,10 @@ class OrderItem(models.Model):
         permissions = [
             ("can_manage_orderitems", "Can manage order items"),
         ]
+        indexes = [
+            # Keyset pagination on (order_id, id)
+            models.Index(fields=["order", "id"], name="orderitem_order_id_idx"),
+        ]
 
     def __str__(self):
         return f"{self.quantity} x {self.menu_item.name} in Order {self.order.id}"
@@ -102,3 +145,136 @@ class Staff(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.role} at {self.restaurant.name}"
+
+
+class CustomerOrderHistory(models.Model):
+    """
+    Denormalized read model of an order for the customer's order history.
+
+    One row per order holding the rendered line items, the restaurant name and the status,
+    kept up to date by `orders/history.py` whenever an Order or OrderItem is written.
+    """
+    # No database constraint: the row outlives its order when `archive_orders` moves it to the archive
+    order = models.OneToOneField(Order, on_delete=models.DO_NOTHING, db_constraint=False, related_name="history")
+    customer = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="order_history")
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name="+")
+    restaurant_name = models.CharField(max_length=255, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    items = models.JSONField(default=list)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        default_permissions = ()
+        indexes = [
+            # The customer's order list reads a single range of this index
+            models.Index(fields=["customer", "-created_at", "-id"], name="history_customer_created_idx"),
+            # Kitchen feed clients resuming past the in-process buffer catch up from here
+            models.Index(fields=["restaurant", "updated_at"], name="history_restaurant_updated_idx"),
+        ]
+
+    def __str__(self):
+        return f"Order {self.order_id} history - {self.status}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Stored response of an order submission, replayed when the client retries with the same
+    `Idempotency-Key` header. Rows expire after `IDEMPOTENCY_KEY_TTL` and are purged by the
+    `purge_idempotency_keys` command.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="+")
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)   # sha256 of the request path and body
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        default_permissions = ()
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="idempotency_user_key_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.user_id})"
+
+
+class OutboxEvent(models.Model):
+    """
+    Side effect of an order change (notification, analytics, cache invalidation), written in the
+    same transaction as the change and delivered later by the `drain_outbox` worker.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    topic = models.CharField(max_length=100)    # e.g. "order.created"
+    aggregate_id = models.BigIntegerField()     # Id of the order the event is about
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(default=timezone.now)
+    available_at = models.DateTimeField(default=timezone.now)     # Pushed back after a failed attempt
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        default_permissions = ()
+        indexes = [
+            # The worker only ever scans the pending events, oldest first
+            models.Index(fields=["available_at", "id"], condition=models.Q(status="pending"),
+                         name="outbox_pending_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} {self.aggregate_id} - {self.status}"
+
+
+class ArchivedOrder(models.Model):
+    """
+    Completed or canceled order moved out of `Order` by the `archive_orders` command, keeping its
+    id. On PostgreSQL the table is range partitioned by `created_at` month (see `orders/archive.py`).
+    """
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="archived_orders")
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name="archived_orders")
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    version = models.PositiveIntegerField(default=1)
+    ready_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        default_permissions = ()
+        indexes = [
+            models.Index(fields=["customer", "-created_at"], name="archivedorder_customer_idx"),
+            models.Index(fields=["restaurant", "created_at"], name="archivedorder_restaurant_idx"),
+        ]
+
+    def __str__(self):
+        return f"Archived order {self.id} - {self.status}"
+
+
+class ArchivedOrderItem(models.Model):
+    """
+    Line item of an archived order, partitioned like its order by `order_created_at`.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    # Partitioned tables cannot be referenced by a foreign key constraint, the cascade is done by the ORM
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, db_constraint=False, related_name="order_items")
+    order_created_at = models.DateTimeField()
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name="archived_order_items")
+    quantity = models.PositiveIntegerField(default=1)
+    price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+
+    class Meta:
+        default_permissions = ()
+
+    def __str__(self):
+        return f"{self.quantity} x {self.menu_item_id} (archived order {self.order_id})"
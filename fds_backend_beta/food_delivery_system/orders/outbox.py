@@ -0,0 +1,129 @@
+"""
+Transactional outbox of order events.
+
+`emit` writes the event in the caller's transaction, so it exists if and only if the order
+change commits. The `drain_outbox` worker claims pending events in batches with
+`SELECT ... FOR UPDATE SKIP LOCKED` (several workers never deliver the same event) and hands
+each one to the handlers registered for its topic. A failing handler pushes the event back with
+an exponential backoff, after `OUTBOX_MAX_ATTEMPTS` the event is marked failed.
+
+Handlers are registered in code with `register_handler`, or in settings::
+
+    OUTBOX_HANDLERS = {"order.created": ["myapp.handlers.send_confirmation"]}
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from food_delivery_system.orders.models import OutboxEvent
+
+logger = logging.getLogger("data.log")
+
+ORDER_CREATED = "order.created"
+ORDER_UPDATED = "order.updated"
+ORDER_STATUS_CHANGED = "order.status_changed"
+ORDER_DELETED = "order.deleted"
+
+_handlers = {}
+
+
+def register_handler(topic, handler=None):
+    """
+    Register ``handler(event)`` for ``topic``, usable as a decorator.
+    """
+    if handler is None:
+        return lambda handler: register_handler(topic, handler)
+    _handlers.setdefault(topic, [])
+    if handler not in _handlers[topic]:
+        _handlers[topic].append(handler)
+    return handler
+
+
+def unregister_handler(topic, handler):
+    if handler in _handlers.get(topic, []):
+        _handlers[topic].remove(handler)
+
+
+def get_handlers(topic):
+    configured = [import_string(path) for path in getattr(settings, "OUTBOX_HANDLERS", {}).get(topic, [])]
+    return _handlers.get(topic, []) + configured
+
+
+def emit(topic, aggregate_id, payload=None):
+    """
+    Record an event in the current transaction.
+    """
+    return OutboxEvent.objects.create(topic=topic, aggregate_id=aggregate_id, payload=payload or {})
+
+
+def emit_many(events):
+    """
+    Record several ``(topic, aggregate_id, payload)`` events in the current transaction with a
+    single INSERT.
+    """
+    return OutboxEvent.objects.bulk_create([
+        OutboxEvent(topic=topic, aggregate_id=aggregate_id, payload=payload or {})
+        for topic, aggregate_id, payload in events
+    ])
+
+
+def order_payload(order, **extra):
+    return {
+        "id": order.id,
+        "customer": order.customer_id,
+        "restaurant": order.restaurant_id,
+        "status": order.status,
+        "total_price": order.total_price,
+        "created_at": order.created_at,
+        **extra,
+    }
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(2 ** attempts, 3600))
+
+
+def drain_outbox(batch_size=100):
+    """
+    Deliver one batch of pending events, returns the number of events claimed.
+    """
+    max_attempts = getattr(settings, "OUTBOX_MAX_ATTEMPTS", 10)
+    with transaction.atomic():
+        now = timezone.now()
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(status="pending", available_at__lte=now)
+            .order_by("available_at", "id")[:batch_size]
+        )
+        for event in events:
+            try:
+                # A failing handler only rolls back its own work, not the batch.
+                with transaction.atomic():
+                    for handler in get_handlers(event.topic):
+                        handler(event)
+            except Exception as exc:
+                event.attempts += 1
+                event.last_error = f"{type(exc).__name__}: {exc}"
+                event.available_at = now + retry_delay(event.attempts)
+                if event.attempts >= max_attempts:
+                    event.status = "failed"
+                logger.exception(f"Outbox event {event.id} ({event.topic}) failed, attempt {event.attempts}")
+            else:
+                event.status = "done"
+                event.processed_at = now
+
+        OutboxEvent.objects.bulk_update(
+            events, ["status", "attempts", "last_error", "available_at", "processed_at"]
+        )
+    return len(events)
+
+
+def purge_processed_events(older_than):
+    """
+    Delete delivered events processed before ``older_than``, returns the number of deleted rows.
+    """
+    return OutboxEvent.objects.filter(status="done", processed_at__lt=older_than).delete()[0]
@@ -0,0 +1,55 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from food_delivery_system.orders.history import order_history_signals_skipped, refresh_order_history
+from food_delivery_system.orders.models import CustomerOrderHistory, Order, OrderItem
+from food_delivery_system.restaurant.models import Restaurant
+
+
+def _deleted_on_its_own(origin):
+    """
+    True when an order item is deleted directly rather than as part of a cascade (from its order,
+    restaurant or customer), in which case the whole order history row goes away anyway.
+    """
+    if isinstance(origin, QuerySet):
+        return origin.model is OrderItem
+    return isinstance(origin, OrderItem)
+
+
+@receiver(post_save, sender=Order)
+def refresh_history_on_order_save(sender, instance, raw=False, **kwargs):
+    if raw or order_history_signals_skipped():
+        return
+    refresh_order_history([instance.id])
+
+
+@receiver(post_delete, sender=Order)
+def delete_history_on_order_delete(sender, instance, **kwargs):
+    # The history row has no database cascade so that archived orders keep theirs.
+    if order_history_signals_skipped():
+        return
+    CustomerOrderHistory.objects.filter(order_id=instance.id).delete()
+
+
+@receiver(post_save, sender=OrderItem)
+def refresh_history_on_order_item_save(sender, instance, raw=False, **kwargs):
+    if raw or order_history_signals_skipped():
+        return
+    refresh_order_history([instance.order_id])
+
+
+@receiver(post_delete, sender=OrderItem)
+def refresh_history_on_order_item_delete(sender, instance, origin=None, **kwargs):
+    if order_history_signals_skipped() or not _deleted_on_its_own(origin):
+        return
+    refresh_order_history([instance.order_id])
+
+
+@receiver(post_save, sender=Restaurant)
+def rename_restaurant_in_history(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created:
+        return
+    CustomerOrderHistory.objects.filter(restaurant=instance).exclude(restaurant_name=instance.name).update(
+        restaurant_name=instance.name
+    )
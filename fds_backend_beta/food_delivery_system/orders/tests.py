@@ -1,9 +1,38 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+from datetime import timedelta
+from decimal import Decimal
+from asgiref.sync import sync_to_async
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import Permission
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, TestCase
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 from rest_framework import status
-from food_delivery_system.orders.models import Order, OrderItem
+from rest_framework_simplejwt.tokens import RefreshToken
+from silk.collector import DataCollector
+from food_delivery_system.orders.transitions import OrderVersionConflict, bulk_transition, update_order
+from food_delivery_system.orders.archive import archive_batch
+from food_delivery_system.orders.export import CSV_HEADER
+from food_delivery_system.orders.models import (Order, OrderItem, MenuItem, Category, Staff, CustomerOrderHistory,
+                                                IdempotencyKey, OutboxEvent, ArchivedOrder, ArchivedOrderItem)
 from food_delivery_system.users.factories import CustomUserFactory, RestaurantFactory
-from food_delivery_system.orders.factories import OrderFactory, OrderItemFactory
+from food_delivery_system.orders.factories import OrderFactory, OrderItemFactory, StaffFactory
+from food_delivery_system.orders.feed import event_id, order_feed
+from food_delivery_system.orders.outbox import drain_outbox, register_handler, unregister_handler
+from food_delivery_system.restaurant.models import Restaurant
+from food_delivery_system.serializers.serializer import OrderSerializer
+from food_delivery_system.users.models import CustomUser
+from food_delivery_system.utils.index_advisor import find_candidates, measure_with_index
+from food_delivery_system.utils.prefetch import apply_prefetch_plan, build_prefetch_plan
+from food_delivery_system.utils.renderers import ORJSONRenderer
 
 
 class OrderViewSetTestCase(TestCase):
@@ -52,6 +81,7 @@ class OrderViewSetTestCase(TestCase):
 
     def test_update_order(self):
         """Test updating an order."""
+        Order.objects.filter(id=self.order.id).update(status="delivered")
         payload = {"status": "completed"}
         response = self.client.patch(self.order_detail_url, payload, format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -186,3 +216,620 @@ class OrderItemViewSetTestCase(TestCase):
         response = self.client.delete(self.order_item_detail_url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+
+
+class OrderPlacementQueryCountTestCase(TestCase):
+    def setUp(self):
+        """Set up a customer, a restaurant and a menu to order from."""
+        DataCollector().clear()  # silk keeps profiling the previous request's thread until the next one starts
+        self.customer = CustomUserFactory()
+        self.restaurant = RestaurantFactory()
+        self.menu_items = [
+            MenuItem.objects.create(name=f"Dish {i}", price=Decimal("2.50"), available=True) for i in range(20)
+        ]
+
+    def place_order(self, items, num_queries):
+        serializer = OrderSerializer(data={"restaurant": self.restaurant.id, "items": items})
+        serializer.is_valid(raise_exception=True)
+        with self.assertNumQueries(num_queries):
+            return serializer.save(customer=self.customer)
+
+    def test_query_count_is_constant_for_basket_size(self):
+        """Test that placing an order costs the same number of queries for 1 and 20 items."""
+        # resolve menu items, insert order, bulk insert order items, upsert the order history row
+        self.place_order([{"menu_item": "Dish 0", "quantity": 1}], num_queries=4)
+        order = self.place_order([{"menu_item": item.name, "quantity": 2} for item in self.menu_items], num_queries=4)
+
+        self.assertEqual(order.order_items.count(), 20)
+        self.assertEqual(order.total_price, Decimal("100.00"))  # 20 items x 2 x 2.50
+
+    def test_unknown_menu_items_are_created_in_bulk(self):
+        """Test that unknown menu items are created with a single extra query."""
+        order = self.place_order([{"menu_item": "Pizza", "quantity": 2}, {"menu_item": "Burger", "quantity": 1}], num_queries=5)
+
+        self.assertTrue(MenuItem.objects.filter(name="Pizza").exists())
+        self.assertEqual(order.total_price, Decimal("0.00"))
+
+    def test_invalid_quantity_is_rejected(self):
+        """Test that non-positive quantities are rejected before anything is written."""
+        serializer = OrderSerializer(data={"restaurant": self.restaurant.id, "items": [{"menu_item": "Dish 0", "quantity": 0}]})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("items", serializer.errors)
+
+
+class PrefetchPlanTestCase(TestCase):
+    def setUp(self):
+        """Set up a restaurant with a staffed owner, a menu and a customer."""
+        DataCollector().clear()  # silk keeps profiling the previous request's thread until the next one starts
+        self.owner = CustomUserFactory(is_restaurant=True)
+        self.restaurant = RestaurantFactory(owner=self.owner)
+        Staff.objects.create(user=self.owner, restaurant=self.restaurant, role="manager")
+        self.category = Category.objects.create(restaurant=self.restaurant, name="Mains")
+        self.menu_item = MenuItem.objects.create(category=self.category, name="Curry", price=Decimal("9.00"))
+        self.customer = CustomUserFactory()
+
+    def create_orders(self, count):
+        for _ in range(count):
+            order = OrderFactory(customer=self.customer, restaurant=self.restaurant)
+            OrderItem.objects.create(order=order, menu_item=self.menu_item, quantity=2, price=Decimal("18.00"))
+
+    def render_orders(self):
+        queryset = apply_prefetch_plan(Order.objects.all(), OrderSerializer())
+        return OrderSerializer(queryset, many=True).data
+
+    def test_plan_for_nested_order_serializer(self):
+        """Test that the planner joins forward relations and prefetches order items with their own plan."""
+        select_related, prefetch_related = build_prefetch_plan(OrderSerializer())
+        self.assertEqual(select_related, ["customer", "customer__staff"])
+        self.assertEqual([lookup.prefetch_to for lookup in prefetch_related], ["order_items"])
+
+    def test_query_count_is_flat_for_page_size(self):
+        """Test that rendering 2 or 10 nested orders costs the same number of queries."""
+        self.create_orders(2)
+        with CaptureQueriesContext(connection) as small_page:
+            data = self.render_orders()
+        self.assertEqual(data[0]["items"][0]["menu_item"]["category"]["restaurant"]["owner"]["role"], "manager")
+
+        self.create_orders(8)
+        with CaptureQueriesContext(connection) as large_page:
+            self.render_orders()
+        self.assertEqual(len(small_page.captured_queries), len(large_page.captured_queries))
+
+
+class CustomerOrderHistoryTestCase(TestCase):
+    def setUp(self):
+        """Set up a customer with one order placed through the API."""
+        self.client = APIClient()
+        self.customer = CustomUserFactory()
+        self.client.force_authenticate(user=self.customer)
+        self.restaurant = RestaurantFactory()
+        MenuItem.objects.create(name="Pizza", price=Decimal("12.00"))
+
+        payload = {"restaurant": self.restaurant.id, "items": [{"menu_item": "Pizza", "quantity": 2}]}
+        response = self.client.post("/api/orders/", payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.order = Order.objects.get(id=response.data["id"])
+
+    def test_history_row_is_written_on_create(self):
+        """Test that placing an order renders its history row."""
+        history = CustomerOrderHistory.objects.get(order=self.order)
+        self.assertEqual(history.customer, self.customer)
+        self.assertEqual(history.restaurant_name, self.restaurant.name)
+        self.assertEqual(history.total_price, Decimal("24.00"))
+        self.assertEqual([(item["menu_item"], item["quantity"]) for item in history.items], [("Pizza", 2)])
+
+    def test_history_follows_order_and_item_writes(self):
+        """Test that order and order item writes refresh the history row."""
+        self.order.status = "preparing"
+        self.order.save()
+        self.assertEqual(CustomerOrderHistory.objects.get(order=self.order).status, "preparing")
+
+        self.order.order_items.first().delete()
+        self.assertEqual(CustomerOrderHistory.objects.get(order=self.order).items, [])
+
+        self.order.delete()
+        self.assertFalse(CustomerOrderHistory.objects.exists())
+
+    def test_customer_list_reads_only_the_history(self):
+        """Test that the customer's order list never touches the order tables."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/orders/?cursor=")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([order["id"] for order in response.data["results"]], [self.order.id])
+        self.assertEqual(response.data["results"][0]["items"][0]["menu_item"], "Pizza")
+        self.assertFalse(any('"orders_order"' in query["sql"] for query in queries.captured_queries))
+
+    def test_consistency_checker_repairs_stale_rows(self):
+        """Test that check_order_history detects and repairs a row missed by a queryset update."""
+        Order.objects.filter(id=self.order.id).update(status="canceled")  # bypasses the signals
+
+        output = StringIO()
+        call_command("check_order_history", stdout=output)
+        self.assertIn(f"Order {self.order.id}: history row is stale.", output.getvalue())
+
+        call_command("check_order_history", "--fix", stdout=StringIO())
+        self.assertEqual(CustomerOrderHistory.objects.get(order=self.order).status, "canceled")
+
+
+class OrderStatusTransitionTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customer = CustomUserFactory()
+        self.client.force_authenticate(user=self.customer)
+        self.order = OrderFactory(customer=self.customer, restaurant=RestaurantFactory(), status="pending")
+        self.order_detail_url = f"/api/orders/{self.order.id}/"
+
+    def test_valid_transition_bumps_version_and_etag(self):
+        """Test that a valid transition bumps the version and returns the new ETag."""
+        response = self.client.patch(self.order_detail_url, {"status": "preparing"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.version), ("preparing", 2))
+        self.assertEqual(response["ETag"], self.order.etag)
+        self.assertEqual(CustomerOrderHistory.objects.get(order=self.order).status, "preparing")
+
+    def test_invalid_transition_is_rejected(self):
+        """Test that a transition outside the state machine returns 400."""
+        response = self.client.patch(self.order_detail_url, {"status": "completed"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.version), ("pending", 1))
+
+    def test_if_match(self):
+        """Test that a matching If-Match applies the change and a stale one returns 412."""
+        etag = self.client.get(self.order_detail_url)["ETag"]
+        response = self.client.patch(self.order_detail_url, {"status": "preparing"}, format="json", HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.patch(self.order_detail_url, {"status": "picked up"}, format="json", HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "preparing")
+
+    def test_concurrent_update_conflicts(self):
+        """Test that a writer holding a stale version loses with a conflict instead of overwriting."""
+        stale = Order.objects.get(id=self.order.id)
+        update_order(self.order, {"status": "preparing"})
+        with self.assertRaises(OrderVersionConflict):
+            update_order(stale, {"status": "canceled"})
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.version), ("preparing", 2))
+
+
+class IndexAdvisorTestCase(TestCase):
+    def test_sort_over_filtered_scan(self):
+        """Test that a sort over a filtered scan proposes a partial composite index."""
+        plan = {"Plan": {"Node Type": "Sort", "Sort Key": ["orders_menuitem.name"], "Plans": [{
+            "Node Type": "Seq Scan", "Relation Name": "orders_menuitem", "Filter": "(available AND (category_id = 2))",
+        }]}}
+        [candidate] = find_candidates(plan)
+        self.assertEqual(candidate.model, MenuItem)
+        self.assertEqual(candidate.fields, ["category", "name"])
+        self.assertEqual(candidate.index.condition.children, [("available", True)])
+
+    def test_covered_scan_is_ignored(self):
+        """Test that scans already served by an existing index produce no candidate."""
+        plan = {"Plan": {"Node Type": "Seq Scan", "Relation Name": "orders_order", "Filter": "(customer_id = 3)"}}
+        self.assertEqual(find_candidates(plan), [])
+
+    def test_unexplained_query_keeps_its_baseline_cost(self):
+        """Test that a query the index cannot be measured on counts for its cost without the index."""
+        plan = {"Plan": {"Node Type": "Sort", "Sort Key": ["orders_menuitem.name"], "Plans": [{
+            "Node Type": "Seq Scan", "Relation Name": "orders_menuitem", "Filter": "(available AND (category_id = 2))",
+        }]}}
+        [candidate] = find_candidates(plan)
+        candidate.queries.append(("SELECT 1", 3))
+        candidate.baseline = {"SELECT 1": 40.0}
+        # The advisor explains on PostgreSQL only, neither the index nor the plans are needed here
+        with mock.patch("food_delivery_system.utils.index_advisor.explain", return_value=None), \
+                mock.patch.object(connection, "schema_editor", mock.MagicMock()):
+            self.assertEqual(measure_with_index(candidate), 120.0)
+
+
+class IdempotentOrderSubmissionTestCase(TestCase):
+    def setUp(self):
+        DataCollector().clear()     # silk keeps profiling the previous request's thread until the next one starts
+        self.client = APIClient()
+        self.customer = CustomUserFactory()
+        self.client.force_authenticate(user=self.customer)
+        self.payload = {"restaurant": RestaurantFactory().id, "items": [{"menu_item": "Pizza", "quantity": 2}]}
+
+    def test_retry_replays_stored_response(self):
+        """Test that a retried submission replays the first response without touching the order tables."""
+        first = self.client.post("/api/orders/", self.payload, format="json", HTTP_IDEMPOTENCY_KEY="retry-1")
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+
+        with CaptureQueriesContext(connection) as context:
+            retry = self.client.post("/api/orders/", self.payload, format="json", HTTP_IDEMPOTENCY_KEY="retry-1")
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Order.objects.filter(customer=self.customer).count(), 1)
+        self.assertFalse(any('"orders_order' in query["sql"] for query in context.captured_queries))
+
+    def test_key_reused_with_another_payload(self):
+        """Test that reusing a key for a different order is rejected."""
+        self.client.post("/api/orders/", self.payload, format="json", HTTP_IDEMPOTENCY_KEY="retry-2")
+        self.payload["items"][0]["quantity"] = 3
+        response = self.client.post("/api/orders/", self.payload, format="json", HTTP_IDEMPOTENCY_KEY="retry-2")
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Order.objects.filter(customer=self.customer).count(), 1)
+
+    def test_failed_submission_releases_key(self):
+        """Test that a rejected submission does not keep the key, so a corrected retry goes through."""
+        response = self.client.post("/api/orders/", {"items": []}, format="json", HTTP_IDEMPOTENCY_KEY="retry-3")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.filter(key="retry-3").exists())
+
+    def test_purge_expired_keys(self):
+        """Test that the purge command deletes only expired keys."""
+        self.client.post("/api/orders/", self.payload, format="json", HTTP_IDEMPOTENCY_KEY="retry-4")
+        IdempotencyKey.objects.create(user=self.customer, key="old", fingerprint="-", expires_at=timezone.now())
+        call_command("purge_idempotency_keys", stdout=StringIO())
+        self.assertEqual(list(IdempotencyKey.objects.values_list("key", flat=True)), ["retry-4"])
+
+
+class KitchenFeedTestCase(TestCase):
+    def setUp(self):
+        self.restaurant = RestaurantFactory()
+        self.chef = StaffFactory(restaurant=self.restaurant, role="chef").user
+        self.feed_url = f"/api/orders/feed/{self.restaurant.id}/"
+        self.orders = [OrderFactory(restaurant=self.restaurant, status="pending") for _ in range(3)]
+        order_feed.buffer.clear()
+
+    def headers(self, user, **extra):
+        return {"Authorization": f"Bearer {RefreshToken.for_user(user).access_token}", **extra}
+
+    async def read_events(self, response, count):
+        chunks, events = response.streaming_content, []
+        while len(events) < count:
+            chunk = (await chunks.__anext__()).decode()
+            events.extend(line[4:] for line in chunk.splitlines() if line.startswith("id: "))
+        await chunks.aclose()
+        return events
+
+    async def test_customer_cannot_follow_the_feed(self):
+        """Test that users outside the restaurant's kitchen are refused."""
+        customer = await CustomUser.objects.acreate(username="feed-customer", email="feed@example.com")
+        response = await AsyncClient().get(self.feed_url, headers=self.headers(customer))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    async def test_resume_from_last_event_id(self):
+        """Test that a reconnecting client receives the orders changed after its Last-Event-ID."""
+        rows = [row async for row in CustomerOrderHistory.objects.order_by("updated_at", "order_id")]
+        response = await AsyncClient().get(
+            self.feed_url, headers=self.headers(self.chef, **{"Last-Event-ID": event_id(rows[0])})
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(await self.read_events(response, 2), [event_id(row) for row in rows[1:]])
+
+    async def test_changes_are_pushed_to_subscribers(self):
+        """Test that a published order change reaches the connected client."""
+        response = await AsyncClient().get(self.feed_url, headers=self.headers(self.chef))
+        await sync_to_async(order_feed.publish_orders)([self.orders[1].id])
+        row = await CustomerOrderHistory.objects.aget(order=self.orders[1])
+        self.assertEqual(await self.read_events(response, 1), [event_id(row)])
+
+
+class OrderOutboxTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customer = CustomUserFactory()
+        self.client.force_authenticate(user=self.customer)
+        payload = {"restaurant": RestaurantFactory().id, "items": [{"menu_item": "Pizza", "quantity": 1}]}
+        self.order_id = self.client.post("/api/orders/", payload, format="json").data["id"]
+        self.delivered = []
+
+    def test_order_changes_are_recorded(self):
+        """Test that creating, updating and deleting an order each records an outbox event."""
+        self.client.patch(f"/api/orders/{self.order_id}/", {"status": "canceled"}, format="json")
+        self.client.delete(f"/api/orders/{self.order_id}/")
+        events = list(OutboxEvent.objects.order_by("id").values_list("topic", "aggregate_id"))
+        self.assertEqual(events, [
+            ("order.created", self.order_id), ("order.status_changed", self.order_id), ("order.deleted", self.order_id),
+        ])
+        self.assertEqual(OutboxEvent.objects.get(topic="order.status_changed").payload["previous_status"], "pending")
+
+    def test_drain_delivers_and_retries(self):
+        """Test that the worker delivers events to their handlers and backs off failing ones."""
+        register_handler("order.created", self.delivered.append)
+        self.addCleanup(unregister_handler, "order.created", self.delivered.append)
+        self.assertEqual(drain_outbox(), 1)
+        self.assertEqual([event.aggregate_id for event in self.delivered], [self.order_id])
+        self.assertEqual(OutboxEvent.objects.get().status, "done")
+
+        def fail(event):
+            raise RuntimeError("mail server down")
+        register_handler("order.deleted", fail)
+        self.addCleanup(unregister_handler, "order.deleted", fail)
+        self.client.delete(f"/api/orders/{self.order_id}/")
+        self.assertEqual(drain_outbox(), 1)
+        event = OutboxEvent.objects.get(topic="order.deleted")
+        self.assertEqual((event.status, event.attempts), ("pending", 1))
+        self.assertGreater(event.available_at, event.created_at)
+        self.assertEqual(drain_outbox(), 0)     # Not retried before its backoff expires
+
+
+class OrderArchiveTestCase(TestCase):
+    def setUp(self):
+        self.customer = CustomUserFactory()
+        self.restaurant = RestaurantFactory()
+        self.pizza = MenuItem.objects.create(name="Pizza", price=Decimal("12.00"))
+        self.long_ago = timezone.now() - timedelta(days=200)
+        self.old = self.place_order("completed", self.long_ago)
+        self.old_pending = self.place_order("pending", self.long_ago)
+        self.recent = self.place_order("completed", timezone.now())
+
+    def place_order(self, status, moment):
+        order = OrderFactory(customer=self.customer, restaurant=self.restaurant, status=status)
+        OrderItem.objects.create(order=order, menu_item=self.pizza, quantity=2, price=self.pizza.price)
+        Order.objects.filter(id=order.id).update(created_at=moment, updated_at=moment)
+        return order
+
+    def test_finished_orders_are_archived(self):
+        """Test that archiving moves old finished orders and their items and keeps their history."""
+        self.assertEqual(archive_batch(timezone.now() - timedelta(days=90)), 1)
+        self.assertEqual(set(Order.objects.values_list("id", flat=True)), {self.old_pending.id, self.recent.id})
+        archived = ArchivedOrder.objects.get()
+        self.assertEqual((archived.id, archived.status, archived.created_at), (self.old.id, "completed", self.long_ago))
+        self.assertEqual(ArchivedOrderItem.objects.get().order_id, self.old.id)
+        self.assertTrue(CustomerOrderHistory.objects.filter(order_id=self.old.id).exists())
+        self.assertEqual(archive_batch(timezone.now() - timedelta(days=90)), 0)
+
+    def test_archive_orders_command(self):
+        """Test that the archive_orders command archives in batches until nothing is left."""
+        self.place_order("canceled", self.long_ago)
+        output = StringIO()
+        call_command("archive_orders", "--batch-size", "1", stdout=output)
+        self.assertIn("Archived 2 orders", output.getvalue())
+        self.assertEqual(ArchivedOrder.objects.count(), 2)
+
+    def test_admin_list_is_limited_to_the_window(self):
+        """Test that the admin order list only returns recent and open orders unless asked for more."""
+        client = APIClient()
+        client.force_authenticate(user=CustomUserFactory(is_staff=True))
+
+        def listed(query=""):
+            response = client.get(f"/api/orders/{query}")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            results = response.data["results"] if isinstance(response.data, dict) else response.data
+            return {order["id"] for order in results}
+
+        self.assertEqual(listed(), {self.old_pending.id, self.recent.id})
+        self.assertEqual(listed("?since=all"), {self.old.id, self.old_pending.id, self.recent.id})
+        since = (self.long_ago - timedelta(days=1)).date().isoformat()
+        self.assertEqual(listed(f"?since={since}"), {self.old.id, self.old_pending.id, self.recent.id})
+        self.assertEqual(client.get("/api/orders/?since=yesterday").status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(client.get("/api/orders/?since=2024-02-30").status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BulkOrderStatusTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.restaurant = RestaurantFactory()
+        self.chef = StaffFactory(restaurant=self.restaurant, role="chef").user
+        self.chef.user_permissions.add(Permission.objects.get(codename="can_update_order_status"))
+        self.client.force_authenticate(user=self.chef)
+        self.orders = [OrderFactory(restaurant=self.restaurant, status="pending") for _ in range(3)]
+        self.ids = [order.id for order in self.orders]
+
+    def bulk(self, order_ids, new_status):
+        return self.client.post("/api/orders/bulk-status/", {"orders": order_ids, "status": new_status}, format="json")
+
+    def test_orders_are_moved_together(self):
+        """Test that a set of orders is moved with one UPDATE, its history and outbox events."""
+        elsewhere = OrderFactory(restaurant=RestaurantFactory(), status="pending")
+        Order.objects.filter(id=self.ids[2]).update(status="canceled")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.bulk(self.ids + [elsewhere.id], "preparing")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["updated"], 2)
+        self.assertEqual([result["updated"] for result in response.data["results"]], [True, True, False, False])
+        self.assertEqual(response.data["results"][3]["error"], "Order not found.")
+        self.assertEqual(len([query for query in queries.captured_queries
+                              if query["sql"].startswith('UPDATE "orders_order"')]), 1)
+
+        self.assertEqual(set(Order.objects.filter(status="preparing").values_list("id", flat=True)), set(self.ids[:2]))
+        self.assertEqual(Order.objects.get(id=self.ids[0]).version, 2)
+        self.assertEqual(CustomerOrderHistory.objects.get(order_id=self.ids[0]).status, "preparing")
+        self.assertEqual(OutboxEvent.objects.filter(topic="order.status_changed").count(), 2)
+        self.assertEqual(Order.objects.get(id=elsewhere.id).status, "pending")
+
+    def test_permission_is_checked_for_the_target_status(self):
+        """Test that marking orders delivered requires can_mark_delivered for the whole set."""
+        Order.objects.filter(id__in=self.ids).update(status="picked up")
+        response = self.bulk(self.ids, "delivered")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(Order.objects.filter(status="delivered").exists())
+
+        courier = StaffFactory(restaurant=self.restaurant, role="delivery").user
+        courier.user_permissions.add(Permission.objects.get(codename="can_mark_delivered"))
+        self.client.force_authenticate(user=courier)
+        self.assertEqual(self.bulk(self.ids, "delivered").data["updated"], 3)
+
+    def test_concurrent_change_is_reported(self):
+        """Test that an order changed after it was read is reported as a conflict."""
+        stale = list(Order.objects.filter(id__in=self.ids))
+        Order.objects.filter(id=self.ids[0]).update(version=5)
+        errors = bulk_transition(stale, "preparing")
+        self.assertEqual(list(errors), [self.ids[0]])
+        self.assertEqual(Order.objects.get(id=self.ids[0]).status, "pending")
+        self.assertEqual(Order.objects.filter(status="preparing").count(), 2)
+
+
+class ConditionalCategoryReadTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=CustomUserFactory())
+        self.restaurant = RestaurantFactory()
+        self.categories = [Category.objects.create(restaurant=self.restaurant, name=name) for name in ("Pizzas", "Pasta")]
+
+    def test_list_validator_follows_changes(self):
+        """Test that the category list answers 304 until a category changes or is deleted."""
+        response = self.client.get("/api/orders/categories/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+        self.assertEqual(
+            self.client.get("/api/orders/categories/", HTTP_IF_NONE_MATCH=etag).status_code,
+            status.HTTP_304_NOT_MODIFIED,
+        )
+        self.assertNotEqual(self.client.get("/api/orders/categories/?page_size=1")["ETag"], etag)
+
+        self.categories[1].delete()
+        response = self.client.get("/api/orders/categories/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["total_objects"], 1)
+
+    def test_detail_follows_its_restaurant(self):
+        """Test that a category is revalidated by date and changes with its nested restaurant."""
+        url = f"/api/orders/categories/{self.categories[0].id}/"
+        response = self.client.get(url)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code,
+            status.HTTP_304_NOT_MODIFIED,
+        )
+        self.restaurant.name = "Renamed"
+        self.restaurant.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, status.HTTP_200_OK)
+
+
+class ResponseRenderingTestCase(TestCase):
+    def setUp(self):
+        """Set up a page of orders with items, read by an admin."""
+        DataCollector().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=CustomUserFactory(is_staff=True, is_superuser=True))
+        restaurant = RestaurantFactory()
+        customer = CustomUserFactory()
+        menu_item = MenuItem.objects.create(name="Curry", price=Decimal("9.50"))
+        orders = Order.objects.bulk_create([Order(customer=customer, restaurant=restaurant) for _ in range(30)])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, menu_item=menu_item, quantity=2, price=Decimal("19.00")) for order in orders
+        ])
+
+    def test_orjson_renderer_matches_the_drf_renderer(self):
+        """Test that the orjson renderer writes the same bytes as DRF's JSONRenderer for serialized orders."""
+        data = {
+            "orders": OrderSerializer(apply_prefetch_plan(Order.objects.all(), OrderSerializer()), many=True).data,
+            "total": Decimal("570.00"),
+            "label": timezone.now().date(),
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(ORJSONRenderer().render(None), b"")
+
+    def test_large_responses_are_compressed_when_accepted(self):
+        """Test that a large response is gzipped for clients accepting gzip and sent as is otherwise."""
+        response = self.client.get("/api/orders/", {"since": "all"}, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(json.loads(gzip.decompress(response.content))["total_objects"], 30)
+
+        response = self.client.get("/api/orders/", {"since": "all"}, HTTP_ACCEPT_ENCODING="gzip;q=0, identity")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response.json()["total_objects"], 30)
+
+    def test_small_responses_are_not_compressed(self):
+        """Test that responses under COMPRESSION_MIN_SIZE are sent uncompressed."""
+        order = Order.objects.first()
+        response = self.client.get(f"/api/orders/{order.id}/", {"fields": "id"}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response.json(), {"id": order.id})
+
+
+class OrderExportTestCase(TestCase):
+    def setUp(self):
+        """Set up two restaurants with orders, one of them without items."""
+        self.owner = CustomUserFactory()
+        self.restaurant = Restaurant.objects.create(owner=self.owner, name="Export kitchen")
+        other = Restaurant.objects.create(owner=CustomUserFactory(), name="Other kitchen")
+        customer = CustomUserFactory()
+        menu_item = MenuItem.objects.create(name="Curry, hot", price=Decimal("9.50"))
+        start = timezone.now() - timedelta(days=3)
+        self.orders = Order.objects.bulk_create([
+            Order(customer=customer, restaurant=self.restaurant, status=order_status, total_price=Decimal("19.00"),
+                  created_at=start + timedelta(days=day))
+            for day, order_status in enumerate(["delivered", "canceled", "pending"])
+        ] + [Order(customer=customer, restaurant=other, total_price=Decimal("9.50"), created_at=start)])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, menu_item=menu_item, quantity=quantity, price=Decimal("9.50") * quantity)
+            for order in (self.orders[0], self.orders[2], self.orders[3]) for quantity in (1, 2)
+        ])
+        self.start = start
+
+    def export(self, user, **params):
+        return self.client.get("/api/orders/export/", params,
+                               HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+
+    def content(self, response):
+        return b"".join(response.streaming_content).decode()
+
+    def test_owner_exports_their_orders_as_csv(self):
+        """Test that an owner's CSV export has one line per item of their restaurant's orders only."""
+        response = self.export(self.owner)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertIn("attachment;", response["Content-Disposition"])
+        rows = list(csv.DictReader(StringIO(self.content(response))))
+        self.assertEqual(list(rows[0]), CSV_HEADER)
+        self.assertEqual([int(row["order_id"]) for row in rows], [self.orders[0].id] * 2 + [self.orders[1].id] +
+                         [self.orders[2].id] * 2)
+        self.assertEqual((rows[0]["item_menu_item"], rows[0]["item_quantity"], rows[0]["item_price"]),
+                         ("Curry, hot", "1", "9.50"))
+        self.assertEqual(rows[2]["item_id"], "")
+
+    def test_ndjson_export_groups_items_per_order(self):
+        """Test that the NDJSON export has one line per order with its items."""
+        response = self.export(self.owner, format="ndjson", status="delivered,canceled")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        orders = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([order["id"] for order in orders], [self.orders[0].id, self.orders[1].id])
+        self.assertEqual([item["quantity"] for item in orders[0]["items"]], [1, 2])
+        self.assertEqual(orders[0]["total_price"], "19.00")
+        self.assertEqual(orders[1]["items"], [])
+
+    def test_date_range_filter(self):
+        """Test that `from` is inclusive and `to` exclusive."""
+        response = self.export(self.owner, format="ndjson", **{
+            "from": (self.start + timedelta(days=1)).isoformat(), "to": (self.start + timedelta(days=2)).isoformat(),
+        })
+        self.assertEqual([json.loads(line)["id"] for line in self.content(response).splitlines()], [self.orders[1].id])
+
+    def test_admin_exports_every_restaurant(self):
+        """Test that admins export all orders, or one restaurant's with `restaurant`."""
+        admin = CustomUserFactory(is_staff=True)
+        lines = self.content(self.export(admin, format="ndjson")).splitlines()
+        self.assertEqual(len(lines), 4)
+        lines = self.content(self.export(admin, format="ndjson", restaurant=self.orders[3].restaurant_id)).splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in lines], [self.orders[3].id])
+
+    def test_export_is_refused_to_other_users(self):
+        """Test that customers and anonymous users cannot export orders."""
+        self.assertEqual(self.export(CustomUserFactory()).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get("/api/orders/export/").status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_invalid_filters_are_rejected(self):
+        """Test that unknown statuses, formats and malformed dates are answered with 400."""
+        for params in ({"status": "lost"}, {"format": "xml"}, {"from": "yesterday"}, {"to": "2024-02-30"}):
+            response = self.export(self.owner, **params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn("error", response.json())
+
+    def test_archived_orders_are_exported_in_order(self):
+        """Test that orders moved to the archive are still exported, in creation order with the live ones."""
+        Order.objects.filter(pk=self.orders[0].pk).update(status="completed")
+        self.assertEqual(archive_batch(timezone.now() + timedelta(minutes=1)), 2)
+        rows = list(csv.DictReader(StringIO(self.content(self.export(self.owner)))))
+        self.assertEqual([int(row["order_id"]) for row in rows], [self.orders[0].id] * 2 + [self.orders[1].id] +
+                         [self.orders[2].id] * 2)
+        self.assertEqual([row["item_quantity"] for row in rows[:2]], ["1", "2"])
+        response = self.export(self.owner, format="ndjson", status="completed")
+        self.assertEqual([json.loads(line)["id"] for line in self.content(response).splitlines()], [self.orders[0].id])
+
+    def test_rows_are_read_through_a_chunked_cursor(self):
+        """Test that the export is a single query per table, whatever the number of orders."""
+        with CaptureQueriesContext(connection) as queries:
+            self.content(self.export(self.owner))
+        export_queries = [query["sql"] for query in queries.captured_queries
+                          if "orders_orderitem" in query["sql"]
+                          and not any(marker in query["sql"] for marker in ("silk_", "EXPLAIN"))]
+        self.assertEqual(len(export_queries), 1)
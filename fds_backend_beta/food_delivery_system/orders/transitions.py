@@ -0,0 +1,145 @@
+"""
+Optimistic-concurrency updates of orders.
+
+An order is never locked while a request validates its input. The change is applied with a
+single conditional UPDATE (``WHERE id = ... AND version = ...``) that also bumps the version,
+a writer that lost the race updates no row and gets a 409 instead of waiting on a lock.
+"""
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from food_delivery_system.orders.history import refresh_order_history
+from food_delivery_system.orders.models import Order
+from food_delivery_system.orders.outbox import ORDER_STATUS_CHANGED, ORDER_UPDATED, emit, emit_many, order_payload
+
+
+class OrderVersionConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The order was modified by another request, reload it and try again.'
+    default_code = 'conflict'
+
+
+class OrderPreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The order does not match the If-Match header, reload it and try again.'
+    default_code = 'precondition_failed'
+
+
+def parse_if_match(header, order):
+    """
+    Return the version the client expects from an ``If-Match`` header, ``None`` when the header
+    is absent or ``*``. A tag that does not match the current ETag of the order is rejected.
+    """
+    if not header or header.strip() == '*':
+        return None
+    tags = [tag.strip() for tag in header.split(',')]
+    tags = [tag[2:] if tag.startswith('W/') else tag for tag in tags]     # str.removeprefix is 3.9+
+    if order.etag not in tags:
+        raise OrderPreconditionFailed()
+    return order.version
+
+
+def validate_transition(order, new_status):
+    if not order.can_transition_to(new_status):
+        allowed = ', '.join(Order.STATUS_TRANSITIONS.get(order.status, [])) or 'none'
+        raise ValidationError({
+            'status': f"Cannot change status from '{order.status}' to '{new_status}'. Allowed: {allowed}."
+        })
+
+
+def update_order(order, changes, expected_version=None):
+    """
+    Apply ``changes`` (model field -> value) to ``order`` with a conditional UPDATE guarded by
+    ``expected_version`` (the version the caller read by default), refresh the order history
+    row, record the outbox event and return the order with the new values. Raises OrderVersionConflict when another
+    writer got there first.
+    """
+    if 'status' in changes:
+        validate_transition(order, changes['status'])
+
+    expected_version = order.version if expected_version is None else expected_version
+    previous_status = order.status
+    now = timezone.now()
+    if changes.get('status') == 'picked up' and previous_status != 'picked up':
+        changes = {**changes, 'ready_at': now}     # End of the kitchen's preparation time
+    with transaction.atomic():
+        updated = Order.objects.filter(pk=order.pk, version=expected_version).update(
+            **changes, version=F('version') + 1, updated_at=now,
+        )
+        if not updated:
+            raise OrderVersionConflict()
+
+        for name, value in changes.items():
+            setattr(order, name, value)
+        order.version = expected_version + 1
+        order.updated_at = now
+        # Queryset updates bypass the post_save signal that maintains the history row.
+        refresh_order_history([order.pk])
+        topic = ORDER_STATUS_CHANGED if order.status != previous_status else ORDER_UPDATED
+        emit(topic, order.pk, order_payload(order, previous_status=previous_status, version=order.version))
+    return order
+
+
+def bulk_transition(orders, new_status):
+    """
+    Move ``orders`` (an iterable of loaded orders) to ``new_status`` with a single UPDATE
+    conditioned on the version of each order, then refresh their history rows and record their
+    outbox events in the same transaction.
+
+    Returns ``{order_id: error}`` for the orders left unchanged: the transition is not allowed,
+    the order already has the status, or another writer changed it since it was read. The
+    orders that were moved get their new values.
+    """
+    errors = {}
+    eligible = {}
+    for order in orders:
+        if order.status == new_status:
+            errors[order.pk] = f"The order is already '{new_status}'."
+        elif not order.can_transition_to(new_status):
+            errors[order.pk] = f"Cannot change status from '{order.status}' to '{new_status}'."
+        else:
+            eligible[order.pk] = order
+    if not eligible:
+        return errors
+
+    by_version = defaultdict(list)
+    for order in eligible.values():
+        by_version[order.version].append(order.pk)
+    condition = reduce(or_, (Q(version=version, pk__in=ids) for version, ids in by_version.items()))
+
+    now = timezone.now()
+    changes = {'status': new_status}
+    if new_status == 'picked up':
+        changes['ready_at'] = now     # End of the kitchen's preparation time
+    with transaction.atomic():
+        updated = Order.objects.filter(condition).update(**changes, version=F('version') + 1, updated_at=now)
+        if updated != len(eligible):
+            # Some orders were changed concurrently, ours are the rows stamped by this UPDATE.
+            moved = set(Order.objects.filter(pk__in=eligible, updated_at=now, status=new_status)
+                        .values_list('pk', flat=True))
+            for pk in set(eligible) - moved:
+                errors[pk] = OrderVersionConflict.default_detail
+                del eligible[pk]
+
+        events = []
+        for order in eligible.values():
+            previous_status = order.status
+            for name, value in changes.items():
+                setattr(order, name, value)
+            order.version += 1
+            order.updated_at = now
+            events.append((
+                ORDER_STATUS_CHANGED, order.pk,
+                order_payload(order, previous_status=previous_status, version=order.version),
+            ))
+        # Queryset updates bypass the post_save signal that maintains the history rows.
+        refresh_order_history(eligible)
+        emit_many(events)
+    return errors
@@ -1,14 +1,21 @@
 from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
-from food_delivery_system.orders.views import OrderViewSet, OrderItemViewSet
+from food_delivery_system.orders.views import OrderViewSet, OrderItemViewSet, CategoryViewSet, kitchen_feed, export_orders
 
 urlpatterns = [
     # OrderViewSet endpoints
     path('', OrderViewSet.as_view({'get': 'list', 'post': 'create'}), name='order-list'),  # List and Create
     path('<int:pk>/', OrderViewSet.as_view({'get': 'retrieve', 'patch': 'update', 'delete': 'destroy'}), name='order-detail'),  # Retrieve, Update, Destroy orders
+    path('bulk-status/', OrderViewSet.as_view({'post': 'bulk_status'}), name='order-bulk-status'),  # Move a set of orders to one status
+    path('export/', export_orders, name='order-export'),  # Stream orders and their items as CSV or NDJSON
+    path('feed/<int:restaurant_id>/', kitchen_feed, name='order-kitchen-feed'),  # Server-sent events of the restaurant's orders
 
     # OrderItemViewSet endpoints
     path('get-order-items/', OrderItemViewSet.as_view({'get': 'list'}), name='orderitem-list'),  # List
     path('get-order-items/<int:pk>/', OrderItemViewSet.as_view({'get': 'retrieve', 'patch': 'update', 'delete': 'destroy'}), name='orderitem-detail'),  # Retrieve, Update, Destroy order-items
+
+    # CategoryViewSet endpoints
+    path('categories/', CategoryViewSet.as_view({'get': 'list'}), name='category-list'),  # List
+    path('categories/<int:pk>/', CategoryViewSet.as_view({'get': 'retrieve'}), name='category-detail'),  # Retrieve
 ]
 
@@ -2,13 +2,26 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+
 from django.utils import timezone
 from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
-from rest_framework.exceptions import PermissionDenied, NotFound
-from .models import Order, OrderItem, Staff, Category
+from rest_framework.exceptions import APIException, NotAuthenticated, PermissionDenied, NotFound, ValidationError
+from .archive import ARCHIVED_STATUSES
+from .export import EXPORT_FORMATS, filter_orders, stream_export
+from .feed import order_feed, stream_events
+from .models import ArchivedOrder, Order, OrderItem, Staff, Category, CustomerOrderHistory
+from .idempotency import (IDEMPOTENCY_HEADER, REPLAYED_HEADER, IdempotencyKeyReused, claim_idempotency_key,
+                          request_fingerprint, store_idempotent_response)
+from .outbox import ORDER_CREATED, ORDER_DELETED, emit, order_payload
+from .transitions import (OrderPreconditionFailed, OrderVersionConflict, bulk_transition, parse_if_match,
+                          update_order)
 from food_delivery_system.serializers.serializer import (OrderSerializer, OrderItemSerializer,
-                                                        StaffSerializer, CategorySerializer
+                                                        StaffSerializer, CategorySerializer,
+                                                        CustomerOrderHistorySerializer, BulkOrderStatusSerializer
                                                         )
 from food_delivery_system.permissions.permission import (
                                                         IsRestaurantOwner, IsRestaurantManagerOrOwner,
@@ -24,26 +37,31 @@ from rest_framework.mixins import ListModelMixin, RetrieveModelMixin, CreateMode
 from rest_framework.viewsets import GenericViewSet
 from django.utils import timezone
 from django.db import transaction
+from django.db.models import Q
 from food_delivery_system.restaurant.models import Restaurant
 from food_delivery_system.serializers.serializer import RestaurantSerializer
 from food_delivery_system.utils.pagination import CustomPagination
+from food_delivery_system.utils.auth_context import ContextJWTAuthentication
+from food_delivery_system.utils.conditional import ConditionalGetMixin
+from food_delivery_system.utils.dates import parse_moment
+from food_delivery_system.utils.prefetch import PrefetchPlanMixin
 from food_delivery_system.utils.utilities import UserPermissions
 
 
 user_auth = UserPermissions()
 
-class OrderViewSet(ListModelMixin, RetrieveModelMixin, CreateModelMixin, GenericViewSet):
+class OrderViewSet(PrefetchPlanMixin, ListModelMixin, RetrieveModelMixin, CreateModelMixin, GenericViewSet):
     queryset = Order.objects.all().order_by('-created_at')
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = CustomPagination
+    cursor_ordering = ('-created_at', '-id')  # Keyset pagination with `?cursor=`
 
     def get_queryset(self):
         """
         Override the get_queryset method to filter the orders based on the user role.
         """
         user = self.request.user
-        import ipdb;ipdb.set_trace()
         # If the user is a not a customer, deny access to the orders.
         if hasattr(user, 'staff') and user.staff.role in ['manager', 'chef', 'delivery']:
             # Staff members should not access orders directly
@@ -53,8 +71,28 @@ class OrderViewSet(ListModelMixin, RetrieveModelMixin, CreateModelMixin, Generic
         if not user.is_staff and not user.is_superuser:
             return Order.objects.filter(customer=user).order_by('-created_at')
 
-        # Admins and superusers can access all orders
-        return Order.objects.all().order_by('-created_at')
+        # Admins and superusers can access all orders, the list defaults to the recent and open ones
+        orders = Order.objects.all().order_by('-created_at')
+        if self.action == 'list':
+            orders = self.restrict_to_window(orders)
+        return orders
+
+    def restrict_to_window(self, orders):
+        """
+        Limit a listing to orders placed since `?since=` (ISO date or datetime, `all` for no
+        limit). By default: orders placed within `ORDER_LIST_WINDOW`, and older orders that are
+        still open (any status but completed or canceled, see orders/archive.py), which never
+        leave the list. Older finished orders need `?since=`.
+        """
+        since = self.request.query_params.get('since')
+        if since == 'all':
+            return orders
+        if since is None:
+            recent = Q(created_at__gte=timezone.now() - settings.ORDER_LIST_WINDOW)
+            return orders.filter(recent | ~Q(status__in=ARCHIVED_STATUSES))
+
+        expected = 'an ISO 8601 date or datetime, or "all"'
+        return orders.filter(created_at__gte=parse_moment('since', since, expected=expected))
 
     def get_permissions(self):
         """
@@ -63,12 +101,48 @@ class OrderViewSet(ListModelMixin, RetrieveModelMixin, CreateModelMixin, Generic
         # Use custom permissions logic
         custom_permissions = user_auth.get_permissions(self)
 
-        # If no custom permissions are returned, fall back to the default DRF logic
-        if not custom_permissions:
+        # If no custom permission classes are returned, fall back to the default DRF logic
+        if not isinstance(custom_permissions, list):
             return super().get_permissions()
         
         return custom_permissions  # run through custom permissions defined in utilities
 
+    def list(self, request, *args, **kwargs):
+        """
+        List orders, customers read their pre-rendered order history with a single indexed query.
+        """
+        self.get_queryset()  # Enforces the role checks for staff members
+        user = request.user
+        if user.is_staff or user.is_superuser:
+            return super().list(request, *args, **kwargs)
+
+        history = CustomerOrderHistory.objects.filter(customer=user).order_by('-created_at', '-id')
+        page = self.paginate_queryset(history)
+        context = self.get_serializer_context()
+        if page is not None:
+            return self.get_paginated_response(CustomerOrderHistorySerializer(page, many=True, context=context).data)
+        return Response(CustomerOrderHistorySerializer(history, many=True, context=context).data)
+
+    def create(self, request, *args, **kwargs):
+        """
+        Create an order. With an `Idempotency-Key` header the response is stored with the order,
+        so a retried submission replays it instead of placing a duplicate order.
+        """
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key or not request.user.is_authenticated:
+            return super().create(request, *args, **kwargs)
+
+        try:
+            with transaction.atomic():
+                record = claim_idempotency_key(request.user, key, request_fingerprint(request))
+                if record is not None:
+                    return Response(record.response, status=record.status_code, headers={REPLAYED_HEADER: 'true'})
+                response = super().create(request, *args, **kwargs)
+                store_idempotent_response(request.user, key, response)
+                return response
+        except IdempotencyKeyReused as exc:
+            return Response({'error': exc.detail}, status=exc.status_code)
+
     @transaction.atomic
     def perform_create(self, serializer):
         """
@@ -77,36 +151,84 @@ class OrderViewSet(ListModelMixin, RetrieveModelMixin, CreateModelMixin, Generic
         if not self.request.user or not self.request.user.is_authenticated:
             raise PermissionDenied("You must be logged in to create an order.")
 
-        serializer.save(customer=self.request.user, created_at=timezone.now(), updated_at=timezone.now())
+        order = serializer.save(customer=self.request.user, created_at=timezone.now(), updated_at=timezone.now())
+        emit(ORDER_CREATED, order.id, order_payload(order))
 
     def retrieve(self, request, *args, **kwargs):
         try:
             instance = self.get_object()
             self.check_object_permissions(request, instance)
             serializer = self.get_serializer(instance)
-            return Response(serializer.data)
+            return Response(serializer.data, headers={'ETag': instance.etag})
         except PermissionDenied:
             return Response({'error': 'You do not have permission to view this order.'}, status=status.HTTP_403_FORBIDDEN)
         except NotFound:
             return Response({'error': 'Order not found.'}, status=status.HTTP_404_NOT_FOUND)
     
-    @transaction.atomic
     def update(self, request, *args, **kwargs):
         """
         Update an order(partial) with permission checks.
+
+        No row lock is taken: the change is applied with a conditional UPDATE on the version the
+        request read (or the one named by `If-Match`), a concurrent writer gets a 409 instead.
         """
         try:
-            instance = self.get_queryset().select_for_update().get(pk=kwargs["pk"])  # Lock the row for update, to prevent race conditions.
+            instance = self.get_queryset().get(pk=kwargs["pk"])
             self.check_object_permissions(request, instance)
+            expected_version = parse_if_match(request.headers.get("If-Match"), instance)
             serializer = self.get_serializer(instance, data=request.data, partial=True)
             serializer.is_valid(raise_exception=True)
-            serializer.save(updated_at=timezone.now())
-            return Response({"message": "Order updated successfully.", "results": serializer.data}, status=status.HTTP_200_OK)
+            changes = {name: value for name, value in serializer.validated_data.items() if name != "items"}
+            update_order(instance, changes, expected_version)
+            return Response(
+                {"message": "Order updated successfully.", "results": self.get_serializer(instance).data},
+                status=status.HTTP_200_OK, headers={'ETag': instance.etag},
+            )
         except PermissionDenied:
             return Response({'error': 'You do not have permission to update this Order.'}, status=status.HTTP_403_FORBIDDEN)
-        except NotFound:
+        except (NotFound, Order.DoesNotExist):
             return Response({'error': 'Order not found.'}, status=status.HTTP_404_NOT_FOUND)
+        except (OrderVersionConflict, OrderPreconditionFailed) as exc:
+            return Response({'error': exc.detail}, status=exc.status_code)
     
+    def bulk_status(self, request, *args, **kwargs):
+        """
+        Move a set of orders to one status, e.g. a courier handing off a round or a kitchen
+        closing out a batch. The permission for the target status is checked once for the whole
+        set (`can_mark_delivered` for delivered, `can_update_order_status` otherwise), the orders
+        are moved with a single UPDATE and the result is reported per order.
+        """
+        serializer = BulkOrderStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        order_ids = serializer.validated_data['orders']
+        new_status = serializer.validated_data['status']
+
+        permission = 'orders.can_mark_delivered' if new_status == 'delivered' else 'orders.can_update_order_status'
+        user = request.user
+        if not (user.is_staff or user.is_superuser or user.has_perm(permission)):
+            return Response({'error': f"You do not have permission to mark orders as '{new_status}'."},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        # Staff members and owners only reach the orders of their own restaurant.
+        orders = Order.objects.filter(pk__in=order_ids)
+        if not (user.is_staff or user.is_superuser):
+            orders = orders.filter(Q(restaurant__staff__user=user) | Q(restaurant__owner=user))
+        orders = {order.pk: order for order in orders}
+
+        errors = bulk_transition(orders.values(), new_status)
+        results = []
+        for order_id in order_ids:
+            if order_id not in orders:
+                results.append({'id': order_id, 'updated': False, 'error': 'Order not found.'})
+            elif order_id in errors:
+                results.append({'id': order_id, 'updated': False, 'error': errors[order_id]})
+            else:
+                order = orders[order_id]
+                results.append({'id': order_id, 'updated': True, 'status': order.status, 'version': order.version})
+        return Response(
+            {'updated': sum(result['updated'] for result in results), 'results': results}, status=status.HTTP_200_OK,
+        )
+
     # @action(detail=True, methods=['delete'])    # overriding the as_view method in orders/urls
     @transaction.atomic
     def destroy(self, request, *args, **kwargs):
@@ -116,6 +238,7 @@ class OrderViewSet(ListModelMixin, RetrieveModelMixin, CreateModelMixin, Generic
         try:
             instance = self.get_object()
             self.check_object_permissions(request, instance)
+            emit(ORDER_DELETED, instance.id, order_payload(instance))
             instance.delete()
             return Response({"message": "Order deleted successfully."}, status=status.HTTP_204_NO_CONTENT)
         except PermissionDenied:
@@ -125,11 +248,12 @@ class OrderViewSet(ListModelMixin, RetrieveModelMixin, CreateModelMixin, Generic
 
 
 
-class OrderItemViewSet(ListModelMixin, RetrieveModelMixin, CreateModelMixin, GenericViewSet):
+class OrderItemViewSet(PrefetchPlanMixin, ListModelMixin, RetrieveModelMixin, CreateModelMixin, GenericViewSet):
     queryset = OrderItem.objects.all().order_by('id')
     serializer_class = OrderItemSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = CustomPagination
+    cursor_ordering = ('-order_id', '-id')  # Keyset pagination with `?cursor=`
 
     def get_queryset(self):
         """
@@ -166,7 +290,7 @@ class OrderItemViewSet(ListModelMixin, RetrieveModelMixin, CreateModelMixin, Gen
             return Response({'error': 'Order item not found.'}, status=status.HTTP_404_NOT_FOUND)
 
 
-class StaffViewSet(viewsets.ModelViewSet):
+class StaffViewSet(PrefetchPlanMixin, viewsets.ModelViewSet):
     queryset = Staff.objects.all().order_by('id')
     serializer_class = StaffSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -201,11 +325,13 @@ class StaffViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Staff member not found.'}, status=status.HTTP_404_NOT_FOUND)
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ConditionalGetMixin, PrefetchPlanMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all().order_by('id')
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = CustomPagination
+    # The restaurant and its owner are rendered nested
+    conditional_fields = ('updated_at', 'restaurant__updated_at', 'restaurant__owner_id')
 
     def get_permissions(self):
         """
@@ -235,3 +361,100 @@ class CategoryViewSet(viewsets.ModelViewSet):
         except NotFound:
             return Response({'error': 'Category not found.'}, status=status.HTTP_404_NOT_FOUND)
     
+
+
+KITCHEN_FEED_ROLES = ('chef', 'manager')
+
+
+def authorize_kitchen_feed(request, restaurant_id):
+    """
+    Authenticate the JWT of a kitchen feed request and check the user cooks or manages at the
+    restaurant.
+    """
+    authenticated = ContextJWTAuthentication().authenticate(request)
+    if authenticated is None:
+        raise NotAuthenticated()
+    user = authenticated[0]
+    if not user.is_superuser and not Staff.objects.filter(
+        user=user, restaurant_id=restaurant_id, role__in=KITCHEN_FEED_ROLES
+    ).exists():
+        raise PermissionDenied("Only the restaurant's chefs and managers can follow its kitchen feed.")
+    return user
+
+
+async def kitchen_feed(request, restaurant_id):
+    """
+    Stream new and changed orders of a restaurant as server-sent events, resuming after
+    `Last-Event-ID` when the client reconnects.
+    """
+    try:
+        await sync_to_async(authorize_kitchen_feed)(request, restaurant_id)
+    except APIException as exc:
+        return JsonResponse({'error': exc.detail}, status=exc.status_code)
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    # Subscribe before reading the backlog, so no event falls in between.
+    queue = order_feed.subscribe(restaurant_id)
+    backlog = order_feed.replay(restaurant_id, last_event_id) if last_event_id else []
+    if backlog is None:
+        backlog = await sync_to_async(order_feed.catch_up)(restaurant_id, last_event_id)
+
+    response = StreamingHttpResponse(stream_events(order_feed, restaurant_id, queue, backlog),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def authorize_order_export(request):
+    """
+    Authenticate the JWT of an export request and return the restaurant whose orders the user
+    may export, None for admins, who export every restaurant's.
+    """
+    authenticated = ContextJWTAuthentication().authenticate(request)
+    if authenticated is None:
+        raise NotAuthenticated()
+    user = authenticated[0]
+    if user.is_staff or user.is_superuser:
+        return None
+    restaurant = Restaurant.objects.filter(owner=user).first()
+    if restaurant is None:
+        raise PermissionDenied("Only restaurant owners and admins can export orders.")
+    return restaurant
+
+
+def export_orders(request):
+    """
+    Stream the orders, archived ones included, and their items of the owner's restaurant (of
+    every restaurant, or of `?restaurant=`, for admins) as CSV or NDJSON (`?format=csv|ndjson`), filtered by creation
+    date (`?from=` inclusive, `?to=` exclusive) and `?status=` (comma separated).
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': f'Method "{request.method}" not allowed.'},
+                            status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    try:
+        restaurant = authorize_order_export(request)
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({'format': f'Expected one of: {", ".join(EXPORT_FORMATS)}.'})
+        if restaurant is not None:
+            scope = {'restaurant': restaurant}
+        elif request.GET.get('restaurant'):
+            if not request.GET['restaurant'].isdigit():
+                raise ValidationError({'restaurant': 'Expected a restaurant id.'})
+            scope = {'restaurant_id': request.GET['restaurant']}
+        else:
+            scope = {}
+        orders = filter_orders(Order.objects.filter(**scope), request.GET)
+        archived_orders = filter_orders(ArchivedOrder.objects.filter(**scope), request.GET)
+    except APIException as exc:
+        return JsonResponse({'error': exc.detail}, status=exc.status_code)
+
+    scope = f'restaurant-{restaurant.id}' if restaurant is not None else 'all'
+    filename = f'orders-{scope}-{timezone.now():%Y%m%d%H%M%S}.{export_format}'
+    response = StreamingHttpResponse(stream_export(orders, export_format, archived_orders),
+                                     content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'no-store'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,200 @@
+"""
+Permission checks as bitwise ANDs.
+
+Every permission the models declare (the default add/change/delete/view ones and their
+`Meta.permissions`) gets a bit, in a catalogue compiled when the users app is ready, together
+with the bitsets of the roles of `RBACPermissionManager.role_permissions_map`. A user's
+effective permissions (their own and their groups') are read once as a bitset, then kept in
+process and in the shared cache under the user's `permission_version`. `BitsetPermissionBackend`
+answers `user.has_perm()` from it, on the REST and GraphQL paths alike, without queries. The
+cache keys hold a digest of the catalogue: bitsets cached before a deploy adding or removing
+permissions, which renumbers the bits, are not read by the new code.
+
+Adding or removing permissions or groups of a user, or permissions of a group, gives the users
+concerned a new permission version, so their cached bitsets are never read again. Versions are
+random rather than incremented: the version of a change that is rolled back is not reused by
+the next one, whose bitset could otherwise be served from a bitset cached within the rolled
+back transaction (and likewise for the first version of a user whose id is reused).
+"""
+import hashlib
+from functools import lru_cache
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, pre_delete
+from django.dispatch import Signal, receiver
+
+from food_delivery_system.users.models import new_permission_version
+
+User = get_user_model()
+
+# ``app_label.codename`` -> bit, and back
+PERMISSION_BITS = {}
+PERMISSION_NAMES = []
+# role of the role map -> bits of its permissions
+ROLE_BITS = {}
+# Digest of the catalogue, keys the cached bitsets: adding or removing a permission renumbers the bits
+CATALOGUE_DIGEST = ""
+
+# Sent with ``user_ids`` once the new permission versions of these users are committed
+permission_version_changed = Signal()
+
+
+def compile_permissions():
+    """
+    Number the permissions declared by the installed models and compile the role map into
+    bitsets. Called when the users app is ready.
+    """
+    from food_delivery_system.utils.utilities import RBACPermissionManager
+
+    global CATALOGUE_DIGEST
+    names = set()
+    for model in apps.get_models():
+        opts = model._meta
+        names.update(f"{opts.app_label}.{action}_{opts.model_name}" for action in opts.default_permissions)
+        names.update(f"{opts.app_label}.{codename}" for codename, _ in opts.permissions)
+    PERMISSION_NAMES[:] = sorted(names)
+    PERMISSION_BITS.clear()
+    PERMISSION_BITS.update((name, 1 << position) for position, name in enumerate(PERMISSION_NAMES))
+    CATALOGUE_DIGEST = hashlib.sha1("\n".join(PERMISSION_NAMES).encode()).hexdigest()[:12]
+
+    # The role map lists bare codenames
+    by_codename = {}
+    for name in PERMISSION_NAMES:
+        by_codename.setdefault(name.partition(".")[2], []).append(name)
+    ROLE_BITS.clear()
+    for role, config in RBACPermissionManager.role_permissions_map.items():
+        bits = 0
+        for codename in config["permissions"]:
+            if len(by_codename.get(codename, [])) != 1:
+                raise ImproperlyConfigured(f"Role '{role}': no single permission with codename '{codename}'.")
+            bits |= PERMISSION_BITS[by_codename[codename][0]]
+        ROLE_BITS[role] = bits
+
+
+def bits_of(names):
+    """The bitset of permission names, names outside the catalogue are left out."""
+    bits = 0
+    for name in names:
+        bits |= PERMISSION_BITS.get(name, 0)
+    return bits
+
+
+def names_of(bits):
+    return {name for name, bit in PERMISSION_BITS.items() if bits & bit}
+
+
+def bits_key(user_id, version, digest):
+    return f"perm-bits:{digest}:{user_id}:v{version}"
+
+
+def load_permission_bits(user_id):
+    """The bitset of a user's own and group permissions, read from the database."""
+    permissions = Permission.objects.filter(
+        Q(**{User._meta.get_field("user_permissions").related_query_name(): user_id})
+        | Q(**{f"group__{User._meta.get_field('groups').related_query_name()}": user_id})
+    )
+    return bits_of(f"{app_label}.{codename}" for app_label, codename
+                   in permissions.values_list("content_type__app_label", "codename").distinct())
+
+
+@lru_cache(maxsize=settings.PERMISSION_BITS_CACHE_SIZE)
+def cached_permission_bits(user_id, version, digest):
+    """
+    The bitset of a user at a permission version, numbered by the catalogue of ``digest``, from
+    the shared cache or the database. Kept in process too: the bitset of a version never changes.
+    """
+    key = bits_key(user_id, version, digest)
+    bits = cache.get(key)
+    if bits is None:
+        bits = load_permission_bits(user_id)
+        cache.set(key, bits, settings.PERMISSION_BITS_TIMEOUT)
+    return bits
+
+
+def user_permission_bits(user):
+    """The permission bitset of a user instance, remembered on the instance."""
+    bits = getattr(user, "_perm_bits", None)
+    if bits is None:
+        bits = user._perm_bits = cached_permission_bits(user.pk, user.permission_version, CATALOGUE_DIGEST)
+    return bits
+
+
+def bump_permission_version(users):
+    """
+    Give the users of a queryset a new permission version, announced once the transaction
+    commits.
+    """
+    user_ids = list(users.values_list("pk", flat=True))
+    if not user_ids:
+        return
+    User.objects.filter(pk__in=user_ids).update(permission_version=new_permission_version())
+    transaction.on_commit(lambda: permission_version_changed.send(sender=User, user_ids=user_ids))
+
+
+def _bump_instance(user):
+    bump_permission_version(User.objects.filter(pk=user.pk))
+    user.refresh_from_db(fields=["permission_version"])
+    user.__dict__.pop("_perm_bits", None)
+
+
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=User.groups.through)
+def bump_on_user_permissions_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # user.user_permissions / user.groups
+        if action in ("post_add", "post_remove", "post_clear"):
+            _bump_instance(instance)
+        return
+    # permission.customuser_permissions_set / group.customuser_set
+    field = "user_permissions" if isinstance(instance, Permission) else "groups"
+    if action in ("post_add", "post_remove"):
+        bump_permission_version(User.objects.filter(pk__in=pk_set))
+    elif action == "pre_clear":
+        bump_permission_version(User.objects.filter(**{field: instance}))
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def bump_on_group_permissions_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse and action in ("post_add", "post_remove", "post_clear"):
+        # group.permissions
+        bump_permission_version(User.objects.filter(groups=instance))
+    elif reverse and action in ("post_add", "post_remove"):
+        # permission.group_set
+        bump_permission_version(User.objects.filter(groups__in=pk_set))
+    elif reverse and action == "pre_clear":
+        bump_permission_version(User.objects.filter(groups__permissions=instance))
+
+
+@receiver(pre_delete, sender=Group)
+def bump_on_group_delete(sender, instance, **kwargs):
+    bump_permission_version(User.objects.filter(groups=instance))
+
+
+class BitsetPermissionBackend(ModelBackend):
+    """
+    ModelBackend answering the permission checks from the user's permission bitset. Permissions
+    outside the catalogue (created by hand in the database) are looked up by ModelBackend.
+    """
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if user_obj.is_superuser:
+            return set(PERMISSION_NAMES)
+        return names_of(user_permission_bits(user_obj))
+
+    def has_perm(self, user_obj, perm, obj=None):
+        bit = PERMISSION_BITS.get(perm)
+        if bit is None:
+            return user_obj.is_active and perm in super().get_all_permissions(user_obj, obj)
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return False
+        return user_obj.is_superuser or bool(user_permission_bits(user_obj) & bit)
@@ -5,6 +5,18 @@ class CanMarkDeliveredPermission(permissions.BasePermission):
         return request.user.has_perm('orders.can_mark_delivered')
 
 
+class CanViewAnalyticsPermission(permissions.BasePermission):
+    """Allows access to the analytics of the user's own restaurant, given `can_view_analytics`."""
+
+    def has_permission(self, request, view):
+        return request.user.has_perm('restaurant.can_view_analytics')
+
+    def has_object_permission(self, request, view, obj):
+        if request.user.is_superuser:
+            return True
+        return request.user == obj.owner or obj.staff.filter(user=request.user).exists()
+
+
 class IsRestaurantOwner(permissions.BasePermission):
     """Allows access only to restaurant owners or admin users."""
 
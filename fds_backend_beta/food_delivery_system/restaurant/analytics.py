@@ -0,0 +1,142 @@
+"""
+Hourly and daily order rollups per restaurant.
+
+Rollups are never read-modify-written: whenever an order changes, the outbox worker recomputes
+the hour and the day the order was placed in, for its restaurant only, from the order tables
+(an index range on (restaurant, created_at)). Orders moved to the archive (see orders/archive.py)
+are read from the archive tables, so recomputing a bucket does not lose them. The analytics
+endpoint then reads the rollup tables and never aggregates over the orders.
+"""
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+import numpy as np
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from food_delivery_system.orders.models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+from food_delivery_system.orders.outbox import (ORDER_CREATED, ORDER_DELETED, ORDER_STATUS_CHANGED, ORDER_UPDATED,
+                                                register_handler)
+from food_delivery_system.restaurant.models import RestaurantDailyStats, RestaurantHourlyStats
+
+ROLLUP_FIELDS = [
+    "order_count", "status_counts", "revenue", "average_basket", "basket_size_p50", "basket_size_p90",
+    "prep_time_p50", "prep_time_p90", "top_items", "updated_at",
+]
+TOP_ITEMS = 5
+
+# Live and archived orders with their items, and the item column pruning the archive partitions
+ORDER_TABLES = [
+    (Order, OrderItem, None),
+    (ArchivedOrder, ArchivedOrderItem, "order_created_at"),
+]
+
+GRANULARITIES = {
+    "hourly": (RestaurantHourlyStats, timedelta(hours=1)),
+    "daily": (RestaurantDailyStats, timedelta(days=1)),
+}
+
+
+def bucket_start(moment, granularity):
+    moment = moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if granularity == "daily" else moment
+
+
+def percentiles(values, quantiles=(50, 90)):
+    if not len(values):
+        return [None] * len(quantiles)
+    return [float(value) for value in np.percentile(values, quantiles)]
+
+
+def compute_rollup(restaurant_id, start, end):
+    """
+    Statistics of the orders, live or archived, placed at the restaurant in ``[start, end)``,
+    ``None`` when there are none.
+    """
+    orders, items = [], []
+    for order_model, item_model, created_column in ORDER_TABLES:
+        rows = list(
+            order_model.objects.filter(restaurant_id=restaurant_id, created_at__gte=start, created_at__lt=end)
+            .values_list("id", "status", "total_price", "created_at", "ready_at")
+        )
+        if not rows:
+            continue
+        orders += rows
+        order_items = item_model.objects.filter(order_id__in=[row[0] for row in rows])
+        if created_column:
+            order_items = order_items.filter(**{f"{created_column}__gte": start, f"{created_column}__lt": end})
+        items += order_items.values_list("order_id", "menu_item_id", "menu_item__name", "quantity")
+    if not orders:
+        return None
+    ids, statuses, totals, created, ready = zip(*orders)
+
+    statuses = np.array(statuses)
+    kept = statuses != "canceled"
+    status_names, status_counts = np.unique(statuses, return_counts=True)
+    revenue = sum((total for total, keep in zip(totals, kept) if keep), Decimal("0"))
+    kept_count = int(kept.sum())
+
+    sizes = Counter()
+    for order_id, _, _, quantity in items:
+        sizes[order_id] += quantity
+    basket_sizes = np.array([sizes.get(order_id, 0) for order_id in ids], dtype=float)[kept]
+
+    placed = np.array([moment.timestamp() for moment in created])
+    picked_up = np.array([moment.timestamp() if moment else np.nan for moment in ready])
+    prep_times = (picked_up - placed)[~np.isnan(picked_up)]
+
+    kept_ids = {order_id for order_id, keep in zip(ids, kept) if keep}
+    quantities, names = Counter(), {}
+    for order_id, menu_item_id, name, quantity in items:
+        if order_id in kept_ids:
+            quantities[menu_item_id] += quantity
+            names[menu_item_id] = name
+    top_items = sorted(quantities.items(), key=lambda item: (-item[1], item[0]))[:TOP_ITEMS]
+
+    basket_p50, basket_p90 = percentiles(basket_sizes)
+    prep_p50, prep_p90 = percentiles(prep_times)
+    return {
+        "order_count": len(ids),
+        "status_counts": {str(name): int(count) for name, count in zip(status_names, status_counts)},
+        "revenue": revenue,
+        "average_basket": (revenue / kept_count).quantize(Decimal("0.01")) if kept_count else Decimal("0"),
+        "basket_size_p50": basket_p50,
+        "basket_size_p90": basket_p90,
+        "prep_time_p50": prep_p50,
+        "prep_time_p90": prep_p90,
+        "top_items": [
+            {"menu_item_id": menu_item_id, "name": names[menu_item_id], "quantity": quantity}
+            for menu_item_id, quantity in top_items
+        ],
+        "updated_at": timezone.now(),
+    }
+
+
+def refresh_rollups(restaurant_id, moment, granularities=tuple(GRANULARITIES)):
+    """
+    Recompute the rollups (hourly and daily by default) of the restaurant containing ``moment``.
+    """
+    for granularity in granularities:
+        model, length = GRANULARITIES[granularity]
+        start = bucket_start(moment, granularity)
+        values = compute_rollup(restaurant_id, start, start + length)
+        if values is None:
+            model.objects.filter(restaurant_id=restaurant_id, bucket=start).delete()
+            continue
+        model.objects.bulk_create(
+            [model(restaurant_id=restaurant_id, bucket=start, **values)],
+            update_conflicts=True, unique_fields=["restaurant", "bucket"], update_fields=ROLLUP_FIELDS,
+        )
+
+
+@register_handler(ORDER_CREATED)
+@register_handler(ORDER_UPDATED)
+@register_handler(ORDER_STATUS_CHANGED)
+@register_handler(ORDER_DELETED)
+def refresh_rollups_on_order_event(event):
+    payload = event.payload
+    created_at = payload.get("created_at")
+    if not created_at or not payload.get("restaurant"):
+        return
+    refresh_rollups(payload["restaurant"], parse_datetime(created_at))
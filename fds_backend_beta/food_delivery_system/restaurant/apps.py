@@ -5,3 +5,8 @@ class RestaurantConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'food_delivery_system.restaurant'
 
+
+    def ready(self):
+        # Registers the outbox handlers that keep the analytics rollups up to date, and the
+        # signals that invalidate the menu snapshots and refresh the search vectors
+        from food_delivery_system.restaurant import analytics, menu, search  # noqa: F401
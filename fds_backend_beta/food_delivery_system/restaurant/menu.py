@@ -0,0 +1,156 @@
+"""
+Pre-rendered, versioned menu snapshots.
+
+Every restaurant carries a `menu_version`, bumped by any save or delete of the restaurant, its
+categories or their menu items. The rendered menu is cached under the version it was built
+from. Serving a menu reads the current version from the restaurant row (a single-row primary
+key lookup) and the snapshot of that version from the cache. The version lives in the
+database rather than in the cache, which is per process unless `CACHES` points at a shared
+backend: once a change commits, every worker looks up a key that has not been rendered yet, so
+a stale snapshot is never served.
+
+Writes that bypass model signals (queryset updates, bulk inserts) must call
+`bump_menu_version` themselves, as `set_availability` does.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Prefetch
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from food_delivery_system.orders.feed import announce_menu_changes
+from food_delivery_system.orders.models import Category, MenuItem
+from food_delivery_system.restaurant.models import Restaurant
+
+
+def snapshot_key(restaurant_id, version):
+    return f"menu:{restaurant_id}:v{version}"
+
+
+def render_menu(restaurant_id):
+    """
+    Render the menu of a restaurant from the database, ``None`` when it does not exist.
+    """
+    restaurant = Restaurant.objects.filter(pk=restaurant_id).values(
+        "id", "name", "address", "phone", "menu_version",
+    ).first()
+    if restaurant is None:
+        return None
+    categories = Category.objects.filter(restaurant_id=restaurant_id).order_by("id").prefetch_related(
+        Prefetch("menu_items", queryset=MenuItem.objects.order_by("id"))
+    )
+    return {
+        "restaurant": {name: restaurant[name] for name in ("id", "name", "address", "phone")},
+        "version": restaurant["menu_version"],
+        "categories": [
+            {
+                "id": category.id,
+                "name": category.name,
+                "items": [
+                    {
+                        "id": item.id,
+                        "name": item.name,
+                        "description": item.description,
+                        "price": str(item.price),
+                        "available": item.available,
+                    }
+                    for item in category.menu_items.all()
+                ],
+            }
+            for category in categories
+        ],
+    }
+
+
+def menu_etag(restaurant_id, version):
+    return f'"menu-{restaurant_id}-{version}"'
+
+
+def current_menu_version(restaurant_id):
+    """The menu version of a restaurant from its row, ``None`` when it does not exist."""
+    return Restaurant.objects.filter(pk=restaurant_id).order_by().values_list("menu_version", flat=True).first()
+
+
+def get_menu(restaurant_id, version=None):
+    """
+    Return the menu snapshot of a restaurant, rendering and caching it on a miss. ``None`` when
+    the restaurant does not exist. ``version`` is its current version when the caller already
+    read it.
+    """
+    if version is None:
+        version = current_menu_version(restaurant_id)
+    if version is None:
+        return None
+    menu = cache.get(snapshot_key(restaurant_id, version))
+    if menu is not None:
+        return menu
+
+    menu = render_menu(restaurant_id)
+    if menu is None:
+        return None
+    cache.set(snapshot_key(restaurant_id, menu["version"]), menu, settings.MENU_SNAPSHOT_TIMEOUT)
+    return menu
+
+
+def bump_menu_version(restaurant_ids):
+    """
+    Invalidate the menu snapshots of the given restaurants. Readers see the new version once
+    the current transaction commits.
+    """
+    restaurant_ids = {restaurant_id for restaurant_id in restaurant_ids if restaurant_id is not None}
+    if not restaurant_ids:
+        return
+    Restaurant.objects.filter(pk__in=restaurant_ids).update(menu_version=F("menu_version") + 1)
+
+
+def set_availability(restaurant_id, menu_item_ids, available):
+    """
+    Mark menu items of the restaurant available or sold out with a single UPDATE, invalidate
+    the menu snapshot and announce the change to the menu feeds once the transaction commits.
+    Returns ``(changed ids, ids not on the restaurant's menu)``.
+    """
+    current = dict(
+        MenuItem.objects.filter(pk__in=menu_item_ids, category__restaurant_id=restaurant_id)
+        .values_list("id", "available")
+    )
+    changed = sorted(item_id for item_id, flag in current.items() if flag != available)
+    if changed:
+        with transaction.atomic():
+            MenuItem.objects.filter(pk__in=changed).update(available=available, updated_at=timezone.now())
+            # The feeds announce the change once the new version is committed, so clients
+            # reloading the menu get the new snapshot.
+            bump_menu_version([restaurant_id])
+            announce_menu_changes(restaurant_id, dict.fromkeys(changed, available))
+    return changed, [item_id for item_id in menu_item_ids if item_id not in current]
+
+
+def menu_item_restaurant_id(menu_item):
+    if menu_item.category_id is None:
+        return None
+    if MenuItem.category.is_cached(menu_item):
+        return menu_item.category.restaurant_id
+    return Category.objects.filter(pk=menu_item.category_id).values_list("restaurant_id", flat=True).first()
+
+
+@receiver(post_save, sender=Restaurant)
+def bump_menu_on_restaurant_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_menu_version([instance.id])
+        # A later save of this instance must not write the old version back.
+        instance.refresh_from_db(fields=["menu_version"])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_menu_on_category_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_menu_version([instance.restaurant_id])
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+def bump_menu_on_menu_item_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_menu_version([menu_item_restaurant_id(instance)])
@@ -0,0 +1,265 @@
+"""
+Streaming bulk import of menus.
+
+A menu file is CSV (with a header) or NDJSON, one menu item per row with the fields
+``restaurant`` (id), ``category``, ``name``, ``price`` and optionally ``description`` and
+``available`` (default true). Rows are parsed and validated one at a time and streamed into a
+temporary staging table, with `COPY ... FROM STDIN` on PostgreSQL and batched inserts elsewhere,
+so memory stays flat whatever the size of the file. The staging table is then merged into
+`Category` and `MenuItem` with a few set-based statements, in one transaction:
+
+- missing categories are created, matched on (restaurant, name),
+- menu items matched on (category, name) are updated, the others are inserted,
+- when a file lists the same item twice, the last row wins.
+
+The menu snapshots and search vectors of the imported restaurants are refreshed afterwards.
+"""
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from food_delivery_system.orders.models import Category, MenuItem
+from food_delivery_system.restaurant.menu import bump_menu_version
+from food_delivery_system.restaurant.models import Restaurant
+from food_delivery_system.restaurant.search import refresh_search_vectors
+
+FORMATS = ("csv", "ndjson")
+STAGING_TABLE = "menu_import_staging"
+STAGING_COLUMNS = ("line_no", "restaurant_id", "category", "name", "description", "price", "available")
+BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 100
+TRUE_VALUES = {"1", "true", "yes", "y", "t"}
+FALSE_VALUES = {"0", "false", "no", "n", "f"}
+
+_category = Category._meta.db_table
+_menu_item = MenuItem._meta.db_table
+_restaurant = Restaurant._meta.db_table
+_name_length = MenuItem._meta.get_field("name").max_length
+_category_length = Category._meta.get_field("name").max_length
+
+
+class MenuRowError(ValueError):
+    pass
+
+
+def read_rows(stream, fmt):
+    """
+    Yield ``(line number, row dict)`` from a binary or text stream of lines, lazily.
+    """
+    lines = (line.decode("utf-8") if isinstance(line, bytes) else line for line in stream)
+    lines = (line.lstrip("\ufeff") if line_no == 0 else line for line_no, line in enumerate(lines))
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_no, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_no, row if isinstance(row, dict) else MenuRowError("Not a JSON object.")
+
+
+def clean_row(line_no, row, allowed_restaurants=None):
+    """
+    Validate a parsed row, returns the staging tuple. Raises MenuRowError.
+    """
+    if isinstance(row, Exception):
+        raise row
+
+    def text(name, required=True, max_length=None):
+        value = row.get(name)
+        value = "" if value is None else str(value).strip()
+        if required and not value:
+            raise MenuRowError(f"'{name}' is required.")
+        if max_length and len(value) > max_length:
+            raise MenuRowError(f"'{name}' is longer than {max_length} characters.")
+        return value
+
+    try:
+        restaurant_id = int(text("restaurant"))
+    except ValueError:
+        raise MenuRowError("'restaurant' must be a restaurant id.")
+    if allowed_restaurants is not None and restaurant_id not in allowed_restaurants:
+        raise MenuRowError(f"You cannot import into restaurant {restaurant_id}.")
+    try:
+        price = Decimal(text("price")).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        raise MenuRowError("'price' must be a decimal number.")
+    if not price.is_finite():
+        # NaN goes through quantize, and its comparisons raise InvalidOperation
+        raise MenuRowError("'price' must be a decimal number.")
+    if price < 0 or price >= Decimal("1e8"):
+        raise MenuRowError("'price' is out of range.")
+
+    available = row.get("available", True)
+    if not isinstance(available, bool):
+        flag = str(available).strip().lower()
+        if flag not in TRUE_VALUES | FALSE_VALUES | {""}:
+            raise MenuRowError("'available' must be true or false.")
+        available = flag not in FALSE_VALUES
+
+    return (
+        line_no, restaurant_id, text("category", max_length=_category_length), text("name", max_length=_name_length),
+        text("description", required=False) or None, price, available,
+    )
+
+
+class _CsvStream:
+    """
+    File-like view of an iterable of rows as CSV text, for `copy_expert`.
+    """
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            chunk = io.StringIO()
+            writer = csv.writer(chunk, lineterminator="\n")
+            writer.writerows(islice(self.rows, 1000))
+            if not chunk.tell():
+                break
+            self.buffer += chunk.getvalue()
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    readline = read
+
+
+def _csv_value(value):
+    if value is None:
+        return ""     # NULL in COPY's CSV format
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return value
+
+
+def load_staging(cursor, rows):
+    """
+    Stream the validated rows into the staging table.
+    """
+    if connection.vendor == "postgresql":
+        sql = f'COPY {STAGING_TABLE} ({", ".join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)'
+        encoded = ([_csv_value(value) for value in row] for row in rows)
+        if hasattr(cursor.cursor, "copy"):     # psycopg 3
+            with cursor.cursor.copy(sql) as copy:
+                for row in encoded:
+                    copy.write_row(row)
+        else:                                   # psycopg2
+            cursor.cursor.copy_expert(sql, _CsvStream(encoded))
+        return
+
+    sql = f'INSERT INTO {STAGING_TABLE} ({", ".join(STAGING_COLUMNS)}) VALUES ({", ".join(["%s"] * len(STAGING_COLUMNS))})'
+    rows = iter(rows)
+    while batch := list(islice(rows, BATCH_SIZE)):
+        cursor.executemany(sql, batch)
+
+
+def import_menu(stream, fmt="csv", allowed_restaurants=None, strict=False):
+    """
+    Import a CSV or NDJSON menu file. ``allowed_restaurants`` restricts the restaurants rows may
+    target (all by default). Invalid rows are skipped and reported, with ``strict`` any invalid
+    row cancels the import.
+
+    Returns a summary: rows imported, categories created, items created and updated, errors.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown menu format '{fmt}'.")
+    summary = {"rows": 0, "categories_created": 0, "items_created": 0, "items_updated": 0,
+               "error_count": 0, "errors": []}
+
+    def report(line_no, message):
+        summary["error_count"] += 1
+        if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+            summary["errors"].append({"line": line_no, "error": message})
+
+    def valid_rows():
+        for line_no, row in read_rows(stream, fmt):
+            try:
+                yield clean_row(line_no, row, allowed_restaurants)
+            except MenuRowError as exc:
+                report(line_no, str(exc))
+
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Created in the transaction, a failed import takes the staging table with it
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {STAGING_TABLE} (line_no bigint NOT NULL, restaurant_id bigint NOT NULL, "
+            "category varchar(100) NOT NULL, name varchar(255) NOT NULL, description text NULL, "
+            "price numeric(10, 2) NOT NULL, available boolean NOT NULL)"
+        )
+        load_staging(cursor, valid_rows())
+        cursor.execute(f"CREATE INDEX {STAGING_TABLE}_key ON {STAGING_TABLE} (restaurant_id, category, name, line_no)")
+
+        # Rows of unknown restaurants, reported with their line numbers
+        unknown = f"NOT EXISTS (SELECT 1 FROM {_restaurant} r WHERE r.id = s.restaurant_id)"
+        cursor.execute(f"SELECT line_no, restaurant_id FROM {STAGING_TABLE} s WHERE {unknown} "
+                       f"ORDER BY line_no LIMIT {MAX_REPORTED_ERRORS}")
+        for line_no, restaurant_id in cursor.fetchall():
+            report(line_no, f"Restaurant {restaurant_id} does not exist.")
+        cursor.execute(f"DELETE FROM {STAGING_TABLE} WHERE line_no IN "
+                       f"(SELECT line_no FROM {STAGING_TABLE} s WHERE {unknown})")
+        summary["error_count"] += max(cursor.rowcount - min(cursor.rowcount, MAX_REPORTED_ERRORS), 0)
+
+        if strict and summary["error_count"]:
+            transaction.set_rollback(True)
+            return summary
+
+        # The last row of an item wins
+        cursor.execute(
+            f"DELETE FROM {STAGING_TABLE} WHERE EXISTS (SELECT 1 FROM {STAGING_TABLE} later "
+            f"WHERE later.restaurant_id = {STAGING_TABLE}.restaurant_id AND later.category = {STAGING_TABLE}.category "
+            f"AND later.name = {STAGING_TABLE}.name AND later.line_no > {STAGING_TABLE}.line_no)"
+        )
+        cursor.execute(f"SELECT count(*) FROM {STAGING_TABLE}")
+        summary["rows"] = cursor.fetchone()[0]
+
+        cursor.execute(
+            f"INSERT INTO {_category} (restaurant_id, name, updated_at) "
+            f"SELECT DISTINCT s.restaurant_id, s.category, %s FROM {STAGING_TABLE} s "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {_category} c WHERE c.restaurant_id = s.restaurant_id "
+            f"AND c.name = s.category)",
+            [now],
+        )
+        summary["categories_created"] = cursor.rowcount
+        # Categories sharing a name within a restaurant: the items go to the oldest one
+        matched_category = (
+            f"c.id = (SELECT min(c2.id) FROM {_category} c2 WHERE c2.restaurant_id = s.restaurant_id "
+            f"AND c2.name = s.category)"
+        )
+        cursor.execute(
+            f"UPDATE {_menu_item} SET description = s.description, price = s.price, available = s.available, "
+            f"updated_at = %s FROM {STAGING_TABLE} s JOIN {_category} c ON {matched_category} "
+            f"WHERE {_menu_item}.category_id = c.id AND {_menu_item}.name = s.name",
+            [now],
+        )
+        summary["items_updated"] = cursor.rowcount
+        cursor.execute(
+            f"INSERT INTO {_menu_item} (category_id, name, description, price, available, created_at, updated_at) "
+            f"SELECT c.id, s.name, s.description, s.price, s.available, %s, %s "
+            f"FROM {STAGING_TABLE} s JOIN {_category} c ON {matched_category} "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {_menu_item} m WHERE m.category_id = c.id AND m.name = s.name)",
+            [now, now],
+        )
+        summary["items_created"] = cursor.rowcount
+
+        cursor.execute(f"SELECT DISTINCT restaurant_id FROM {STAGING_TABLE}")
+        restaurant_ids = [restaurant_id for restaurant_id, in cursor.fetchall()]
+        cursor.execute(f"DROP TABLE {STAGING_TABLE}")
+
+        # Merged with raw SQL, the model signals did not run
+        refresh_search_vectors(MenuItem.objects.filter(category__restaurant_id__in=restaurant_ids))
+        bump_menu_version(restaurant_ids)
+    return summary
@@ -0,0 +1,67 @@
+# Generated by Django 4.2.20 on 2026-10-17 23:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0006_alter_restaurant_owner'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestaurantHourlyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('status_counts', models.JSONField(default=dict)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('average_basket', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('basket_size_p50', models.FloatField(null=True)),
+                ('basket_size_p90', models.FloatField(null=True)),
+                ('prep_time_p50', models.FloatField(null=True)),
+                ('prep_time_p90', models.FloatField(null=True)),
+                ('top_items', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='restaurant.restaurant')),
+            ],
+            options={
+                'abstract': False,
+                'default_permissions': (),
+            },
+        ),
+        migrations.CreateModel(
+            name='RestaurantDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('status_counts', models.JSONField(default=dict)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('average_basket', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('basket_size_p50', models.FloatField(null=True)),
+                ('basket_size_p90', models.FloatField(null=True)),
+                ('prep_time_p50', models.FloatField(null=True)),
+                ('prep_time_p90', models.FloatField(null=True)),
+                ('top_items', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='restaurant.restaurant')),
+            ],
+            options={
+                'abstract': False,
+                'default_permissions': (),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='restauranthourlystats',
+            constraint=models.UniqueConstraint(fields=('restaurant', 'bucket'), name='restaurant_hourly_bucket_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='restaurantdailystats',
+            constraint=models.UniqueConstraint(fields=('restaurant', 'bucket'), name='restaurant_daily_bucket_uniq'),
+        ),
+    ]
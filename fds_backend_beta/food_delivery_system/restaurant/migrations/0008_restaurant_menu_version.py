@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-17 23:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0007_restauranthourlystats_restaurantdailystats_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='menu_version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -1,6 +1,8 @@
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.utils import timezone
 from food_delivery_system.users.models import CustomUser
+from food_delivery_system.utils.geo import cell_of
 
 User = CustomUser
 
@@ -12,10 +14,19 @@ class Restaurant(models.Model):
     phone = models.CharField(max_length=20, unique=True, null=True, blank=True)
     created_at = models.DateTimeField(default=timezone.now, editable=False)
     updated_at = models.DateTimeField(default=timezone.now, editable=False)
+    menu_version = models.PositiveIntegerField(default=1, editable=False)     # Bumped by every menu change
+    latitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    geo_cell = models.IntegerField(null=True, editable=False)     # Grid cell of the coordinates, see utils/geo.py
 
     def save(self, *args, **kwargs):
         if self.name is not None and not isinstance(self.name, str):
             raise TypeError("The 'name' field must be a string.")
+        self.geo_cell = cell_of(self.latitude, self.longitude)
+        if kwargs.get("update_fields") is not None and {"latitude", "longitude"} & set(kwargs["update_fields"]):
+            kwargs["update_fields"] = {*kwargs["update_fields"], "geo_cell"}
+        if self.pk is not None:
+            self.updated_at = timezone.now()    # Validator of conditional GETs
         super().save(*args, **kwargs)
 
     class Meta:
@@ -23,8 +34,47 @@ class Restaurant(models.Model):
             ("can_manage_restaurant", "Can manage restaurant"),     # For Restaurant Owners
             ("can_view_analytics", "Can view analytics"),   # For Restaurant Owners
         ]
+        indexes = [
+            # Nearest restaurant searches read ranges of cells
+            models.Index(fields=["geo_cell"], name="restaurant_geo_cell_idx"),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RestaurantRollup(models.Model):
+    """
+    Pre-aggregated order statistics of a restaurant over one time bucket, recomputed by
+    `restaurant/analytics.py` whenever an order of the bucket changes.
+    """
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name="+")
+    bucket = models.DateTimeField()     # Start of the hour / day, UTC
+    order_count = models.PositiveIntegerField(default=0)
+    status_counts = models.JSONField(default=dict)      # {status: number of orders}
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)   # Excludes canceled orders
+    average_basket = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    basket_size_p50 = models.FloatField(null=True)      # Items per order
+    basket_size_p90 = models.FloatField(null=True)
+    prep_time_p50 = models.FloatField(null=True)        # Seconds from placement to pick up
+    prep_time_p90 = models.FloatField(null=True)
+    top_items = models.JSONField(default=list)          # [{menu_item_id, name, quantity}], best sellers first
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        abstract = True
+        default_permissions = ()
+
+
+class RestaurantHourlyStats(RestaurantRollup):
+    class Meta(RestaurantRollup.Meta):
+        constraints = [
+            models.UniqueConstraint(fields=["restaurant", "bucket"], name="restaurant_hourly_bucket_uniq"),
+        ]
+
+
+class RestaurantDailyStats(RestaurantRollup):
+    class Meta(RestaurantRollup.Meta):
+        constraints = [
+            models.UniqueConstraint(fields=["restaurant", "bucket"], name="restaurant_daily_bucket_uniq"),
+        ]
@@ -0,0 +1,65 @@
+"""
+Nearest restaurants to a point.
+
+Restaurants with coordinates are indexed by grid cell (see utils/geo.py). A search reads the
+restaurants of the cells around the point, then of wider and wider rings of cells, until the
+k-th nearest candidate is closer than any restaurant outside the rings could be, or the
+search radius is covered. Only ids and coordinates are read while searching, the k nearest
+restaurants are loaded at the end.
+"""
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+
+from food_delivery_system.restaurant.models import Restaurant
+from food_delivery_system.utils.geo import cell_ranges, covered_km, haversine_km, rings_for, row_rings_for
+
+
+def _in_cells(ranges):
+    query = Q()
+    for low, high in ranges:
+        query |= Q(geo_cell=low) if low == high else Q(geo_cell__range=(low, high))
+    return query
+
+
+def nearest_restaurants(latitude, longitude, k=10, radius_km=None, queryset=None):
+    """
+    Up to ``k`` restaurants within ``radius_km`` of the point, nearest first, each with a
+    ``distance_km`` attribute. The restaurants are loaded from ``queryset`` when given.
+    """
+    radius_km = settings.NEARBY_MAX_RADIUS_KM if radius_km is None else radius_km
+    max_rings, max_row_offset = rings_for(latitude, radius_km), row_rings_for(radius_km)
+    ids, latitudes, longitudes = [], [], []
+    first_ring, last_ring = 0, 1
+    while True:
+        ranges = cell_ranges(latitude, longitude, first_ring, last_ring, max_row_offset)
+        rows = Restaurant.objects.filter(_in_cells(ranges))
+        for restaurant_id, lat, lng in rows.values_list("id", "latitude", "longitude"):
+            ids.append(restaurant_id)
+            latitudes.append(lat)
+            longitudes.append(lng)
+        if last_ring >= max_rings:
+            break
+        if len(ids) >= k:
+            distances = haversine_km(latitude, longitude, latitudes, longitudes)
+            if np.partition(distances, k - 1)[k - 1] <= covered_km(latitude, last_ring):
+                break
+        # Sparse areas: double the square read at every step
+        first_ring, last_ring = last_ring + 1, min(last_ring * 2, max_rings)
+
+    if not ids:
+        return []
+    distances = haversine_km(latitude, longitude, latitudes, longitudes)
+    within = np.flatnonzero(distances <= radius_km)
+    if len(within) > k:
+        within = within[np.argpartition(distances[within], k - 1)[:k]]
+    nearest = within[np.argsort(distances[within], kind="stable")]
+
+    queryset = Restaurant.objects.all() if queryset is None else queryset
+    restaurants = queryset.in_bulk([ids[index] for index in nearest])
+    results = []
+    for index in nearest:
+        restaurant = restaurants[ids[index]]
+        restaurant.distance_km = float(distances[index])
+        results.append(restaurant)
+    return results
@@ -0,0 +1,92 @@
+"""
+Menu search across restaurants.
+
+On PostgreSQL every menu item stores a weighted `tsvector` of its name (A), its category and
+restaurant names (B) and its description (C), indexed with GIN, next to a trigram index on the
+name. A search matches the vector with a web-search style query, or the name by trigram
+similarity so that misspelled dishes are still found, and ranks on both.
+
+The vectors are refreshed by the signals below. Writes that bypass model signals (queryset
+updates, bulk inserts) must call `refresh_search_vectors` themselves.
+
+Other databases fall back to case-insensitive substring matching.
+"""
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connection
+from django.db.models import Case, F, FloatField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from food_delivery_system.orders.models import Category, MenuItem
+from food_delivery_system.restaurant.models import Restaurant
+
+
+def search_enabled():
+    return connection.vendor == "postgresql"
+
+
+def search_vector():
+    config = settings.MENU_SEARCH_CONFIG
+    return (
+        SearchVector("name", weight="A", config=config)
+        + SearchVector("category__name", weight="B", config=config)
+        + SearchVector("category__restaurant__name", weight="B", config=config)
+        + SearchVector("description", weight="C", config=config)
+    )
+
+
+def refresh_search_vectors(menu_items):
+    """
+    Recompute the search vector of the given menu items (a queryset) with a single UPDATE.
+    """
+    if not search_enabled():
+        return 0
+    # UPDATE cannot join, the vector is computed in a correlated subquery.
+    vectors = MenuItem.objects.filter(pk=OuterRef("pk")).annotate(vector=search_vector()).values("vector")
+    return menu_items.update(search_vector=Subquery(vectors))
+
+
+def search_menu_items(text):
+    """
+    Available menu items matching ``text``, best matches first.
+    """
+    items = (
+        MenuItem.objects.filter(available=True, category__isnull=False)
+        .select_related("category__restaurant").defer("search_vector")
+    )
+    if not search_enabled():
+        matches = (
+            Q(name__icontains=text) | Q(description__icontains=text)
+            | Q(category__name__icontains=text) | Q(category__restaurant__name__icontains=text)
+        )
+        rank = Case(When(name__icontains=text, then=Value(1.0)), default=Value(0.5), output_field=FloatField())
+        return items.filter(matches).annotate(rank=rank).order_by("-rank", "id")
+
+    query = SearchQuery(text, search_type="websearch", config=settings.MENU_SEARCH_CONFIG)
+    # Items matched by name only may not have their vector yet, a NULL rank would sort first
+    text_rank = Coalesce(SearchRank(F("search_vector"), query), Value(0.0))
+    return (
+        items.filter(Q(search_vector=query) | Q(name__trigram_similar=text))
+        .annotate(rank=text_rank + TrigramSimilarity("name", text))
+        .order_by("-rank", "id")
+    )
+
+
+@receiver(post_save, sender=MenuItem)
+def refresh_search_on_menu_item_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_search_vectors(MenuItem.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Category)
+def refresh_search_on_category_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_search_vectors(MenuItem.objects.filter(category=instance))
+
+
+@receiver(post_save, sender=Restaurant)
+def refresh_search_on_restaurant_save(sender, instance, raw=False, created=False, **kwargs):
+    if not raw and not created:     # A new restaurant has no menu yet
+        refresh_search_vectors(MenuItem.objects.filter(category__restaurant=instance))
@@ -1,8 +1,33 @@
-from django.test import TestCase
+import os
+import random
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+
+from asgiref.sync import sync_to_async
+
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import AsyncClient, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
-from food_delivery_system.restaurant.models import Restaurant
+from food_delivery_system.orders.archive import archive_batch
+from food_delivery_system.orders.feed import notify_menu_changes
+from food_delivery_system.orders.factories import StaffFactory
+from food_delivery_system.orders.models import ArchivedOrder, Category, MenuItem, Order
+from food_delivery_system.orders.outbox import drain_outbox
+from food_delivery_system.restaurant.analytics import refresh_rollups
+from food_delivery_system.restaurant.menu_import import import_menu
+from food_delivery_system.restaurant.nearby import nearest_restaurants
+from food_delivery_system.restaurant.models import Restaurant, RestaurantDailyStats, RestaurantHourlyStats
 from food_delivery_system.users.factories import CustomUserFactory, RestaurantFactory
+from food_delivery_system.utils.geo import COLUMNS, ROWS, cell_of, cell_ranges, haversine_km, rings_for, row_rings_for
 
 
 class RestaurantViewSetTestCase(TestCase):
@@ -94,3 +119,501 @@ class RestaurantViewSetTestCase(TestCase):
         self.restaurant.refresh_from_db()
         self.assertNotEqual(self.restaurant.name, 1234)  # Ensure no partial update occurred
 
+
+class RestaurantAnalyticsTestCase(TestCase):
+    def setUp(self):
+        """Place three orders through the API and let the outbox worker roll them up."""
+        self.client = APIClient()
+        self.owner = CustomUserFactory(is_restaurant=True)
+        self.owner.user_permissions.add(Permission.objects.get(codename="can_view_analytics"))
+        self.restaurant = RestaurantFactory(owner=self.owner)
+        MenuItem.objects.create(name="Pizza", price=Decimal("10.00"))
+        MenuItem.objects.create(name="Soup", price=Decimal("4.00"))
+
+        self.customer = CustomUserFactory()
+        self.client.force_authenticate(user=self.customer)
+        for items in ([("Pizza", 1)], [("Pizza", 2), ("Soup", 1)], [("Soup", 3)]):
+            payload = {"restaurant": self.restaurant.id, "items": [{"menu_item": name, "quantity": quantity}
+                                                                   for name, quantity in items]}
+            self.last_order_id = self.client.post("/api/orders/", payload, format="json").data["id"]
+        self.client.patch(f"/api/orders/{self.last_order_id}/", {"status": "canceled"}, format="json")
+        drain_outbox()
+        self.analytics_url = f"/api/restaurant/{self.restaurant.id}/analytics/"
+
+    def test_rollups_follow_order_events(self):
+        """Test that order events keep the hourly and daily rollups up to date."""
+        hourly = RestaurantHourlyStats.objects.get(restaurant=self.restaurant)
+        self.assertEqual(hourly.order_count, 3)
+        self.assertEqual(hourly.status_counts, {"pending": 2, "canceled": 1})
+        self.assertEqual(hourly.revenue, Decimal("34.00"))     # The canceled order is left out
+        self.assertEqual(hourly.average_basket, Decimal("17.00"))
+        self.assertEqual(hourly.basket_size_p50, 2.0)
+        self.assertEqual(hourly.top_items[0], {"menu_item_id": MenuItem.objects.get(name="Pizza").id,
+                                               "name": "Pizza", "quantity": 3})
+        self.assertEqual(RestaurantDailyStats.objects.get(restaurant=self.restaurant).order_count, 3)
+
+    def test_analytics_requires_can_view_analytics(self):
+        """Test that only users with can_view_analytics can read the rollups."""
+        response = self.client.get(self.analytics_url, {"granularity": "hourly"})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.owner)
+        response = self.client.get(self.analytics_url, {"granularity": "hourly"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row["order_count"] for row in response.data["results"]], [3])
+
+    def test_analytics_rejects_invalid_dates(self):
+        """Test that malformed or impossible start and end values are answered with 400."""
+        self.client.force_authenticate(user=self.owner)
+        for params in ({"end": "garbage"}, {"start": "2024-02-30T00:00"}, {"end": "2024-02-30T00:00"}):
+            response = self.client.get(self.analytics_url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_backfill_rebuilds_rollups(self):
+        """Test that the backfill command recomputes the rollups from the order tables."""
+        RestaurantHourlyStats.objects.all().delete()
+        RestaurantDailyStats.objects.all().delete()
+        call_command("backfill_restaurant_analytics", restaurant=self.restaurant.id, stdout=StringIO())
+        self.assertEqual(RestaurantHourlyStats.objects.get(restaurant=self.restaurant).revenue, Decimal("34.00"))
+        self.assertEqual(RestaurantDailyStats.objects.count(), 1)
+        for option in ("since", "until"):
+            with self.assertRaises(CommandError):
+                call_command("backfill_restaurant_analytics", **{option: "2024-02-30"}, stdout=StringIO())
+
+    def test_archived_orders_stay_in_the_rollups(self):
+        """Test that recomputing a bucket counts the orders moved to the archive."""
+        self.assertEqual(archive_batch(timezone.now() + timedelta(minutes=1)), 1)
+        self.assertEqual(ArchivedOrder.objects.get().id, self.last_order_id)
+        RestaurantHourlyStats.objects.all().delete()
+        call_command("backfill_restaurant_analytics", restaurant=self.restaurant.id, stdout=StringIO())
+        hourly = RestaurantHourlyStats.objects.get(restaurant=self.restaurant)
+        self.assertEqual((hourly.order_count, hourly.revenue), (3, Decimal("34.00")))
+        self.assertEqual(hourly.status_counts, {"pending": 2, "canceled": 1})
+
+        # A bucket left with archived orders only keeps its rollup
+        ArchivedOrder.objects.update(status="completed", total_price=Decimal("12.00"))
+        Order.objects.filter(restaurant=self.restaurant).delete()
+        refresh_rollups(self.restaurant.id, hourly.bucket)
+        hourly.refresh_from_db()
+        self.assertEqual((hourly.order_count, hourly.revenue, hourly.basket_size_p50), (1, Decimal("12.00"), 3.0))
+        self.assertEqual(hourly.top_items[0]["name"], "Soup")
+
+
+class RestaurantMenuTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.restaurant = RestaurantFactory()
+        self.category = Category.objects.create(restaurant=self.restaurant, name="Pizzas")
+        self.pizza = MenuItem.objects.create(category=self.category, name="Margherita", price=Decimal("9.50"))
+        self.url = f"/api/restaurant/{self.restaurant.id}/menu/"
+
+    def app_queries(self, queries):
+        # Without silk's own profiling writes and EXPLAINs
+        return [query["sql"] for query in queries.captured_queries
+                if not any(marker in query["sql"] for marker in ("silk_", "SAVEPOINT", "EXPLAIN"))]
+
+    def test_cached_menu_costs_one_query(self):
+        """Test that the menu is rendered once and then served from the cache."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["categories"][0]["items"][0]["name"], "Margherita")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The version of the menu, nothing else
+        self.assertEqual(len(self.app_queries(queries)), 1)
+
+    def test_menu_changes_invalidate_the_snapshot(self):
+        """Test that saving or deleting menu items and categories serves a fresh menu."""
+        version = self.client.get(self.url).data["version"]
+
+        self.pizza.price = Decimal("11.00")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pizza.save()
+        menu = self.client.get(self.url).data
+        self.assertGreater(menu["version"], version)
+        self.assertEqual(menu["categories"][0]["items"][0]["price"], "11.00")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MenuItem.objects.create(category=self.category, name="Diavola", price=Decimal("12.00"))
+        self.assertEqual(len(self.client.get(self.url).data["categories"][0]["items"]), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.delete()
+        self.assertEqual(self.client.get(self.url).data["categories"], [])
+
+    def test_other_workers_serve_a_fresh_menu(self):
+        """Test that a worker whose cache missed the new version still serves the fresh menu."""
+        version = self.client.get(self.url).data["version"]
+        # Commit callbacks do not run here, like those of a write served by another worker
+        self.pizza.price = Decimal("11.00")
+        self.pizza.save()
+        menu = self.client.get(self.url).data
+        self.assertGreater(menu["version"], version)
+        self.assertEqual(menu["categories"][0]["items"][0]["price"], "11.00")
+
+    def test_unknown_restaurant(self):
+        """Test that the menu of an unknown restaurant is a 404."""
+        self.assertEqual(self.client.get("/api/restaurant/999999/menu/").status_code, status.HTTP_404_NOT_FOUND)
+
+
+class MenuSearchTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.restaurant = RestaurantFactory(name="Luigi's")
+        pizzas = Category.objects.create(restaurant=self.restaurant, name="Pizzas")
+        desserts = Category.objects.create(restaurant=self.restaurant, name="Desserts")
+        self.margherita = MenuItem.objects.create(category=pizzas, name="Margherita", price=Decimal("9.50"),
+                                                  description="Tomato, mozzarella and basil")
+        self.caprese = MenuItem.objects.create(category=desserts, name="Torta caprese", price=Decimal("6.00"),
+                                               description="Chocolate cake, no pizza involved")
+        MenuItem.objects.create(category=pizzas, name="Pizza bianca", price=Decimal("8.00"), available=False)
+
+    def test_search_ranks_available_items(self):
+        """Test that the search returns available matches, dish name matches first."""
+        response = self.client.get("/api/restaurant/search/", {"q": "pizza"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([hit["id"] for hit in response.data["results"]], [self.margherita.id, self.caprese.id])
+        self.assertEqual(response.data["results"][0]["restaurant_name"], "Luigi's")
+        self.assertEqual(response.data["total_objects"], 2)
+
+    def test_search_requires_a_query(self):
+        """Test that a search without text is rejected."""
+        self.assertEqual(self.client.get("/api/restaurant/search/").status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MenuAvailabilityTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.restaurant = RestaurantFactory()
+        self.chef = StaffFactory(restaurant=self.restaurant, role="chef").user
+        self.chef.user_permissions.add(Permission.objects.get(codename="can_mark_unavailable"))
+        self.client.force_authenticate(user=self.chef)
+        category = Category.objects.create(restaurant=self.restaurant, name="Mains")
+        self.items = [
+            MenuItem.objects.create(category=category, name=f"Dish {i}", price=Decimal("8.00")) for i in range(3)
+        ]
+        self.url = f"/api/restaurant/{self.restaurant.id}/menu/availability/"
+
+    def test_items_are_marked_sold_out_together(self):
+        """Test that many items are marked sold out with one UPDATE and the menu snapshot is refreshed."""
+        version = self.client.get(f"/api/restaurant/{self.restaurant.id}/menu/").data["version"]
+        elsewhere = MenuItem.objects.create(
+            category=Category.objects.create(restaurant=RestaurantFactory(), name="Other"), name="Other dish", price=1,
+        )
+        ids = [self.items[0].id, self.items[1].id, elsewhere.id]
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {"items": ids, "available": False}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"updated": ids[:2], "not_found": [elsewhere.id]})
+        self.assertEqual(len([query for query in queries.captured_queries
+                              if query["sql"].startswith('UPDATE "orders_menuitem"')]), 1)
+        self.assertEqual(set(MenuItem.objects.filter(available=False).values_list("id", flat=True)), set(ids[:2]))
+
+        menu = self.client.get(f"/api/restaurant/{self.restaurant.id}/menu/").data
+        self.assertGreater(menu["version"], version)
+        self.assertEqual([item["available"] for item in menu["categories"][0]["items"]], [False, False, True])
+
+    def test_reloaded_menu_is_sold_out_in_every_worker(self):
+        """Test that a menu reloaded after a sold-out change never comes from the old snapshot."""
+        self.client.get(f"/api/restaurant/{self.restaurant.id}/menu/")
+        # No commit callback runs, as in the workers that did not serve the change
+        self.client.post(self.url, {"items": [self.items[0].id], "available": False}, format="json")
+        menu = self.client.get(f"/api/restaurant/{self.restaurant.id}/menu/").data
+        self.assertFalse(menu["categories"][0]["items"][0]["available"])
+
+    def test_permission_depends_on_the_new_availability(self):
+        """Test that marking items available again requires can_mark_available."""
+        response = self.client.post(self.url, {"items": [self.items[0].id], "available": True}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=CustomUserFactory())
+        response = self.client.post(self.url, {"items": [self.items[0].id], "available": False}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_sold_out_items_cannot_be_ordered(self):
+        """Test that an order naming a sold-out item is rejected."""
+        self.client.post(self.url, {"items": [self.items[0].id], "available": False}, format="json")
+        self.client.force_authenticate(user=CustomUserFactory())
+        payload = {"restaurant": self.restaurant.id, "items": [{"menu_item": "Dish 0", "quantity": 1}]}
+        response = self.client.post("/api/orders/", payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("sold out", str(response.data))
+
+    async def test_changes_are_pushed_to_open_menus(self):
+        """Test that an availability change reaches the clients following the menu feed."""
+        response = await AsyncClient().get(f"/api/restaurant/{self.restaurant.id}/menu/feed/")
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        await sync_to_async(notify_menu_changes)(self.restaurant.id, [(self.items[2].id, False)])
+
+        chunks, received = response.streaming_content, ""
+        while "event: menu" not in received:
+            received += (await chunks.__anext__()).decode()
+        await chunks.aclose()
+        self.assertIn(f'"items":[{{"id":{self.items[2].id},"available":false}}]', received)
+
+
+class ConditionalRestaurantReadTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=CustomUserFactory())
+        self.restaurant = RestaurantFactory()
+        self.url = f"/api/restaurant/{self.restaurant.id}/"
+
+    def app_queries(self, queries):
+        # Without silk's own profiling writes and EXPLAINs
+        return [query["sql"] for query in queries.captured_queries
+                if not any(marker in query["sql"] for marker in ("silk_", "SAVEPOINT", "EXPLAIN"))]
+
+    def test_unchanged_restaurant_is_not_serialized(self):
+        """Test that a matching If-None-Match gets a 304 from a single validator query."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("Last-Modified", response)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(self.app_queries(queries)), 1)
+
+    def test_changed_restaurant_is_served_again(self):
+        """Test that an update changes the ETag, so the old one no longer matches."""
+        etag = self.client.get(self.url)["ETag"]
+        self.restaurant.name = "Renamed"
+        self.restaurant.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["name"], "Renamed")
+
+    def test_menu_is_revalidated_from_its_version(self):
+        """Test that a menu revalidation answers 304 from a single version query."""
+        etag = self.client.get(f"{self.url}menu/")["ETag"]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"{self.url}menu/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(self.app_queries(queries)), 1)
+
+    def test_changed_menu_is_not_confirmed(self):
+        """Test that a menu change committed by another worker makes the old ETag stale."""
+        etag = self.client.get(f"{self.url}menu/")["ETag"]
+        # No commit callback runs, as for a write served by another worker
+        Category.objects.create(restaurant=self.restaurant, name="Desserts")
+        response = self.client.get(f"{self.url}menu/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class MenuImportTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.restaurant = RestaurantFactory()
+        self.mains = Category.objects.create(restaurant=self.restaurant, name="Mains")
+        self.curry = MenuItem.objects.create(category=self.mains, name="Curry", price=Decimal("9.00"))
+
+    def csv_file(self, *rows):
+        lines = ["restaurant,category,name,description,price,available", *rows]
+        return BytesIO("\n".join(lines).encode())
+
+    def test_csv_import_creates_and_updates_items(self):
+        """Test that a CSV import updates matching items, creates the others and their categories."""
+        version = self.client.get(f"/api/restaurant/{self.restaurant.id}/menu/").data["version"]
+        rows = [
+            f"{self.restaurant.id},Mains,Curry,Hot,10.50,false",
+            f"{self.restaurant.id},Mains,Dal,,6,",
+            f"{self.restaurant.id},Desserts,Kulfi,\"Mango, pistachio\",4.25,true",
+            f"{self.restaurant.id},Desserts,Kulfi,Mango,4.50,true",
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            summary = import_menu(self.csv_file(*rows), "csv")
+
+        self.assertEqual(summary["rows"], 3)
+        self.assertEqual((summary["categories_created"], summary["items_created"], summary["items_updated"]), (1, 2, 1))
+        self.curry.refresh_from_db()
+        self.assertEqual((self.curry.description, self.curry.price, self.curry.available), ("Hot", Decimal("10.50"), False))
+        kulfi = MenuItem.objects.get(name="Kulfi")
+        self.assertEqual((kulfi.category.name, kulfi.price), ("Desserts", Decimal("4.50")))
+        self.assertIsNone(MenuItem.objects.get(name="Dal").description)
+        self.assertGreater(self.client.get(f"/api/restaurant/{self.restaurant.id}/menu/").data["version"], version)
+
+    def test_invalid_rows_are_skipped_and_reported(self):
+        """Test that invalid rows are reported with their line numbers and the valid ones imported."""
+        summary = import_menu(self.csv_file(
+            f"{self.restaurant.id},Mains,Dal,,six,",
+            f"{self.restaurant.id},Mains,,,3,",
+            "999999,Mains,Ghost,,3,",
+            f"{self.restaurant.id},Mains,Naan,,2,",
+            f"{self.restaurant.id},Mains,Roti,,NaN,",
+            f"{self.restaurant.id},Mains,Paratha,,Infinity,",
+        ), "csv")
+        self.assertEqual(summary["error_count"], 5)
+        self.assertEqual([error["line"] for error in summary["errors"]], [2, 3, 6, 7, 4])
+        self.assertTrue(MenuItem.objects.filter(name="Naan").exists())
+
+    def test_strict_import_imports_nothing_on_errors(self):
+        """Test that a strict import with an invalid row leaves the menus untouched."""
+        summary = import_menu(self.csv_file(
+            f"{self.restaurant.id},Mains,Naan,,2,",
+            f"{self.restaurant.id},Mains,Dal,,six,",
+        ), "csv", strict=True)
+        self.assertEqual(summary["error_count"], 1)
+        self.assertFalse(MenuItem.objects.filter(name="Naan").exists())
+
+    def test_ndjson_import(self):
+        """Test that NDJSON rows are imported like CSV rows."""
+        lines = [
+            f'{{"restaurant": {self.restaurant.id}, "category": "Mains", "name": "Curry", "price": 11}}',
+            "not json",
+            f'{{"restaurant": {self.restaurant.id}, "category": "Mains", "name": "Rice", "price": "2.5", '
+            '"available": false}',
+        ]
+        summary = import_menu(BytesIO("\n".join(lines).encode()), "ndjson")
+        self.assertEqual((summary["items_created"], summary["items_updated"], summary["error_count"]), (1, 1, 1))
+        self.assertFalse(MenuItem.objects.get(name="Rice").available)
+
+    def test_command_reports_the_import(self):
+        """Test that the import_menu command imports a file and prints the summary."""
+        out = StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "menu.csv")
+            with open(path, "wb") as stream:
+                stream.write(self.csv_file(f"{self.restaurant.id},Sides,Raita,,3,").getvalue())
+            call_command("import_menu", path, stdout=out)
+        self.assertIn("1 menu items created", out.getvalue())
+
+    def test_endpoint_limits_rows_to_the_users_restaurants(self):
+        """Test that the upload endpoint requires can_manage_menuitems and skips other restaurants' rows."""
+        client = APIClient()
+        owner = self.restaurant.owner or CustomUserFactory()
+        Restaurant.objects.filter(pk=self.restaurant.pk).update(owner=owner)
+        client.force_authenticate(user=owner)
+        other = RestaurantFactory()
+
+        def upload():
+            content = self.csv_file(f"{self.restaurant.id},Mains,Dal,,6,", f"{other.id},Mains,Dal,,6,").getvalue()
+            return client.post("/api/restaurant/menu-import/",
+                               {"file": SimpleUploadedFile("menu.csv", content)}, format="multipart")
+
+        self.assertEqual(upload().status_code, status.HTTP_403_FORBIDDEN)
+        owner.user_permissions.add(Permission.objects.get(codename="can_manage_menuitems"))
+        owner = type(owner).objects.get(pk=owner.pk)     # Fresh permission cache
+        client.force_authenticate(user=owner)
+        response = upload()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data["items_created"], response.data["error_count"]), (1, 1))
+        self.assertFalse(MenuItem.objects.filter(category__restaurant=other).exists())
+
+
+class NearbyRestaurantTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        rng = random.Random(7)
+        self.restaurants = [
+            Restaurant.objects.create(name=f"Bistro {n}", latitude=48.85 + rng.uniform(-0.3, 0.3),
+                                      longitude=2.35 + rng.uniform(-0.4, 0.4))
+            for n in range(40)
+        ]
+
+    def brute_force(self, latitude, longitude, k, radius_km):
+        distances = haversine_km(latitude, longitude, [r.latitude for r in self.restaurants],
+                                 [r.longitude for r in self.restaurants])
+        ranked = sorted((distance, r.id) for distance, r in zip(distances, self.restaurants) if distance <= radius_km)
+        return [restaurant_id for _, restaurant_id in ranked[:k]]
+
+    def test_nearest_restaurants_match_a_full_scan(self):
+        """Test that the grid search returns the same k nearest restaurants as ranking every restaurant."""
+        for latitude, longitude, k, radius_km in [(48.85, 2.35, 5, 25), (48.5, 2.0, 3, 25), (49.6, 2.35, 2, 25),
+                                                  (48.85, 2.35, 50, 8)]:
+            found = nearest_restaurants(latitude, longitude, k=k, radius_km=radius_km)
+            self.assertEqual([r.id for r in found], self.brute_force(latitude, longitude, k, radius_km))
+            self.assertEqual([r.distance_km for r in found], sorted(r.distance_km for r in found))
+
+    def test_cells_follow_the_coordinates(self):
+        """Test that saving a restaurant keeps its grid cell in sync and cells wrap around the antimeridian."""
+        restaurant = self.restaurants[0]
+        restaurant.latitude, restaurant.longitude = -33.86, 151.21
+        restaurant.save(update_fields=["latitude", "longitude"])
+        restaurant.refresh_from_db()
+        self.assertEqual(restaurant.geo_cell, cell_of(-33.86, 151.21))
+
+        ranges = cell_ranges(0.005, 179.995, 0, 1)
+        self.assertIn(cell_of(0.005, -179.995), [cell for low, high in ranges for cell in range(low, high + 1)])
+
+    def test_search_near_the_poles_reads_a_few_ranges(self):
+        """Test that searches near a pole bound the rows read and merge the full rows into one range."""
+        self.assertEqual(len(cell_ranges(89.5, 0, 0, rings_for(89.5, 25), row_rings_for(25))), 2 * row_rings_for(25) + 1)
+        ranges = cell_ranges(89.99, 0, 0, rings_for(89.99, 25), row_rings_for(25))
+        first_row = cell_of(89.99, 0) // COLUMNS - row_rings_for(25)
+        self.assertEqual(ranges, [(first_row * COLUMNS, ROWS * COLUMNS - 1)])
+        polar = [Restaurant.objects.create(name=f"Station {n}", latitude=latitude, longitude=longitude)
+                 for n, (latitude, longitude) in enumerate([(89.6, 20), (89.55, -179.995), (89.6, 0)])]
+        self.restaurants += polar
+        for radius_km in (25, 120):
+            found = nearest_restaurants(89.5, 0, k=10, radius_km=radius_km)
+            self.assertEqual([r.id for r in found], self.brute_force(89.5, 0, 10, radius_km))
+
+    def test_nearby_endpoint(self):
+        """Test that the nearby endpoint ranks restaurants around the given or the user's coordinates."""
+        response = self.client.get("/api/restaurant/nearby/", {"lat": 48.85, "lng": 2.35, "k": 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r["id"] for r in response.data["results"]], self.brute_force(48.85, 2.35, 3, 25))
+        self.assertIn("distance_km", response.data["results"][0])
+
+        self.assertEqual(self.client.get("/api/restaurant/nearby/").status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get("/api/restaurant/nearby/", {"lat": 91, "lng": 0}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(user=CustomUserFactory(latitude=48.5, longitude=2.0))
+        response = self.client.get("/api/restaurant/nearby/", {"k": 2})
+        self.assertEqual([r["id"] for r in response.data["results"]], self.brute_force(48.5, 2.0, 2, 25))
+
+
+class SparseFieldsetTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=CustomUserFactory())
+        self.owners = [CustomUserFactory(username=f"owner{n}") for n in range(2)]
+        self.restaurants = [RestaurantFactory(owner=owner) for owner in self.owners]
+
+    def row_query(self, queries, table):
+        # The query reading the listed rows, not the validators or the count
+        return next(query["sql"] for query in queries.captured_queries if query["sql"].startswith(f'SELECT "{table}"."id"'))
+
+    def test_list_collapses_relations_by_default(self):
+        """Test that the restaurant list renders compact rows with the owner id and does not join the users."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/restaurant/")
+        row = next(r for r in response.data if r["id"] == self.restaurants[0].id)
+        self.assertEqual(set(row), {"id", "owner", "name", "address"})
+        self.assertEqual(row["owner"], self.owners[0].id)
+        self.assertNotIn("users_customuser", self.row_query(queries, "restaurant_restaurant"))
+
+    def test_expand_and_fields(self):
+        """Test that expand nests a relation and dotted fields select the nested fields."""
+        response = self.client.get("/api/restaurant/", {"expand": "owner"})
+        self.assertEqual({r["owner"]["username"] for r in response.data}, {"owner0", "owner1"})
+
+        response = self.client.get(f"/api/restaurant/{self.restaurants[0].id}/", {"fields": "id,owner.username"})
+        self.assertEqual(response.data, {"id": self.restaurants[0].id, "owner": {"username": "owner0"}})
+
+    def test_retrieve_keeps_the_full_representation(self):
+        """Test that a detail read without parameters still nests the owner with its role."""
+        response = self.client.get(f"/api/restaurant/{self.restaurants[0].id}/")
+        self.assertEqual(response.data["owner"]["username"], "owner0")
+        self.assertIn("role", response.data["owner"])
+
+    def test_nested_relations_are_not_joined_unless_rendered(self):
+        """Test that a category list only joins the restaurant and its owner when they are expanded."""
+        Category.objects.create(restaurant=self.restaurants[0], name="Mains")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/orders/categories/", {"fields": "id,name"})
+        self.assertEqual(response.data["results"][0], {"id": response.data["results"][0]["id"], "name": "Mains"})
+        self.assertNotIn("restaurant_restaurant", self.row_query(queries, "orders_category"))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/orders/categories/", {"expand": "restaurant.owner"})
+        self.assertEqual(response.data["results"][0]["restaurant"]["owner"]["username"], "owner0")
+        self.assertIn('JOIN "users_customuser"', self.row_query(queries, "orders_category"))
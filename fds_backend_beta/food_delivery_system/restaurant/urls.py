@@ -1,11 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from food_delivery_system.restaurant.views import RestaurantViewSet
+from food_delivery_system.restaurant.views import RestaurantViewSet, menu_feed_stream
 
 router = DefaultRouter()
 router.register(r'', RestaurantViewSet, basename='restaurant')
 
 urlpatterns = [
+    path('<int:restaurant_id>/menu/feed/', menu_feed_stream, name='restaurant-menu-feed'),  # Server-sent events of the menu's availability
     path('', include(router.urls)),
 ]
 
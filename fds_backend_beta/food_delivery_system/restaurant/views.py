@@ -5,26 +5,55 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from django.utils import timezone
 from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
-from rest_framework.exceptions import PermissionDenied, NotFound
-from food_delivery_system.serializers.serializer import RestaurantSerializer
-from food_delivery_system.permissions.permission import IsRestaurantOwner, IsRestaurantManagerOrOwner, IsCustomer, IsChef, IsDeliveryPersonnel
+from rest_framework.exceptions import PermissionDenied, NotFound, ValidationError
+from datetime import timedelta
+
+from django.http import StreamingHttpResponse
+from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
+from food_delivery_system.serializers.serializer import (RestaurantSerializer, RestaurantRollupSerializer,
+                                                        MenuSearchResultSerializer, MenuAvailabilitySerializer,
+                                                        NearbyRestaurantSerializer)
+from food_delivery_system.permissions.permission import (IsRestaurantOwner, IsRestaurantManagerOrOwner, IsCustomer, IsChef,
+                                                         IsDeliveryPersonnel, CanViewAnalyticsPermission)
+from food_delivery_system.orders.feed import menu_feed, stream_events
+from food_delivery_system.restaurant.analytics import GRANULARITIES
+from food_delivery_system.restaurant.menu_import import FORMATS, import_menu
+from food_delivery_system.restaurant.menu import current_menu_version, get_menu, menu_etag, set_availability
+from food_delivery_system.restaurant.nearby import nearest_restaurants
+from food_delivery_system.restaurant.search import search_menu_items
+from food_delivery_system.utils.dates import parse_moment
+from food_delivery_system.utils.pagination import CustomPagination
 
 
 from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
 from rest_framework.exceptions import PermissionDenied, NotFound
 from django.utils import timezone
+from django.conf import settings
 from django.db import transaction
 from food_delivery_system.restaurant.models import Restaurant
+from food_delivery_system.utils.conditional import ConditionalGetMixin
+from food_delivery_system.utils.prefetch import PrefetchPlanMixin, apply_prefetch_plan
 
 
-class RestaurantViewSet(viewsets.ModelViewSet):
+class RestaurantViewSet(ConditionalGetMixin, PrefetchPlanMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing Restaurant CRUD operations.
     """
     queryset = Restaurant.objects.all().order_by('-created_at')
     serializer_class = RestaurantSerializer
     permission_classes = [permissions.IsAuthenticated]
+    conditional_fields = ('updated_at', 'owner_id')    # The owner is rendered nested
+    compact_actions = ('list', 'nearby')    # Relations collapsed by default, see utils/dynamic_fields.py
+
+    def get_validators(self):
+        if self.action == 'menu':
+            # The version from the restaurant row, a revalidated menu costs that single query
+            pk = self.kwargs['pk']
+            self.menu_version = current_menu_version(int(pk)) if pk.isdigit() else None
+            return (menu_etag(pk, self.menu_version), None) if self.menu_version is not None else None
+        return super().get_validators()
 
     def get_permissions(self):
         """
@@ -32,6 +61,8 @@ class RestaurantViewSet(viewsets.ModelViewSet):
         """
         if self.action in ['create', 'partial_update', 'update', 'partial_update', 'destroy']:
             return [IsRestaurantOwner(), IsRestaurantManagerOrOwner()]
+        if self.action == 'analytics':
+            return [permissions.IsAuthenticated(), CanViewAnalyticsPermission()]
         return super().get_permissions()
 
     # @transaction.atomic
@@ -91,4 +122,165 @@ class RestaurantViewSet(viewsets.ModelViewSet):
         except NotFound:
             return Response({'error': 'Restaurant not found.'}, status=status.HTTP_404_NOT_FOUND)
 
+    @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny])
+    def search(self, request):
+        """
+        Search the available dishes of all restaurants by dish, category, restaurant name and
+        description, best matches first. Query params: `q` (required), `page`, `page_size`.
+        """
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({'error': 'The q parameter is required.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = CustomPagination()
+        page = paginator.paginate_queryset(search_menu_items(text), request, view=self)
+        serializer = MenuSearchResultSerializer(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny])
+    def nearby(self, request):
+        """
+        The restaurants nearest to a point, nearest first, with their distance. Query params:
+        `lat` and `lng` (default the signed-in user's coordinates), `k` (default 10, at most 50)
+        and `radius_km` (default and at most `NEARBY_MAX_RADIUS_KM`).
+        """
+        params = request.query_params
+        user = request.user
+        try:
+            if 'lat' in params or 'lng' in params:
+                latitude, longitude = float(params['lat']), float(params['lng'])
+            elif user.is_authenticated and user.latitude is not None and user.longitude is not None:
+                latitude, longitude = user.latitude, user.longitude
+            else:
+                return Response({'error': 'The lat and lng parameters are required.'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            k = int(params.get('k', 10))
+            radius_km = float(params.get('radius_km', settings.NEARBY_MAX_RADIUS_KM))
+        except (KeyError, ValueError):
+            return Response({'error': 'lat, lng, k and radius_km must be numbers.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            return Response({'error': 'lat or lng is out of range.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not (1 <= k <= 50 and 0 < radius_km <= settings.NEARBY_MAX_RADIUS_KM):
+            return Response({'error': f'k must be between 1 and 50 and radius_km at most {settings.NEARBY_MAX_RADIUS_KM}.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = NearbyRestaurantSerializer(many=True, context=self.get_serializer_context())
+        queryset = apply_prefetch_plan(Restaurant.objects.all(), serializer)
+        serializer.instance = nearest_restaurants(latitude, longitude, k=k, radius_km=radius_km, queryset=queryset)
+        return Response({'results': serializer.data})
+
+    @action(detail=True, methods=['get'], permission_classes=[permissions.AllowAny])
+    def menu(self, request, pk=None):
+        """
+        Read the restaurant's menu, served from its versioned snapshot: a cache hit costs a
+        single query, the current version read along with the validators.
+        """
+        menu = get_menu(int(pk), self.menu_version) if self.menu_version is not None else None
+        if menu is None:
+            return Response({'error': 'Restaurant not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(menu, headers={'ETag': menu_etag(pk, menu['version'])})
+
+    @action(detail=True, methods=['post'], url_path='menu/availability')
+    def menu_availability(self, request, pk=None):
+        """
+        Mark many menu items available or sold out at once, e.g. a chef closing out dishes
+        during service. Requires `can_mark_available` or `can_mark_unavailable` and working at
+        (or owning) the restaurant. Menu caches and menu feeds learn about it on commit.
+        """
+        serializer = MenuAvailabilitySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        available = serializer.validated_data['available']
+
+        try:
+            restaurant = self.get_object()
+        except NotFound:
+            return Response({'error': 'Restaurant not found.'}, status=status.HTTP_404_NOT_FOUND)
+        user = request.user
+        permission = 'orders.can_mark_available' if available else 'orders.can_mark_unavailable'
+        works_here = user.is_superuser or restaurant.owner_id == user.id or restaurant.staff.filter(user=user).exists()
+        if not (works_here and user.has_perm(permission)):
+            return Response({'error': 'You do not have permission to change the availability of this menu.'},
+                            status=status.HTTP_403_FORBIDDEN)
 
+        changed, not_found = set_availability(restaurant.id, serializer.validated_data['items'], available)
+        return Response({'updated': changed, 'not_found': not_found}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='menu-import', parser_classes=[MultiPartParser])
+    def menu_import(self, request):
+        """
+        Bulk import menus from an uploaded CSV or NDJSON `file` (`format`, default from the file
+        name), see `menu_import`. Requires `can_manage_menuitems`; rows may only target the
+        restaurants the user owns or works at. Invalid rows are skipped and reported, unless
+        `strict` is set, then nothing is imported.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'A menu file is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = request.data.get('format') or ('ndjson' if upload.name.endswith(('.ndjson', '.jsonl')) else 'csv')
+        if fmt not in FORMATS:
+            return Response({'error': f"format must be one of {', '.join(FORMATS)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        user = request.user
+        allowed = None
+        if not user.is_superuser:
+            if not user.has_perm('orders.can_manage_menuitems'):
+                return Response({'error': 'You do not have permission to import menus.'},
+                                status=status.HTTP_403_FORBIDDEN)
+            allowed = set(Restaurant.objects.filter(owner=user).values_list('id', flat=True))
+            allowed.update(Restaurant.objects.filter(staff__user=user).values_list('id', flat=True))
+
+        strict = str(request.data.get('strict', '')).lower() in ('1', 'true', 'yes')
+        summary = import_menu(upload, fmt, allowed_restaurants=allowed, strict=strict)
+        rejected = strict and summary['error_count']
+        return Response(summary, status=status.HTTP_400_BAD_REQUEST if rejected else status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'])
+    def analytics(self, request, pk=None):
+        """
+        Read the restaurant's pre-aggregated order statistics.
+
+        Query params: `granularity` (hourly or daily, default daily), `start` and `end` (ISO 8601,
+        default the last 30 days or the last 48 hours).
+        """
+        try:
+            restaurant = self.get_object()
+        except PermissionDenied:
+            return Response({'error': 'You do not have permission to view the analytics of this restaurant.'},
+                            status=status.HTTP_403_FORBIDDEN)
+        except NotFound:
+            return Response({'error': 'Restaurant not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        granularity = request.query_params.get('granularity', 'daily')
+        if granularity not in GRANULARITIES:
+            return Response({'error': f"granularity must be one of {', '.join(GRANULARITIES)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        model, _ = GRANULARITIES[granularity]
+
+        end = request.query_params.get('end')
+        start = request.query_params.get('start')
+        try:
+            # `end` first, the default `start` is derived from it
+            end = parse_moment('end', end) if end else timezone.now()
+            start = parse_moment('start', start) if start else end - (timedelta(days=30) if granularity == 'daily' else timedelta(hours=48))
+        except ValidationError:
+            return Response({'error': 'start and end must be ISO 8601 datetimes.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        rollups = model.objects.filter(restaurant=restaurant, bucket__gte=start, bucket__lt=end).order_by('bucket')
+        return Response({
+            'restaurant': restaurant.id,
+            'granularity': granularity,
+            'results': RestaurantRollupSerializer(rollups, many=True, context=self.get_serializer_context()).data,
+        })
+
+
+async def menu_feed_stream(request, restaurant_id):
+    """
+    Stream the availability changes of a restaurant's menu as server-sent events, so open menus
+    grey out sold-out dishes as soon as the kitchen marks them. Public, like the menu itself.
+    """
+    queue = menu_feed.subscribe(restaurant_id)
+    response = StreamingHttpResponse(stream_events(menu_feed, restaurant_id, queue), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
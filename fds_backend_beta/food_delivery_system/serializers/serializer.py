@@ -1,8 +1,13 @@
+from decimal import Decimal
+
 from rest_framework import serializers
 from django.apps import apps
 from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ObjectDoesNotExist
 
 from food_delivery_system.users.models import CustomUser
+from food_delivery_system.orders.history import build_order_history, skip_order_history_signals, store_order_history
+from food_delivery_system.utils.dynamic_fields import DynamicFieldsMixin
 
 Restaurant = apps.get_model('restaurant', 'Restaurant')
 Category = apps.get_model('orders', 'Category')
@@ -10,6 +15,7 @@ MenuItem = apps.get_model('orders', 'MenuItem')
 Order = apps.get_model('orders', 'Order')
 OrderItem = apps.get_model('orders', 'OrderItem')
 Staff = apps.get_model('orders', 'Staff')
+CustomerOrderHistory = apps.get_model('orders', 'CustomerOrderHistory')
 
 
 User = CustomUser
@@ -21,16 +27,19 @@ User = CustomUser
 #         fields = ["id", "username", "email", "phone_number", "address", "is_restaurant"]
 
 
-class UserRegistrationSerializer(serializers.ModelSerializer):
+class UserRegistrationSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True)
     role = serializers.SerializerMethodField(required=False)
 
     class Meta:
         model = CustomUser
-        fields = ['id', 'username', 'email', 'password', 'phone_number', 'address', 'is_restaurant', 'is_manager', 'is_chef', 'is_delivery_personnel', 'role']
+        fields = ['id', 'username', 'email', 'password', 'phone_number', 'address', 'latitude', 'longitude', 'is_restaurant', 'is_manager', 'is_chef', 'is_delivery_personnel', 'role']
         extra_kwargs = {
             'password': {'write_only': True},  # Ensure password is write-only
         }
+        # `get_role` reads the reverse Staff relation, join it when planning querysets (see utils/prefetch.py)
+        related_hints = {'role': 'staff'}
+        compact_fields = ['id', 'username', 'email']
 
     def create(self, validated_data):
         validated_data['password'] = make_password(validated_data['password'])  # Ensures password is hashed
@@ -63,9 +72,11 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
     
     def get_role(self, obj):
-        # Fetch the role from the related Staff model
-        staff = Staff.objects.filter(user=obj).first()
-        return staff.role if staff else None
+        # Fetch the role from the related Staff model, free of queries once `staff` is select_related
+        try:
+            return obj.staff.role
+        except ObjectDoesNotExist:
+            return None
 
     def validate_phone_number(self, value):
         if value == "":
@@ -74,85 +85,212 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("A user with this phone number already exists.")
         return value
 
-class OrderSerializer(serializers.ModelSerializer):
-    customer = UserRegistrationSerializer(read_only=True)  # Nesting customer details
+class OrderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     items = serializers.ListField(write_only=True)  # Accept items in the payload
 
     class Meta:
         model = Order
-        fields = ["id", "customer", "status", "restaurant", "status", "total_price", "created_at", "updated_at", "items"]
-        read_only_fields = ['created_at', 'updated_at']
+        fields = ["id", "customer", "status", "restaurant", "status", "total_price", "created_at", "updated_at", "version", "items"]
+        read_only_fields = ['customer', 'created_at', 'updated_at', 'version']
+        expandable_fields = {'customer': (UserRegistrationSerializer, {})}  # Nesting customer details
+        # Items are rendered from `order_items` in to_representation
+        related_hints = {'items': ('order_items', 'OrderItemSerializer')}
+
+    def validate_items(self, value):
+        """
+        Ensure every line item names a menu item and carries a positive integer quantity.
+        """
+        for item_data in value:
+            if not isinstance(item_data, dict) or not item_data.get("menu_item"):
+                raise serializers.ValidationError("Each item must provide a 'menu_item'.")
+            quantity = item_data.get("quantity", 1)
+            if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < 1:
+                raise serializers.ValidationError(f"Invalid quantity '{quantity}' for menu item '{item_data['menu_item']}'.")
+        return value
 
     def create(self, validated_data):
+        """
+        Place an order with a constant number of queries, regardless of the basket size.
+
+        All referenced menu items are resolved in one query (unknown names are created in a single
+        bulk insert), the order total is computed from the server-side prices, the order items
+        are written with one bulk insert and the customer's order history row with one upsert.
+        """
         # Extract items from the payload
         items_data = validated_data.pop("items", [])
-        order = super().create(validated_data)
+        menu_items = self._resolve_menu_items({item_data["menu_item"] for item_data in items_data})
 
-        # Create OrderItem and MenuItem objects
+        order_items = []
+        total_price = Decimal("0.00")
         for item_data in items_data:
-            menu_item_name = item_data.get("menu_item")
+            menu_item = menu_items[item_data["menu_item"]]
+            if not menu_item.available:
+                raise serializers.ValidationError({"items": [f"'{menu_item.name}' is sold out."]})
             quantity = item_data.get("quantity", 1)
+            price = Decimal(menu_item.price) * quantity
+            total_price += price
+            order_items.append(OrderItem(menu_item=menu_item, quantity=quantity, price=price))
 
-            # Create or get the MenuItem
-            menu_item, _ = MenuItem.objects.get_or_create(
-                name=menu_item_name,
-                defaults={"price": 0.00, "available": True}  # Default values for MenuItem
-            )
+        validated_data["total_price"] = total_price
+        # The history row is written once, after the bulk insert of the items
+        with skip_order_history_signals():
+            order = super().create(validated_data)
 
-            # Create the OrderItem
-            OrderItem.objects.create(
-                order=order,
-                menu_item=menu_item,
-                quantity=quantity,
-                price=menu_item.price * quantity,
-            )
+        for order_item in order_items:
+            order_item.order = order
+        OrderItem.objects.bulk_create(order_items)
+        store_order_history([build_order_history(order, order_items)])
 
         return order
 
+    @staticmethod
+    def _resolve_menu_items(names):
+        """
+        Map every menu item name to a MenuItem, creating the missing ones in bulk.
+        """
+        menu_items = {}
+        # Lowest id wins when several menu items share a name, mirroring get_or_create's first match.
+        for menu_item in MenuItem.objects.filter(name__in=names).order_by("-id"):
+            menu_items[menu_item.name] = menu_item
+
+        missing = [
+            MenuItem(name=name, price=Decimal("0.00"), available=True)  # Default values for MenuItem
+            for name in names if name not in menu_items
+        ]
+        for menu_item in MenuItem.objects.bulk_create(missing):
+            menu_items[menu_item.name] = menu_item
+        return menu_items
+
     def to_representation(self, instance):
         # Add items to the serialized output
         representation = super().to_representation(instance)
-        representation["items"] = OrderItemSerializer(instance.order_items.all(), many=True).data
+        if self.renders("items"):
+            representation["items"] = self.nested_serializer("items", OrderItemSerializer, instance.order_items.all(),
+                                                             many=True, context=self.context).data
         return representation
 
-class RestaurantSerializer(serializers.ModelSerializer):
-    owner = UserRegistrationSerializer(read_only=True)
+class BulkOrderStatusSerializer(serializers.Serializer):
+    """
+    Input of the bulk status update: a set of order ids and the status to move them to.
+    """
+    MAX_ORDERS = 100
 
-    class Meta:
-        model = Restaurant
-        fields = ['id', 'owner', 'name', 'address', 'phone', 'created_at', 'updated_at']
-        read_only_fields = ['owner', 'created_at', 'updated_at']
+    orders = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=MAX_ORDERS,
+    )
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
 
+    def validate_orders(self, value):
+        return list(dict.fromkeys(value))     # Drop duplicates, keep the request's order
 
-class CategorySerializer(serializers.ModelSerializer):
-    restaurant = RestaurantSerializer(read_only=True)
 
+class RestaurantSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Restaurant
+        fields = ['id', 'owner', 'name', 'address', 'latitude', 'longitude', 'phone', 'created_at', 'updated_at']
+        read_only_fields = ['owner', 'created_at', 'updated_at']
+        expandable_fields = {'owner': (UserRegistrationSerializer, {})}
+        compact_fields = ['id', 'owner', 'name', 'address']
+
+    def validate(self, attrs):
+        latitude = attrs.get('latitude', getattr(self.instance, 'latitude', None))
+        longitude = attrs.get('longitude', getattr(self.instance, 'longitude', None))
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError('latitude and longitude must be set together.')
+        return attrs
+
+
+class NearbyRestaurantSerializer(RestaurantSerializer):
+    distance_km = serializers.FloatField(read_only=True)
+
+    class Meta(RestaurantSerializer.Meta):
+        fields = RestaurantSerializer.Meta.fields + ['distance_km']
+        compact_fields = RestaurantSerializer.Meta.compact_fields + ['distance_km']
+
+
+class RestaurantRollupSerializer(DynamicFieldsMixin, serializers.Serializer):
+    """
+    Read-only representation of an hourly or daily analytics rollup.
+    """
+    bucket = serializers.DateTimeField()
+    order_count = serializers.IntegerField()
+    status_counts = serializers.JSONField()
+    revenue = serializers.DecimalField(max_digits=12, decimal_places=2)
+    average_basket = serializers.DecimalField(max_digits=10, decimal_places=2)
+    basket_size_p50 = serializers.FloatField(allow_null=True)
+    basket_size_p90 = serializers.FloatField(allow_null=True)
+    prep_time_p50 = serializers.FloatField(allow_null=True)
+    prep_time_p90 = serializers.FloatField(allow_null=True)
+    top_items = serializers.JSONField()
+
+
+class MenuAvailabilitySerializer(serializers.Serializer):
+    """
+    Input of the bulk availability update: menu item ids and their new availability.
+    """
+    MAX_ITEMS = 500
+
+    items = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=MAX_ITEMS)
+    available = serializers.BooleanField()
+
+    def validate_items(self, value):
+        return list(dict.fromkeys(value))     # Drop duplicates, keep the request's order
+
+
+class MenuSearchResultSerializer(DynamicFieldsMixin, serializers.Serializer):
+    """
+    Flat representation of a menu item search hit, with its category and restaurant.
+    """
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    description = serializers.CharField(allow_null=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    category = serializers.IntegerField(source='category_id')
+    category_name = serializers.CharField(source='category.name')
+    restaurant = serializers.IntegerField(source='category.restaurant_id')
+    restaurant_name = serializers.CharField(source='category.restaurant.name', allow_null=True)
+    rank = serializers.FloatField()
+
+
+class CategorySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'restaurant', 'name']
+        read_only_fields = ['restaurant']
+        expandable_fields = {'restaurant': (RestaurantSerializer, {})}
 
 
-class MenuItemSerializer(serializers.ModelSerializer):
-    category = CategorySerializer(read_only=True)
-
+class MenuItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = MenuItem
         fields = ['id', 'category', 'name', 'description', 'price', 'available', 'created_at']
+        read_only_fields = ['category']
+        expandable_fields = {'category': (CategorySerializer, {})}
+        compact_fields = ['id', 'category', 'name', 'price', 'available']
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
-    menu_item = MenuItemSerializer(read_only=True)
-
+class OrderItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = ['id', 'order_id', 'menu_item', 'quantity', 'price']
+        read_only_fields = ['menu_item']
+        expandable_fields = {'menu_item': (MenuItemSerializer, {})}
 
 
-class StaffSerializer(serializers.ModelSerializer):
-    user = UserRegistrationSerializer(read_only=True)
-    restaurant = RestaurantSerializer(read_only=True)
-
+class StaffSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Staff
         fields = ['id', 'user', 'restaurant', 'role', 'date_joined']
+        read_only_fields = ['user', 'restaurant']
+        expandable_fields = {'user': (UserRegistrationSerializer, {}), 'restaurant': (RestaurantSerializer, {})}
+        compact_fields = ['id', 'user', 'restaurant', 'role']
+
 
+class CustomerOrderHistorySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    id = serializers.IntegerField(source='order_id', read_only=True)
+    restaurant = serializers.IntegerField(source='restaurant_id', read_only=True)
+
+    class Meta:
+        model = CustomerOrderHistory
+        fields = ['id', 'status', 'restaurant', 'restaurant_name', 'total_price', 'created_at', 'updated_at', 'items']
+        read_only_fields = fields
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -80,6 +81,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_simplejwt',
     'django_extensions',
@@ -96,18 +98,22 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'food_delivery_system.utils.auth_context.ContextJWTAuthentication',  # simplejwt, user loaded with role and permissions
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',  # Require authentication by default
         # 'rest_framework.permissions.AllowAny',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'food_delivery_system.utils.renderers.ORJSONRenderer',  # orjson instead of json.dumps
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     # 'EXCEPTION_HANDLER': 'food_delivery_system.exceptions.custom_exception_handler',
 }
 
 AUTHENTICATION_BACKENDS = [
-    "graphql_jwt.backends.JSONWebTokenBackend",
-    "django.contrib.auth.backends.ModelBackend",
+    "food_delivery_system.graphql.utilities.utils.JSONWebTokenContextBackend",   # graphql_jwt, once per request
+    "food_delivery_system.permissions.bitsets.BitsetPermissionBackend",  # ModelBackend, permission checks on bitsets
 ]
 
 # JWT Settings (Optional - Customize as needed)
@@ -121,6 +127,45 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# How long a stored order response is replayed for a retried `Idempotency-Key`
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+
+# Order outbox: handlers per event topic (dotted paths) and delivery attempts before giving up
+OUTBOX_HANDLERS = {}
+OUTBOX_MAX_ATTEMPTS = 10
+
+# Orders: default time window of the staff order list (open orders are always listed), and age
+# of finished orders to archive
+ORDER_LIST_WINDOW = timedelta(days=30)
+ORDER_ARCHIVE_RETENTION = timedelta(days=90)
+# Order exports: rows fetched per round trip of the export cursor
+ORDER_EXPORT_CHUNK_SIZE = 2000
+
+# Restaurant menus: lifetime of a pre-rendered menu snapshot in the cache
+MENU_SNAPSHOT_TIMEOUT = 60 * 60 * 24
+
+# Menu search: text search configuration of the menu item search vectors
+MENU_SEARCH_CONFIG = "english"
+
+# Nearby restaurants: largest (and default) search radius, in km
+NEARBY_MAX_RADIUS_KM = 25
+
+# Response compression: smallest body worth compressing, in bytes, and brotli quality (0-11)
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_BROTLI_QUALITY = 5
+
+# GraphQL authentication: verified tokens remembered per worker, and their longest lifetime in seconds
+GRAPHQL_TOKEN_CACHE_SIZE = 1024
+GRAPHQL_TOKEN_CACHE_TTL = 300
+
+# Permission bitsets: users kept per worker, and lifetime in the shared cache in seconds
+PERMISSION_BITS_CACHE_SIZE = 4096
+PERMISSION_BITS_TIMEOUT = 60 * 60 * 24
+
+# User onboarding: largest batch, and processes hashing its passwords
+ONBOARDING_MAX_ROWS = 5000
+ONBOARDING_HASH_WORKERS = os.cpu_count() or 1
+
 GRAPHQL_JWT = {
     "JWT_ALLOW_REFRESH": True,
     "JWT_ALLOW_ARGUMENT": True,
@@ -132,7 +177,8 @@ GRAPHQL_JWT = {
 }
 
 MIDDLEWARE = [
-    'silk.middleware.SilkyMiddleware',  # Must be first!
+    'food_delivery_system.middleware.CompressionMiddleware',  # Outermost: compresses the final body, silk records it plain
+    'silk.middleware.SilkyMiddleware',  # Must be first after the compression!
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -189,6 +235,19 @@ DATABASES = {
     }
 }
 
+# Cache: must be shared by all the workers, GraphQL token revocations reach the other workers
+# through it (see graphql/utilities/token_cache.py). Menu snapshots and permission bitsets are
+# keyed by versions read from the database, sharing them only saves rendering them again.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL', 'redis://localhost:6379/0'),
+    }
+}
+if 'test' in sys.argv:
+    # Tests run in a single process
+    CACHES['default'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
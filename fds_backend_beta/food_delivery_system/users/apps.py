@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'food_delivery_system.users'
+
+    def ready(self):
+        from food_delivery_system.permissions.bitsets import compile_permissions
+        compile_permissions()
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.20 on 2026-10-17 22:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_customuser_is_chef_customuser_is_delivery_personnel_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['-date_joined', '-id'], name='user_joined_id_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.20 on 2026-10-18 00:12
+
+from django.db import migrations, models
+import food_delivery_system.users.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_customuser_latitude_customuser_longitude'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='permission_version',
+            field=models.PositiveIntegerField(default=food_delivery_system.users.models.new_permission_version, editable=False),
+        ),
+    ]
@@ -1,18 +1,37 @@
+import secrets
+
 from django.contrib.auth.models import AbstractUser, Group, Permission
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 
 
+def new_permission_version():
+    # Random, a version rolled back with its transaction is not handed out again
+    return secrets.randbits(31)
+
+
 class CustomUser(AbstractUser):
     phone_number = models.CharField(max_length=15, unique=True, null=True, blank=True)
     address = models.TextField(null=True, blank=True)
+    # Default location of the nearest restaurant searches
+    latitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
     is_restaurant = models.BooleanField(default=False)
     is_manager = models.BooleanField(default=False)
     is_chef = models.BooleanField(default=False)
     is_delivery_personnel = models.BooleanField(default=False)
+    # Changed with the user's permissions or groups, keys their cached permission bitset (permissions/bitsets.py)
+    permission_version = models.PositiveIntegerField(default=new_permission_version, editable=False)
 
     # Fix the conflicts by setting unique related_name attributes
     groups = models.ManyToManyField(Group, related_name="customuser_set", blank=True)
     user_permissions = models.ManyToManyField(Permission, related_name="customuser_permissions_set", blank=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Keyset pagination on (date_joined, id)
+            models.Index(fields=["-date_joined", "-id"], name="user_joined_id_idx"),
+        ]
+
     def __str__(self):
         return self.username
@@ -0,0 +1,263 @@
+"""
+Bulk onboarding of users.
+
+An onboarding file is CSV (with a header), NDJSON or a JSON array, one user per row with the
+fields ``username``, ``email``, ``password`` and optionally ``phone_number``, ``address`` and
+``role`` (customer, the default, manager, chef or delivery). The staff roles (manager, chef,
+delivery) also need the ``restaurant`` (id) they work at. Restaurant owners, who come with their
+restaurant, still register one at a time.
+
+A batch takes a few statements rather than a dozen per user:
+
+- rows are validated first, usernames and phone numbers checked against the file and against
+  the database in one query each,
+- passwords are hashed on a process pool, outside the transaction: a PBKDF2 hash is tens of ms
+  of CPU holding the GIL, threads would run them one after the other,
+- users, their Staff rows and their permission and group rows are inserted with `bulk_create`,
+  the permissions of the roles (their compiled bitsets, see permissions/bitsets.py) and their
+  groups being looked up once per batch.
+
+`bulk_create` sends no signals: the new users get their permission version with their row and
+no bitset of theirs is cached yet (see permissions/bitsets.py).
+"""
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, Permission
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db import transaction
+
+from food_delivery_system.orders.models import Staff
+from food_delivery_system.permissions.bitsets import ROLE_BITS, names_of
+from food_delivery_system.restaurant.menu_import import read_rows as read_lines
+from food_delivery_system.restaurant.models import Restaurant
+from food_delivery_system.utils.utilities import RBACPermissionManager
+
+User = get_user_model()
+
+FORMATS = ("csv", "ndjson", "json")
+ROLES = ("customer", "manager", "chef", "delivery")
+STAFF_ROLES = {role for role, _ in Staff.ROLE_CHOICES}
+ROLE_FLAGS = {"manager": "is_manager", "chef": "is_chef", "delivery": "is_delivery_personnel"}
+MAX_REPORTED_ERRORS = 100
+# Below this many passwords per worker, starting the pool costs more than it saves
+PASSWORDS_PER_WORKER = 8
+
+
+class OnboardingRowError(ValueError):
+    pass
+
+
+def format_of(filename):
+    """The onboarding format of a file, from its extension."""
+    if filename.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return "json" if filename.endswith(".json") else "csv"
+
+
+def read_rows(stream, fmt):
+    """
+    Yield ``(line number, row dict)`` from a binary or text stream, a JSON array giving the
+    position of its rows.
+    """
+    if fmt != "json":
+        yield from read_lines(stream, fmt)
+        return
+    try:
+        rows = json.load(stream)
+    except ValueError:
+        raise ValueError("The file is not valid JSON.")
+    if not isinstance(rows, list):
+        raise ValueError("A JSON file must hold an array of users.")
+    for position, row in enumerate(rows, start=1):
+        yield position, row if isinstance(row, dict) else OnboardingRowError("Not a JSON object.")
+
+
+def clean_row(row, allowed_restaurants=None):
+    """
+    Validate a parsed row, returns the field values of the user with their ``role`` and
+    ``restaurant_id``. Raises OnboardingRowError.
+    """
+    if isinstance(row, Exception):
+        raise OnboardingRowError(str(row))
+    if not isinstance(row, dict):
+        # Users of a JSON body are not read through `read_rows`
+        raise OnboardingRowError("Not a JSON object.")
+
+    def value(name, required=False):
+        raw = row.get(name)
+        raw = "" if raw is None else str(raw).strip()
+        if required and not raw:
+            raise OnboardingRowError(f"'{name}' is required.")
+        if not raw:
+            return None
+        try:
+            return User._meta.get_field(name).clean(raw, None)
+        except ValidationError as exc:
+            raise OnboardingRowError(f"'{name}': {' '.join(exc.messages)}")
+
+    values = {
+        "username": value("username", required=True),
+        "email": value("email", required=True),
+        "phone_number": value("phone_number"),
+        "address": value("address"),
+    }
+    password = row.get("password")
+    if not isinstance(password, str) or not password:
+        raise OnboardingRowError("'password' is required.")
+    try:
+        validate_password(password, User(**values))
+    except ValidationError as exc:
+        raise OnboardingRowError(f"'password': {' '.join(exc.messages)}")
+    values["password"] = password
+
+    role = str(row.get("role") or "customer").strip()
+    if role not in ROLES:
+        raise OnboardingRowError(f"'role' must be one of {', '.join(ROLES)}.")
+    values["role"] = role
+    values["restaurant_id"] = None
+    if role in STAFF_ROLES:
+        try:
+            values["restaurant_id"] = int(str(row.get("restaurant") or "").strip())
+        except ValueError:
+            raise OnboardingRowError(f"A {role} needs the id of their 'restaurant'.")
+        if allowed_restaurants is not None and values["restaurant_id"] not in allowed_restaurants:
+            raise OnboardingRowError(f"You cannot onboard staff of restaurant {values['restaurant_id']}.")
+    elif allowed_restaurants is not None:
+        raise OnboardingRowError("You can only onboard staff of your restaurants.")
+    return values
+
+
+def hash_passwords(passwords):
+    """
+    Hashes of ``passwords``, in order, computed on up to `ONBOARDING_HASH_WORKERS` processes.
+    """
+    workers = min(settings.ONBOARDING_HASH_WORKERS, len(passwords) // PASSWORDS_PER_WORKER)
+    if workers < 2:
+        return [make_password(password) for password in passwords]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(make_password, passwords, chunksize=-(-len(passwords) // (workers * 4))))
+
+
+def _role_permissions(roles):
+    """
+    Ids of the permissions of each role, from its compiled bitset, and of its group, groups
+    being created when missing.
+    """
+    names = {role: sorted(names_of(ROLE_BITS[role])) for role in roles}
+    wanted = {name for role_names in names.values() for name in role_names}
+    permissions = Permission.objects.filter(codename__in={name.partition(".")[2] for name in wanted})
+    permission_ids = {
+        f"{app_label}.{codename}": pk
+        for pk, app_label, codename in permissions.values_list("pk", "content_type__app_label", "codename")
+    }
+    missing = wanted - set(permission_ids)
+    if missing:
+        raise ImproperlyConfigured(f"Missing permissions: {', '.join(sorted(missing))}.")
+    role_map = RBACPermissionManager.role_permissions_map
+    return {
+        role: (
+            [permission_ids[name] for name in names[role]],
+            Group.objects.get_or_create(name=role_map[role]["group"])[0].pk,
+        )
+        for role in roles
+    }
+
+
+def _through_rows(field_name, pairs):
+    field = User._meta.get_field(field_name)
+    through = field.remote_field.through
+    user_column, target_column = f"{field.m2m_field_name()}_id", f"{field.m2m_reverse_field_name()}_id"
+    return through, [through(**{user_column: user_id, target_column: target_id}) for user_id, target_id in pairs]
+
+
+def onboard_users(rows, allowed_restaurants=None, strict=False):
+    """
+    Create the users of ``rows``, ``(line number, row dict)`` pairs as given by `read_rows`.
+    ``allowed_restaurants`` restricts the onboarding to staff of these restaurants (anyone by
+    default). Invalid rows are skipped and reported, with ``strict`` any invalid row cancels the
+    onboarding.
+
+    Returns a summary: rows read, users created, errors.
+    """
+    summary = {"rows": 0, "created": 0, "error_count": 0, "errors": []}
+
+    def report(line_no, message):
+        summary["error_count"] += 1
+        if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+            summary["errors"].append({"line": line_no, "error": message})
+
+    cleaned = []
+    seen = {"username": {}, "phone_number": {}}
+    for line_no, row in rows:
+        summary["rows"] += 1
+        if summary["rows"] > settings.ONBOARDING_MAX_ROWS:
+            raise ValueError(f"At most {settings.ONBOARDING_MAX_ROWS} users can be onboarded at once.")
+        try:
+            values = clean_row(row, allowed_restaurants)
+            for name, lines in seen.items():
+                if values[name] is not None and values[name] in lines:
+                    raise OnboardingRowError(f"'{name}' {values[name]} is already on line {lines[values[name]]}.")
+            for name, lines in seen.items():
+                if values[name] is not None:
+                    lines[values[name]] = line_no
+            cleaned.append((line_no, values))
+        except OnboardingRowError as exc:
+            report(line_no, str(exc))
+
+    # Against the database, one query per check
+    taken = {
+        "username": set(User.objects.filter(username__in=seen["username"]).values_list("username", flat=True)),
+        "phone_number": set(User.objects.filter(phone_number__in=seen["phone_number"])
+                               .values_list("phone_number", flat=True)),
+    }
+    restaurant_ids = {values["restaurant_id"] for _, values in cleaned if values["restaurant_id"] is not None}
+    restaurants = set(Restaurant.objects.filter(pk__in=restaurant_ids).values_list("pk", flat=True))
+    valid = []
+    for line_no, values in cleaned:
+        conflict = next((name for name in taken if values[name] in taken[name]), None)
+        if conflict:
+            report(line_no, f"A user with this '{conflict}' already exists.")
+        elif values["restaurant_id"] is not None and values["restaurant_id"] not in restaurants:
+            report(line_no, f"Restaurant {values['restaurant_id']} does not exist.")
+        else:
+            valid.append(values)
+
+    if not valid or (strict and summary["error_count"]):
+        return summary
+
+    hashes = hash_passwords([values["password"] for values in valid])
+    with transaction.atomic():
+        role_permissions = _role_permissions({values["role"] for values in valid})
+        users = User.objects.bulk_create([
+            User(
+                username=values["username"], email=values["email"], password=password,
+                phone_number=values["phone_number"], address=values["address"],
+                **({ROLE_FLAGS[values["role"]]: True} if values["role"] in ROLE_FLAGS else {}),
+            )
+            for values, password in zip(valid, hashes)
+        ])
+        if users[0].pk is None:
+            # Databases not returning the ids of inserted rows
+            ids = dict(User.objects.filter(username__in=[user.username for user in users])
+                                   .values_list("username", "pk"))
+            for user in users:
+                user.pk = ids[user.username]
+
+        Staff.objects.bulk_create([
+            Staff(user_id=user.pk, restaurant_id=values["restaurant_id"], role=values["role"])
+            for user, values in zip(users, valid) if values["role"] in STAFF_ROLES
+        ])
+        for field_name, pairs in (
+            ("user_permissions", [(user.pk, permission_id) for user, values in zip(users, valid)
+                                  for permission_id in role_permissions[values["role"]][0]]),
+            ("groups", [(user.pk, role_permissions[values["role"]][1]) for user, values in zip(users, valid)]),
+        ):
+            through, through_rows = _through_rows(field_name, pairs)
+            through.objects.bulk_create(through_rows)
+    summary["created"] = len(users)
+    return summary
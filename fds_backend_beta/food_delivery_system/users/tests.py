@@ -1,9 +1,34 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from graphql import GraphQLError
+from graphql_jwt.shortcuts import get_token
 from rest_framework.test import APIClient
 from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+from silk.collector import DataCollector
+from food_delivery_system.graphql.utilities.token_cache import TokenUserCache, stamp_key, token_users
+from food_delivery_system.graphql.utilities.utils import UserAuthentication
 from food_delivery_system.users.factories import CustomUserFactory, RestaurantFactory
 from food_delivery_system.users.models import CustomUser
+from food_delivery_system.users.onboarding import hash_passwords
+from food_delivery_system.orders.models import Staff
+from food_delivery_system.permissions import bitsets
+from food_delivery_system.permissions.bitsets import (CATALOGUE_DIGEST, PERMISSION_BITS, PERMISSION_NAMES, ROLE_BITS,
+                                                      bits_key, cached_permission_bits, user_permission_bits)
 from food_delivery_system.restaurant.models import Restaurant
+from food_delivery_system.utils.auth_context import load_user
 
 class UserViewSetTestCase(TestCase):
     def setUp(self):
@@ -94,4 +119,350 @@ class UserViewSetTestCase(TestCase):
         self.user.refresh_from_db()
         self.assertNotEqual(self.user.phone_number, "1234567890")  # Ensure no partial update occurred
 
-    
\ No newline at end of file
+    
+
+class UserKeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        """Set up an admin and enough users for several pages."""
+        self.client = APIClient()
+        self.admin_user = CustomUserFactory(is_staff=True, is_superuser=True)
+        self.client.force_authenticate(user=self.admin_user)
+        CustomUserFactory.create_batch(24)
+        self.user_list_url = "/api/users/"
+
+    def test_cursor_pages_cover_all_users_without_count(self):
+        """Test that walking the cursor pages returns every user once and never counts the table."""
+        seen = []
+        url = f"{self.user_list_url}?cursor=&page_size=10"
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertNotIn("total_objects", response.data)
+                seen.extend(user["id"] for user in response.data["results"])
+                url = response.data["next"]
+
+        self.assertEqual(len(seen), CustomUser.objects.count())
+        self.assertEqual(len(set(seen)), len(seen))
+        self.assertFalse(any("COUNT(" in query["sql"] for query in queries.captured_queries))
+
+    def test_previous_cursor_returns_previous_page(self):
+        """Test that the previous link of the second page returns the first page."""
+        first_page = self.client.get(f"{self.user_list_url}?cursor=&page_size=10").data
+        second_page = self.client.get(first_page["next"]).data
+        self.assertIsNone(first_page["previous"])
+
+        previous_page = self.client.get(second_page["previous"]).data
+        self.assertEqual(
+            [user["id"] for user in previous_page["results"]],
+            [user["id"] for user in first_page["results"]],
+        )
+
+    def test_page_number_mode_is_the_default(self):
+        """Test that page-number pagination is kept without the cursor parameter."""
+        response = self.client.get(self.user_list_url)
+        self.assertEqual(response.data["total_objects"], CustomUser.objects.count())
+
+
+class GraphQLTokenCacheTestCase(TestCase):
+    def setUp(self):
+        """Set up a user, one of their GraphQL tokens and an empty token cache."""
+        DataCollector().clear()
+        cache.clear()     # Revocation stamps of earlier tests' users
+        token_users.clear()
+        self.addCleanup(token_users.clear)
+        self.user = CustomUserFactory()
+        self.token = get_token(self.user)
+        self.user_auth = UserAuthentication()
+
+    def test_repeated_calls_do_not_query_the_users_table(self):
+        """Test that a token verified once is resolved from the cache afterwards."""
+        self.assertEqual(self.user_auth.get_user_authentication(self.token), self.user)
+        with self.assertNumQueries(0):
+            cached = self.user_auth.get_user_authentication(self.token)
+        self.assertEqual((cached.pk, cached.username), (self.user.pk, self.user.username))
+        self.assertIsNot(cached, self.user_auth.get_user_authentication(self.token))
+
+    def test_saving_the_user_drops_their_tokens(self):
+        """Test that a password change or a deactivation is seen by the next call."""
+        self.user_auth.get_user_authentication(self.token)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password("n3w-Passw0rd")
+            self.user.save()
+        with self.assertNumQueries(1):
+            self.user_auth.get_user_authentication(self.token)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        with self.assertRaises(GraphQLError):
+            self.user_auth.get_user_authentication(self.token)
+
+    def test_revocations_reach_the_other_workers(self):
+        """Test that a save or a permission change in one worker drops the user's tokens cached by another."""
+        other_worker = TokenUserCache(max_size=10, max_ttl=60)
+        other_worker.set(self.token, {}, self.user, other_worker.stamp_of(self.user.username))
+        self.assertEqual(other_worker.get(self.token).pk, self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertIsNone(other_worker.get(self.token))
+
+        other_worker.set(self.token, {}, self.user, other_worker.stamp_of(self.user.username))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.add(Group.objects.create(name="Revoked couriers"))
+        self.assertIsNone(other_worker.get(self.token))
+
+    def test_revocation_committed_while_loading_the_user_is_not_missed(self):
+        """Test that an entry filled from a row read before a revocation is not served."""
+        stamp = token_users.stamp_of(self.user.username)
+        stale = CustomUser.objects.get(pk=self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password("n3w-Passw0rd")
+            self.user.save()
+        token_users.set(self.token, {}, stale, stamp)
+        self.assertIsNone(token_users.get(self.token))
+
+    def test_evicted_stamp_is_a_miss(self):
+        """Test that an entry whose revocation stamp left the shared cache is not served again."""
+        self.user_auth.get_user_authentication(self.token)
+        cache.delete(stamp_key("id", self.user.pk))
+        self.assertIsNone(token_users.get(self.token))
+
+        cache.clear()
+        token_users.set(self.token, {}, self.user, None)
+        self.assertIsNone(token_users.get(self.token))
+        self.assertEqual(len(token_users), 0)
+
+    def test_tampered_payload_is_not_served_from_the_cache(self):
+        """Test that a token reusing a cached signature over another payload is rejected."""
+        self.user_auth.get_user_authentication(self.token)
+        other = get_token(CustomUserFactory()).split(".")
+        forged = ".".join([other[0], other[1], self.token.split(".")[2]])
+        with self.assertRaises(GraphQLError):
+            self.user_auth.get_user_authentication(forged)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        """Test that the cache keeps its size, evicting the least recently used token."""
+        cache = TokenUserCache(max_size=2, max_ttl=60)
+        users = CustomUserFactory.create_batch(3)
+        tokens = [get_token(user) for user in users]
+        stamps = [cache.stamp_of(user.username) for user in users]
+        cache.set(tokens[0], {}, users[0], stamps[0])
+        cache.set(tokens[1], {}, users[1], stamps[1])
+        cache.get(tokens[0])
+        cache.set(tokens[2], {}, users[2], stamps[2])
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(tokens[1]))
+        self.assertEqual(cache.get(tokens[0]).pk, users[0].pk)
+        cache.set(tokens[1], {"exp": 0}, users[1], stamps[1])
+        self.assertIsNone(cache.get(tokens[1]))
+
+
+class AuthContextTestCase(TestCase):
+    def setUp(self):
+        """Set up a chef with a direct and a group permission, and an empty token cache."""
+        DataCollector().clear()
+        token_users.clear()
+        self.addCleanup(token_users.clear)
+        self.user = CustomUserFactory()
+        restaurant = Restaurant.objects.create(name="Auth kitchen")
+        Staff.objects.create(user=self.user, restaurant=restaurant, role="chef")
+        self.user.user_permissions.add(Permission.objects.get(codename="can_mark_available"))
+        group = Group.objects.create(name="Auth chefs")
+        group.permissions.add(Permission.objects.get(codename="can_update_order_status"))
+        self.user.groups.add(group)
+
+    def auth_queries(self, queries):
+        return [query["sql"] for query in queries.captured_queries
+                if '"users_customuser"' in query["sql"] and "WHERE" in query["sql"]
+                and not any(marker in query["sql"] for marker in ("silk_", "EXPLAIN"))]
+
+    def test_role_and_permissions_are_checked_without_queries(self):
+        """Test that the staff role comes with the loaded user and permissions from the cached bitset."""
+        self.assertTrue(load_user(pk=self.user.pk).has_perm("orders.can_mark_available"))
+        with self.assertNumQueries(1):
+            user = load_user(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(user.staff.role, "chef")
+            self.assertTrue(user.has_perm("orders.can_mark_available"))
+            self.assertTrue(user.has_perm("orders.can_update_order_status"))
+            self.assertFalse(user.has_perm("orders.can_mark_delivered"))
+
+    def test_graphql_request_authenticates_once(self):
+        """Test that the JWT middleware and the resolvers of a GraphQL request share a single auth query."""
+        token = get_token(self.user)
+        query = '{ allUsers(token: "%s") { id } currentUser(token: "%s") { id } }' % (token, token)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/graphql/", {"query": query}, content_type="application/json",
+                                        HTTP_AUTHORIZATION=f"JWT {token}")
+        self.assertNotIn("errors", response.json())
+        self.assertEqual(response.json()["data"]["currentUser"], {"id": str(self.user.id)})
+        self.assertEqual(len(self.auth_queries(queries)), 1)
+
+    def test_rest_request_reads_the_role_with_the_user(self):
+        """Test that the staff role checked by the order views comes with the authenticated user."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/orders/",
+                                       HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(len(self.auth_queries(queries)), 1)
+        self.assertFalse(any('FROM "orders_staff"' in sql for sql in (query["sql"] for query in queries.captured_queries)))
+
+
+class PermissionBitsetTestCase(TestCase):
+    def setUp(self):
+        """Set up a user in an empty group."""
+        self.user = CustomUserFactory()
+        self.group = Group.objects.create(name="Bitset couriers")
+        self.user.groups.add(self.group)
+        self.delivered = Permission.objects.get(codename="can_mark_delivered")
+
+    def test_role_map_is_compiled(self):
+        """Test that each role of the role map has the bits of its permissions."""
+        self.assertEqual(ROLE_BITS["delivery"], PERMISSION_BITS["orders.can_mark_delivered"])
+        self.assertEqual(bin(ROLE_BITS["chef"]).count("1"), 4)
+
+    def test_bitsets_cached_under_another_catalogue_are_not_read(self):
+        """Test that a bitset cached by code with a different permission catalogue is ignored."""
+        version = self.user.permission_version
+        cache.set(bits_key(self.user.pk, version, CATALOGUE_DIGEST), (1 << len(PERMISSION_NAMES)) - 1)
+        self.assertTrue(CustomUser.objects.get(pk=self.user.pk).has_perm("orders.can_mark_delivered"))
+        with mock.patch.object(bitsets, "CATALOGUE_DIGEST", "renumbered"):
+            self.assertFalse(CustomUser.objects.get(pk=self.user.pk).has_perm("orders.can_mark_delivered"))
+        cache.delete(bits_key(self.user.pk, version, CATALOGUE_DIGEST))
+        cached_permission_bits.cache_clear()
+
+    def test_user_permission_change_gives_a_new_version(self):
+        """Test that adding a permission to a user is seen by the instance and by fresh loads."""
+        self.assertFalse(self.user.has_perm("orders.can_mark_delivered"))
+        version = self.user.permission_version
+        self.user.user_permissions.add(self.delivered)
+        self.assertNotEqual(self.user.permission_version, version)
+        self.assertTrue(self.user.has_perm("orders.can_mark_delivered"))
+        self.assertTrue(CustomUser.objects.get(pk=self.user.pk).has_perm("orders.can_mark_delivered"))
+
+    def test_group_permission_change_reaches_its_members(self):
+        """Test that a permission given to a group is checked for its members without queries once cached."""
+        self.assertFalse(CustomUser.objects.get(pk=self.user.pk).has_perm("orders.can_mark_delivered"))
+        self.group.permissions.add(self.delivered)
+        user = CustomUser.objects.get(pk=self.user.pk)
+        user_permission_bits(user)
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm("orders.can_mark_delivered"))
+            self.assertEqual(user.get_all_permissions(), {"orders.can_mark_delivered"})
+
+        self.group.permissions.clear()
+        self.assertFalse(CustomUser.objects.get(pk=self.user.pk).has_perm("orders.can_mark_delivered"))
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class BulkOnboardingTestCase(TestCase):
+    url = "/api/users/bulk-onboard/"
+    header = "username,email,password,phone_number,address,role,restaurant"
+
+    def setUp(self):
+        """Set up an admin client and a restaurant."""
+        self.client = APIClient()
+        self.client.force_authenticate(user=CustomUserFactory(is_staff=True, is_superuser=True))
+        self.restaurant = Restaurant.objects.create(name="Onboarding kitchen")
+
+    def upload(self, *lines, **data):
+        content = "\n".join((self.header,) + lines).encode()
+        return self.client.post(self.url, {"file": SimpleUploadedFile("users.csv", content), **data},
+                                format="multipart")
+
+    def test_csv_upload_creates_users_with_their_roles(self):
+        """Test that an uploaded CSV creates the users with their Staff row, permissions and group."""
+        response = self.upload(
+            f"chef1,chef1@example.com,Saffron-rice-42,555000001,,chef,{self.restaurant.id}",
+            "diner1,diner1@example.com,Mango-lassi-42,,1 Main St,,",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data["rows"], response.data["created"], response.data["error_count"]), (2, 2, 0))
+
+        chef = CustomUser.objects.get(username="chef1")
+        self.assertTrue(check_password("Saffron-rice-42", chef.password))
+        self.assertTrue(chef.is_chef)
+        self.assertEqual((chef.staff.restaurant, chef.staff.role), (self.restaurant, "chef"))
+        self.assertTrue(chef.has_perm("orders.can_mark_available"))
+        self.assertEqual(user_permission_bits(chef) & ROLE_BITS["chef"], ROLE_BITS["chef"])
+        self.assertEqual(list(chef.groups.values_list("name", flat=True)), ["Chefs"])
+        diner = CustomUser.objects.get(username="diner1")
+        self.assertTrue(diner.has_perm("orders.can_cancel_order"))
+        self.assertFalse(Staff.objects.filter(user=diner).exists())
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        """Test that duplicates, taken usernames, unknown restaurants and weak passwords are reported per row."""
+        taken = CustomUserFactory()
+        response = self.upload(
+            "cook1,cook1@example.com,Saffron-rice-42,,,chef,999999",
+            "cook2,cook2@example.com,Saffron-rice-42,,,delivery," + str(self.restaurant.id),
+            "cook2,cook3@example.com,Saffron-rice-42,,,customer,",
+            f"{taken.username},taken@example.com,Saffron-rice-42,,,customer,",
+            "cook4,cook4@example.com,123,,,customer,",
+            "cook5,not-an-email,Saffron-rice-42,,,customer,",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data["created"], response.data["error_count"]), (1, 5))
+        self.assertEqual(sorted(error["line"] for error in response.data["errors"]), [2, 4, 5, 6, 7])
+        self.assertEqual(list(CustomUser.objects.filter(username__startswith="cook").values_list("username", flat=True)),
+                         ["cook2"])
+
+    def test_strict_onboarding_creates_nobody(self):
+        """Test that with strict set, an invalid row cancels the onboarding."""
+        response = self.upload("solo,solo@example.com,Saffron-rice-42,,,customer,", "broken,,,,,,", strict="true")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(CustomUser.objects.filter(username="solo").exists())
+
+    def test_staff_managers_onboard_their_own_restaurants_only(self):
+        """Test that the endpoint requires can_manage_staff and limits rows to the user's restaurants."""
+        owner = CustomUserFactory()
+        Restaurant.objects.filter(pk=self.restaurant.pk).update(owner=owner)
+        other = Restaurant.objects.create(name="Other kitchen")
+        users = [
+            {"username": "mine", "email": "mine@example.com", "password": "Saffron-rice-42", "role": "delivery",
+             "restaurant": self.restaurant.id},
+            {"username": "theirs", "email": "theirs@example.com", "password": "Saffron-rice-42", "role": "delivery",
+             "restaurant": other.id},
+            {"username": "guest", "email": "guest@example.com", "password": "Saffron-rice-42"},
+        ]
+        self.client.force_authenticate(user=owner)
+        self.assertEqual(self.client.post(self.url, {"users": users}, format="json").status_code,
+                         status.HTTP_403_FORBIDDEN)
+
+        owner.user_permissions.add(Permission.objects.get(codename="can_manage_staff"))
+        self.client.force_authenticate(user=CustomUser.objects.get(pk=owner.pk))
+        response = self.client.post(self.url, {"users": users}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data["created"], response.data["error_count"]), (1, 2))
+        self.assertEqual(Staff.objects.get(user__username="mine").restaurant, self.restaurant)
+
+    def test_json_body_entries_must_be_objects(self):
+        """Test that entries of a JSON body which are not objects are reported as invalid rows."""
+        users = ["bob", {"username": "alice", "email": "alice@example.com", "password": "Saffron-rice-42"}]
+        response = self.client.post(self.url, {"users": users}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["created"], 1)
+        self.assertEqual(response.data["errors"], [{"line": 1, "error": "Not a JSON object."}])
+
+    @override_settings(ONBOARDING_HASH_WORKERS=2)
+    def test_passwords_are_hashed_on_a_process_pool(self):
+        """Test that a batch large enough for the pool gets the hashes of its passwords, in order."""
+        passwords = [f"password-{n}" for n in range(20)]
+        hashes = hash_passwords(passwords)
+        self.assertEqual(len(hashes), 20)
+        self.assertTrue(all(check_password(password, hashed) for password, hashed in zip(passwords, hashes)))
+
+    def test_command_onboards_a_json_file(self):
+        """Test that the onboard_users command reads a JSON array and prints the summary."""
+        out = StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "users.json")
+            with open(path, "w") as stream:
+                json.dump([{"username": "courier1", "email": "courier1@example.com", "password": "Saffron-rice-42",
+                            "role": "delivery", "restaurant": self.restaurant.id}], stream)
+            call_command("onboard_users", path, stdout=out, stderr=StringIO())
+        self.assertIn("1 users created", out.getvalue())
+        self.assertTrue(CustomUser.objects.get(username="courier1").is_delivery_personnel)
+
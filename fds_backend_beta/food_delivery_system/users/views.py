@@ -2,6 +2,8 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
 from rest_framework.exceptions import PermissionDenied, NotFound
 from rest_framework.views import APIView
+from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser, MultiPartParser
 from django.shortcuts import get_object_or_404
 from django.db.utils import IntegrityError
 from django.db import transaction
@@ -21,9 +23,11 @@ SilkyMiddleware.debug_mode = True
 
 from food_delivery_system.serializers.serializer import UserRegistrationSerializer
 from food_delivery_system.users.models import CustomUser
+from food_delivery_system.users.onboarding import FORMATS, format_of, onboard_users, read_rows
 from food_delivery_system.restaurant.models import Restaurant
 from food_delivery_system.orders.models import Staff
 from food_delivery_system.utils.pagination import CustomPagination
+from food_delivery_system.utils.prefetch import PrefetchPlanMixin
 from food_delivery_system.utils.utilities import RBACPermissionManager
 
 rbac_permissions = RBACPermissionManager()
@@ -44,7 +48,7 @@ rbac_permissions = RBACPermissionManager()
 #         return Response({"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
 
 
-class UserViewSet(ListModelMixin, RetrieveModelMixin, CreateModelMixin, GenericViewSet):
+class UserViewSet(PrefetchPlanMixin, ListModelMixin, RetrieveModelMixin, CreateModelMixin, GenericViewSet):
     """
     User management with robust error handling & custom pagination.
 
@@ -59,6 +63,7 @@ class UserViewSet(ListModelMixin, RetrieveModelMixin, CreateModelMixin, GenericV
     serializer_class = UserRegistrationSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = CustomPagination
+    cursor_ordering = ('-date_joined', '-id')  # Keyset pagination with `?cursor=`
 
     def get_queryset(self):
         """
@@ -81,7 +86,7 @@ class UserViewSet(ListModelMixin, RetrieveModelMixin, CreateModelMixin, GenericV
     def list(self, request, *args, **kwargs):
         """Retrieve all users with pagination."""
         try:
-            queryset = self.get_queryset()
+            queryset = self.filter_queryset(self.get_queryset())
             page = self.paginate_queryset(queryset)
             if page is not None:
                 serializer = self.get_serializer(page, many=True)
@@ -221,3 +226,41 @@ class UserViewSet(ListModelMixin, RetrieveModelMixin, CreateModelMixin, GenericV
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=False, methods=['post'], url_path='bulk-onboard', parser_classes=[MultiPartParser, JSONParser])
+    def bulk_onboard(self, request):
+        """
+        Onboard users in bulk from an uploaded CSV, NDJSON or JSON `file` (`format`, default from
+        the file name) or from a JSON body `{"users": [...]}`, see `onboard_users`. Superusers may
+        onboard anyone; users with `can_manage_staff` the staff of the restaurants they own or
+        work at. Invalid rows are skipped and reported, unless `strict` is set, then nobody is
+        created.
+        """
+        user = request.user
+        allowed = None
+        if not user.is_superuser:
+            if not user.has_perm('orders.can_manage_staff'):
+                return Response({'error': 'You do not have permission to onboard users.'},
+                                status=status.HTTP_403_FORBIDDEN)
+            allowed = set(Restaurant.objects.filter(owner=user).values_list('id', flat=True))
+            allowed.update(Restaurant.objects.filter(staff__user=user).values_list('id', flat=True))
+
+        upload = request.FILES.get('file')
+        if upload is not None:
+            fmt = request.data.get('format') or format_of(upload.name)
+            if fmt not in FORMATS:
+                return Response({'error': f"format must be one of {', '.join(FORMATS)}."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            rows = read_rows(upload, fmt)
+        elif isinstance(request.data.get('users'), list):
+            rows = enumerate(request.data['users'], start=1)
+        else:
+            return Response({'error': 'An onboarding file or a list of users is required.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        strict = str(request.data.get('strict', '')).lower() in ('1', 'true', 'yes')
+        try:
+            summary = onboard_users(rows, allowed_restaurants=allowed, strict=strict)
+        except (ValueError, IntegrityError) as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        rejected = strict and summary['error_count']
+        return Response(summary, status=status.HTTP_400_BAD_REQUEST if rejected else status.HTTP_201_CREATED)
@@ -0,0 +1,100 @@
+"""
+Per-request authentication context, shared by the REST and GraphQL paths.
+
+A GraphQL request authenticates its token in the JWT middleware of every root field and again
+in the resolvers taking a `token` argument. The context attached to the request resolves each
+token once and hands the same user to all of them.
+
+Users are loaded by `load_user` in a single query together with their `Staff` row, so the
+`UserPermissions` role checks (`user.staff`) run without queries; the permission classes
+(`user.has_perm`) read the user's cached permission bitset (see permissions/bitsets.py).
+"""
+from django.contrib.auth import get_user_model
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+User = get_user_model()
+
+
+def load_user(**lookup):
+    """
+    The user matching ``lookup`` with their Staff row, in one query.
+
+    Raises ``User.DoesNotExist`` like ``User.objects.get``.
+    """
+    return User.objects.select_related("staff").get(**lookup)
+
+
+class AuthContext:
+    """
+    Users of the tokens presented during one request, each token being resolved once; a failed
+    resolution is raised again to later callers.
+    """
+
+    def __init__(self):
+        self.user = None
+        self._resolved = {}
+
+    def resolve(self, token, authenticate):
+        """
+        The user of ``token``, from ``authenticate(token)`` the first time the token is seen.
+        """
+        if token not in self._resolved:
+            try:
+                self._resolved[token] = (authenticate(token), None)
+            except Exception as exc:
+                self._resolved[token] = (None, exc)
+        user, error = self._resolved[token]
+        if error is not None:
+            raise error
+        if user is not None:
+            self.user = user
+        return user
+
+
+def get_auth_context(request):
+    """
+    The authentication context of a request (a Django HttpRequest, a DRF Request or a GraphQL
+    context), created on first use.
+    """
+    request = getattr(request, "_request", request)
+    context = getattr(request, "auth_context", None)
+    if context is None:
+        context = request.auth_context = AuthContext()
+    return context
+
+
+class ContextJWTAuthentication(JWTAuthentication):
+    """
+    simplejwt authentication loading the user through `load_user` and recording them in the
+    request's authentication context.
+    """
+
+    def authenticate(self, request):
+        authenticated = super().authenticate(request)
+        if authenticated is not None:
+            get_auth_context(request).user = authenticated[0]
+        return authenticated
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        try:
+            user = load_user(**{api_settings.USER_ID_FIELD: user_id})
+        except User.DoesNotExist:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+
+        if not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+            api_settings.REVOKE_TOKEN_CLAIM
+        ) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed("The user's password has been changed.", code="password_changed")
+        return user
@@ -0,0 +1,92 @@
+import hashlib
+from datetime import datetime
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+class _NotModified(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+def make_etag(*parts):
+    """
+    Strong ETag of a list of validator values (timestamps, versions, ids).
+    """
+    digest = hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()[:24]
+    return f'"{digest}"'
+
+
+def latest(values):
+    return max((value for value in values if isinstance(value, datetime)), default=None)
+
+
+class ConditionalGetMixin:
+    """
+    ViewSet mixin answering conditional GETs (`If-None-Match`, `If-Modified-Since`) with a 304
+    before the action runs, so no serializer is involved. The validators are read from the
+    database columns named in ``conditional_fields`` (timestamps or versions of the object and
+    of the nested objects the serializer renders, e.g. ``('updated_at', 'restaurant__updated_at')``,
+    the latest timestamp is the Last-Modified date):
+
+    - retrieve: the values of the requested row, a single-row ``values_list`` query,
+    - list: ``max()`` of each column and the row count over the listed queryset, one aggregate
+      query, the query string is part of the ETag so every page has its own.
+
+    Other actions can provide ``(etag, last_modified)`` by overriding ``get_validators``.
+    Successful responses carry the ETag and Last-Modified headers.
+    """
+
+    conditional_fields = ('updated_at',)
+
+    def get_validators(self):
+        if self.action == 'retrieve':
+            lookup = self.lookup_url_kwarg or self.lookup_field
+            try:
+                values = self.get_queryset().filter(**{self.lookup_field: self.kwargs[lookup]}).order_by().values_list(
+                    *self.conditional_fields
+                ).first()
+            except (TypeError, ValueError):
+                values = None
+            if values is None:
+                return None     # The action answers the 404
+            return make_etag(self.kwargs[lookup], *values), latest(values)
+        if self.action == 'list':
+            aggregates = self.get_queryset().order_by().aggregate(
+                count=Count('pk'), **{f'max_{index}': Max(name) for index, name in enumerate(self.conditional_fields)}
+            )
+            values = [aggregates[f'max_{index}'] for index in range(len(self.conditional_fields))]
+            return make_etag(self.request.get_full_path(), aggregates['count'], *values), latest(values)
+        return None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)     # Authentication and permissions come first
+        self.validators = None
+        if request.method not in ('GET', 'HEAD'):
+            return
+        self.validators = self.get_validators()
+        if self.validators is None:
+            return
+        etag, last_modified = self.validators
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified and int(last_modified.timestamp()),
+        )
+        if not_modified is not None:
+            raise _NotModified(not_modified)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, _NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        validators = getattr(self, 'validators', None)
+        if validators and response.status_code in (200, 304):
+            etag, last_modified = validators
+            response.headers.setdefault('ETag', etag)
+            if last_modified is not None:
+                response.headers.setdefault('Last-Modified', http_date(last_modified.timestamp()))
+        return response
@@ -0,0 +1,23 @@
+"""
+Dates and datetimes of query parameters.
+"""
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+
+def parse_moment(name, value, expected="an ISO 8601 date or datetime"):
+    """
+    Parse an ISO 8601 date or datetime of the query parameter ``name`` into an aware datetime,
+    a date meaning its midnight. Raises ValidationError, also on well formed but impossible
+    values such as 2024-02-30.
+    """
+    try:
+        moment = parse_datetime(value) or (parse_date(value) and datetime.combine(parse_date(value), time.min))
+    except ValueError:
+        moment = None
+    if not moment:
+        raise ValidationError({name: f"Expected {expected}."})
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
@@ -0,0 +1,110 @@
+import sys
+
+from rest_framework.permissions import SAFE_METHODS
+
+
+def parse_paths(value):
+    """
+    Parse a comma separated list of dotted paths into a tree: ``"id,owner.username"`` gives
+    ``{"id": {}, "owner": {"username": {}}}``.
+    """
+    tree = {}
+    for path in (value or "").split(","):
+        node = tree
+        for name in filter(None, (part.strip() for part in path.split("."))):
+            node = node.setdefault(name, {})
+    return tree
+
+
+class FieldSpec:
+    """
+    What a serializer renders: ``fields``, the tree of requested fields (None for all of them),
+    ``expand``, the tree of relations to render nested ("*" for all of them), and whether the
+    compact defaults apply (collapsed relations, ``Meta.compact_fields``).
+    """
+
+    def __init__(self, fields=None, expand=None, compact=False):
+        self.fields = fields
+        self.expand = expand or {}
+        self.compact = compact
+
+    @classmethod
+    def from_request(cls, request, view=None):
+        # Writes are answered with the full representation
+        if request is None or request.method not in SAFE_METHODS:
+            return cls()
+        params = request.query_params
+        fields = parse_paths(params["fields"]) if "fields" in params else None
+        compact = getattr(view, "action", None) in getattr(view, "compact_actions", ("list",))
+        return cls(fields, parse_paths(params.get("expand")), compact=compact)
+
+    def expands(self, name):
+        return bool(not self.compact or name in self.expand or "*" in self.expand or (self.fields or {}).get(name))
+
+    def child(self, name):
+        fields = (self.fields or {}).get(name) or None
+        expand = {**self.expand.get("*", {}), **self.expand.get(name, {})} if "*" in self.expand else self.expand.get(name)
+        return FieldSpec(fields, expand, self.compact)
+
+
+class DynamicFieldsMixin:
+    """
+    Serializer mixin for sparse fieldsets and expandable relations, driven by the query string of
+    GET requests::
+
+        ?fields=id,name,owner.username     only these fields (a dotted path expands the relation)
+        ?expand=owner,restaurant.owner     render these relations nested ("*" for all of them)
+
+    Relations are declared in ``Meta.expandable_fields`` as ``{name: (serializer, kwargs)}``
+    instead of as nested serializer fields. A relation that is not expanded is rendered as its
+    primary key: its serializer is never instantiated, so the prefetch planner (see
+    utils/prefetch.py) does not join it either. List actions (the view's ``compact_actions``) use
+    compact defaults, relations are collapsed and only ``Meta.compact_fields`` (when set) are
+    rendered; other actions expand every relation, as before.
+
+    Nested serializers receive the matching branch of the spec, serializers built without a
+    request in the context render everything.
+    """
+
+    def __init__(self, *args, field_spec=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._field_spec = field_spec
+
+    @property
+    def field_spec(self):
+        if self._field_spec is None:
+            self._field_spec = FieldSpec.from_request(self.context.get("request"), self.context.get("view"))
+        return self._field_spec
+
+    def selected_fields(self):
+        spec = self.field_spec
+        if spec.fields is not None:
+            return set(spec.fields)
+        compact_fields = getattr(getattr(self, "Meta", None), "compact_fields", None)
+        if spec.compact and compact_fields:
+            return set(compact_fields)
+        return None
+
+    def renders(self, name):
+        selected = self.selected_fields()
+        return selected is None or name in selected
+
+    def nested_serializer(self, name, serializer_class, *args, **kwargs):
+        """
+        Instantiate the serializer of a relation with the branch of the spec it renders.
+        """
+        if isinstance(serializer_class, str):
+            serializer_class = getattr(sys.modules[type(self).__module__], serializer_class)
+        return serializer_class(*args, field_spec=self.field_spec.child(name), **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = self.selected_fields()
+        if selected is not None:
+            # Write-only fields are kept, they are never rendered
+            fields = {name: field for name, field in fields.items() if name in selected or field.write_only}
+
+        for name, (serializer_class, kwargs) in getattr(getattr(self, "Meta", None), "expandable_fields", {}).items():
+            if name in fields and self.field_spec.expands(name):
+                fields[name] = self.nested_serializer(name, serializer_class, read_only=True, **kwargs)
+        return fields
@@ -0,0 +1,119 @@
+"""
+Coordinates on a fixed latitude/longitude grid, for nearest-neighbour queries without PostGIS.
+
+The world is cut into cells of `CELL_DEGREES` by `CELL_DEGREES` and every located row stores
+the integer id of its cell (``row * COLUMNS + column``), B-tree indexed. The cells around a point
+are contiguous id ranges, one or two per grid row, so a square of cells is read with a handful
+of index range scans; the candidates are then ranked by exact distance with NumPy.
+
+Changing `CELL_DEGREES` invalidates the stored cell ids.
+"""
+import math
+
+import numpy as np
+
+CELL_DEGREES = 0.01     # About 1.1 km north-south
+ROWS = math.ceil(180 / CELL_DEGREES)
+COLUMNS = math.ceil(360 / CELL_DEGREES)
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# Column offsets from a point's column naming every column once
+LOWEST_COLUMN_OFFSET = -(COLUMNS // 2)
+HIGHEST_COLUMN_OFFSET = COLUMNS - 1 - COLUMNS // 2
+
+
+def _row(latitude):
+    return min(int((latitude + 90) // CELL_DEGREES), ROWS - 1)
+
+
+def _column(longitude):
+    return int((longitude + 180) // CELL_DEGREES) % COLUMNS
+
+
+def cell_of(latitude, longitude):
+    """
+    Grid cell id of a point, None when the point is not located.
+    """
+    if latitude is None or longitude is None:
+        return None
+    return _row(latitude) * COLUMNS + _column(longitude)
+
+
+def cell_ranges(latitude, longitude, first_ring, last_ring, max_row_offset=None):
+    """
+    Inclusive ``(low, high)`` cell id ranges of the cells whose ring around the point's cell is
+    between ``first_ring`` and ``last_ring`` (ring 0 is the cell itself, ring 1 its 8 neighbours...),
+    leaving out the rows further than ``max_row_offset`` from the point's row.
+
+    Towards the poles the rings needed to cover a distance east-west far exceed those needed
+    north-south: the rows are bounded separately, every column is read once however large the
+    ring, and adjacent ranges (consecutive full rows) are merged.
+    """
+    center_row, center_column = _row(latitude), _column(longitude)
+    row_reach = last_ring if max_row_offset is None else min(last_ring, max_row_offset)
+    ranges = []
+    for row in range(max(center_row - row_reach, 0), min(center_row + row_reach, ROWS - 1) + 1):
+        if abs(row - center_row) >= first_ring:
+            spans = [(-last_ring, last_ring)]
+        else:
+            spans = [(-last_ring, -first_ring), (first_ring, last_ring)]
+        for start, end in spans:
+            start, end = max(start, LOWEST_COLUMN_OFFSET), min(end, HIGHEST_COLUMN_OFFSET)
+            if start <= end:
+                ranges.extend(_column_ranges(row, center_column + start, center_column + end))
+    return _merged(ranges)
+
+
+def _merged(ranges):
+    merged = []
+    for low, high in sorted(ranges):
+        if merged and low <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+        else:
+            merged.append((low, high))
+    return merged
+
+
+def _column_ranges(row, first, last):
+    base = row * COLUMNS
+    if last - first + 1 >= COLUMNS:
+        return [(base, base + COLUMNS - 1)]
+    first, last = first % COLUMNS, last % COLUMNS
+    if first <= last:
+        return [(base + first, base + last)]
+    return [(base + first, base + COLUMNS - 1), (base, base + last)]     # Across the antimeridian
+
+
+def covered_km(latitude, rings):
+    """
+    Distance from the point within which every location lies in the first ``rings`` rings of
+    cells around it: the grid squares shrink east-west towards the poles.
+    """
+    farthest_latitude = min(abs(latitude) + (rings + 1) * CELL_DEGREES, 90)
+    return rings * CELL_DEGREES * KM_PER_DEGREE * math.cos(math.radians(farthest_latitude))
+
+
+def rings_for(latitude, radius_km):
+    """
+    Number of rings covering ``radius_km`` around a point, east-west: at most the rings reaching
+    every column.
+    """
+    shrink = max(math.cos(math.radians(min(abs(latitude) + radius_km / KM_PER_DEGREE + CELL_DEGREES, 90))), 1e-6)
+    return min(math.ceil(radius_km / (CELL_DEGREES * KM_PER_DEGREE * shrink)) + 1, HIGHEST_COLUMN_OFFSET + 1)
+
+
+def row_rings_for(radius_km):
+    """
+    Number of rows on either side of a point's row covering ``radius_km`` north-south.
+    """
+    return math.ceil(radius_km / (CELL_DEGREES * KM_PER_DEGREE)) + 1
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """
+    Great-circle distances in km from a point to arrays of points.
+    """
+    lat1, lng1 = math.radians(latitude), math.radians(longitude)
+    lat2, lng2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
@@ -0,0 +1,286 @@
+"""
+Index advisor: turn captured SQL into index proposals.
+
+Queries are collected either from django-silk's `SQLQuery` table or by running the list
+endpoint of every viewset, explained with `EXPLAIN (FORMAT JSON)` and searched for sequential
+scans and sorts on the tracked tables. Every candidate index is then created inside a
+transaction that is rolled back, so the estimated cost of each query can be compared with and
+without it. PostgreSQL only.
+"""
+import json
+import re
+from collections import OrderedDict
+
+from django.apps import apps
+from django.db import DatabaseError, connections, models, transaction
+from django.db.backends.utils import names_digest
+from django.db.migrations import AddIndex, Migration
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+from django.db.models import Q
+
+TRACKED_MODELS = ["orders.Order", "orders.OrderItem", "orders.MenuItem", "orders.Staff", "users.CustomUser"]
+
+_LITERAL = re.compile(r"'((?:[^']|'')*)'(?:::[\w ]+)?|(-?\d+(?:\.\d+)?)")
+_CONJUNCT = re.compile(
+    r"^\(*(?:\w+\.)?\"?(?P<column>\w+)\"?\)?(?:::[\w ]+)?\s*(?P<op>=|<=|>=|<|>|~~)\s*(?P<value>.*?)\)*$"
+)
+_SORT_KEY = re.compile(r"^(?:\w+\.)?\"?(?P<column>\w+)\"?(?P<desc> DESC)?")
+
+
+class IndexCandidate:
+    """
+    A proposed index on one of the tracked models, together with the queries it was derived from.
+    """
+
+    def __init__(self, model, fields, condition=None):
+        self.model = model
+        self.fields = list(fields)
+        self.condition = condition
+        self.queries = []
+        self.baseline = {}  # sql -> estimated cost of one run without the index
+        self.before = 0.0
+        self.after = 0.0
+
+    @property
+    def key(self):
+        return self.model._meta.label, tuple(self.fields), repr(self.condition)
+
+    @property
+    def index(self):
+        table = self.model._meta.db_table
+        digest = names_digest(table, *self.fields, repr(self.condition), length=6)
+        prefix = "_".join([self.model._meta.model_name[:10]] + [name.lstrip("-")[:6] for name in self.fields])
+        return models.Index(fields=self.fields, condition=self.condition, name=f"{prefix[:19]}_{digest}_idx")
+
+    @property
+    def gain(self):
+        return self.before - self.after
+
+    def declaration(self):
+        """The `Meta.indexes` entry that keeps the model state in line with the generated migration."""
+        declaration, _ = MigrationWriter.serialize(self.index)
+        return declaration
+
+
+def tracked_tables():
+    return {model._meta.db_table: model for model in map(apps.get_model, TRACKED_MODELS)}
+
+
+def explain(sql, using="default"):
+    """
+    Return the JSON plan of ``sql`` (a fully interpolated statement), ``None`` when it cannot be
+    explained, e.g. a silk capture whose parameters were not quoted.
+    """
+    connection = connections[using]
+    try:
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+            plan = cursor.fetchone()[0]
+    except DatabaseError:
+        return None
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    return plan[0]
+
+
+def plan_cost(plan):
+    return plan["Plan"]["Total Cost"]
+
+
+def walk(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from walk(child)
+
+
+def _field_for_column(model, column):
+    for field in model._meta.concrete_fields:
+        if field.column == column:
+            return field
+    return None
+
+
+def _literal(value):
+    match = _LITERAL.fullmatch(value.strip())
+    if not match:
+        return None
+    return match.group(1).replace("''", "'") if match.group(1) is not None else match.group(2)
+
+
+def parse_filter(model, expression):
+    """
+    Split a scan filter into ``(equality fields, range fields, partial condition)``.
+
+    Equalities against a constant on a boolean or choices field become the partial-index
+    condition, other equalities lead the key and range or prefix-LIKE columns follow them.
+    Disjunctions are not indexable by a single btree and yield nothing.
+    """
+    if not expression or " OR " in expression:
+        return [], [], None
+
+    equalities, ranges, condition = [], [], Q()
+    for conjunct in re.split(r"\s+AND\s+", expression.strip()):
+        conjunct = conjunct.strip()
+        negated = re.fullmatch(r"\(*NOT \"?(\w+)\"?\)*", conjunct)
+        bare = re.fullmatch(r"\(*\"?(\w+)\"?\)*", conjunct)
+        if negated or bare:
+            field = _field_for_column(model, (negated or bare).group(1))
+            if isinstance(field, models.BooleanField):
+                condition &= Q(**{field.name: not negated})
+            continue
+
+        match = _CONJUNCT.match(conjunct)
+        if not match:
+            continue
+        field = _field_for_column(model, match.group("column"))
+        if field is None:
+            continue
+        op, value = match.group("op"), _literal(match.group("value"))
+        if op == "=" and value is not None and (field.choices or isinstance(field, models.BooleanField)):
+            condition &= Q(**{field.name: field.to_python(value)})
+        elif op == "=":
+            equalities.append(field.name)
+        elif op == "~~" and (value is None or value.startswith("%")):
+            continue
+        else:
+            ranges.append(field.name)
+
+    return list(OrderedDict.fromkeys(equalities)), list(OrderedDict.fromkeys(ranges)), condition or None
+
+
+def _scan_below(node, tables):
+    """
+    The sequential scan of a tracked table feeding a sort, following single-input nodes only.
+    """
+    while node.get("Plans"):
+        if len(node["Plans"]) != 1:
+            return None
+        node = node["Plans"][0]
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in tables:
+            return node
+    return None
+
+
+def find_candidates(plan, tables=None):
+    """
+    Return the index candidates suggested by one explained plan.
+    """
+    tables = tracked_tables() if tables is None else tables
+    candidates, sorted_scans = [], set()
+
+    for node in walk(plan["Plan"]):
+        if node["Node Type"] not in ("Sort", "Incremental Sort"):
+            continue
+        scan = _scan_below(node, tables)
+        if scan is None:
+            continue
+        model = tables[scan["Relation Name"]]
+        sort_fields = []
+        for key in node.get("Sort Key", []):
+            match = _SORT_KEY.match(key)
+            field = _field_for_column(model, match.group("column")) if match else None
+            if field is None:
+                sort_fields = []
+                break
+            sort_fields.append(f"-{field.name}" if match.group("desc") else field.name)
+        if sort_fields:
+            equalities, _, condition = parse_filter(model, scan.get("Filter"))
+            candidates.append(IndexCandidate(model, equalities + sort_fields, condition))
+            sorted_scans.add(id(scan))
+
+    for node in walk(plan["Plan"]):
+        if node["Node Type"] != "Seq Scan" or node.get("Relation Name") not in tables or id(node) in sorted_scans:
+            continue
+        model = tables[node["Relation Name"]]
+        equalities, ranges, condition = parse_filter(model, node.get("Filter"))
+        if equalities or ranges:
+            candidates.append(IndexCandidate(model, equalities + ranges[:1], condition))
+
+    return [candidate for candidate in candidates if not is_covered(candidate)]
+
+
+def is_covered(candidate):
+    """
+    Whether an existing index (declared, unique or the implicit foreign key index) already
+    starts with the candidate's columns.
+    """
+    meta = candidate.model._meta
+    existing = [list(index.fields) for index in meta.indexes if index.condition is None]
+    existing += [[field.name] for field in meta.concrete_fields if field.db_index or field.unique]
+    existing += [list(fields) for fields in meta.unique_together]
+    return any(fields[:len(candidate.fields)] == candidate.fields for fields in existing)
+
+
+def advise(statements, using="default"):
+    """
+    Explain ``statements`` (``{sql: occurrences}``) and measure each candidate index against the
+    queries it came from. Returns ``(candidates, unexplained statements)``.
+    """
+    tables = tracked_tables()
+    candidates, plans, unexplained = OrderedDict(), {}, []
+
+    for sql, occurrences in statements.items():
+        plan = explain(sql, using)
+        if plan is None:
+            unexplained.append(sql)
+            continue
+        plans[sql] = plan
+        for candidate in find_candidates(plan, tables):
+            candidate = candidates.setdefault(candidate.key, candidate)
+            candidate.queries.append((sql, occurrences))
+
+    for candidate in candidates.values():
+        candidate.baseline = {sql: plan_cost(plans[sql]) for sql, _ in candidate.queries}
+        candidate.before = sum(candidate.baseline[sql] * occurrences for sql, occurrences in candidate.queries)
+        candidate.after = measure_with_index(candidate, using)
+    return list(candidates.values()), unexplained
+
+
+class _Rollback(Exception):
+    pass
+
+
+def measure_with_index(candidate, using="default"):
+    """
+    Weighted estimated cost of the candidate's queries with the index in place. The index is
+    created inside a transaction that is always rolled back. A query that cannot be explained
+    with the index counts for its cost without it, no gain is claimed on it.
+    """
+    connection = connections[using]
+    cost = 0.0
+    try:
+        with transaction.atomic(using=using):
+            with connection.schema_editor(atomic=False) as editor:
+                editor.add_index(candidate.model, candidate.index)
+            for sql, occurrences in candidate.queries:
+                plan = explain(sql, using)
+                cost += (plan_cost(plan) if plan else candidate.baseline[sql]) * occurrences
+            raise _Rollback()
+    except _Rollback:
+        pass
+    return cost
+
+
+def write_migrations(candidates, using="default"):
+    """
+    Write one migration per app adding the candidate indexes, return the written paths.
+    """
+    loader = MigrationLoader(connections[using], ignore_no_migrations=True)
+    by_app = OrderedDict()
+    for candidate in candidates:
+        by_app.setdefault(candidate.model._meta.app_label, []).append(candidate)
+
+    paths = []
+    for app_label, app_candidates in by_app.items():
+        leaves = sorted(loader.graph.leaf_nodes(app_label))
+        number = max((int(name.split("_")[0]) for _, name in leaves), default=0) + 1
+        migration = Migration(f"{number:04d}_advised_indexes", app_label)
+        migration.dependencies = leaves
+        migration.operations = [
+            AddIndex(model_name=candidate.model._meta.model_name, index=candidate.index) for candidate in app_candidates
+        ]
+        writer = MigrationWriter(migration)
+        with open(writer.path, "w", encoding="utf-8") as migration_file:
+            migration_file.write(writer.as_string())
+        paths.append(writer.path)
+    return paths
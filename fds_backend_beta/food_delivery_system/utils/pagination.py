@@ -1,16 +1,146 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor (keyset) pagination over a composite ordering such as ``('-created_at', '-id')``.
+
+    Pages are fetched with an index-range condition on the ordering columns instead of
+    ``OFFSET``, and no ``COUNT(*)`` is issued. The ordering is read from the view's
+    ``cursor_ordering`` attribute; all of its columns must share the same direction and the
+    last one must be unique (usually the primary key).
+    """
+
+    cursor_query_param = 'cursor'
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 700
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        ordering = tuple(view.cursor_ordering)
+        self.fields = [name.lstrip('-') for name in ordering]
+        descending = ordering[0].startswith('-')
+
+        position, self.reverse = self.decode_cursor(request, queryset.model)
+        # Walking backwards (previous page) reads the index in the opposite direction.
+        read_descending = descending != self.reverse
+        queryset = queryset.order_by(*[f"-{name}" if read_descending else name for name in self.fields])
+        if position is not None:
+            queryset = queryset.filter(self._keyset_condition(position, 'lt' if read_descending else 'gt'))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+
+        self.has_next = has_more if not self.reverse else position is not None
+        self.has_previous = has_more if self.reverse else position is not None
+        self.first, self.last = (results[0], results[-1]) if results else (None, None)
+        return results
+
+    def _keyset_condition(self, position, lookup):
+        """
+        Build ``(f1, f2, ...) < (v1, v2, ...)`` (or ``>``) as an OR of prefix equalities, bounded
+        by the leading column so the condition stays an index-range scan.
+        """
+        bound = 'lte' if lookup == 'lt' else 'gte'
+        condition = Q()
+        for index, name in enumerate(self.fields):
+            term = Q(**{f"{name}__{lookup}": position[index]})
+            for previous_name, previous_value in zip(self.fields[:index], position[:index]):
+                term &= Q(**{previous_name: previous_value})
+            condition |= term
+        return Q(**{f"{self.fields[0]}__{bound}": position[0]}) & condition
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def encode_cursor(self, instance, reverse):
+        position = [getattr(instance, name) for name in self.fields]
+        # str() keeps the full microsecond precision of datetimes, which the keyset relies on.
+        payload = json.dumps({'p': position, 'r': reverse}, default=str, separators=(',', ':'))
+        token = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, token)
+
+    def decode_cursor(self, request, model):
+        """
+        Return ``(position, reverse)`` for the requested cursor, ``(None, False)`` for the first page.
+        """
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+            position = [
+                model._meta.get_field(name).to_python(value) for name, value in zip(self.fields, payload['p'])
+            ]
+            if len(position) != len(self.fields):
+                raise ValueError(token)
+            return position, bool(payload.get('r'))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        return self.encode_cursor(self.last, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first is None:
+            return None
+        return self.encode_cursor(self.first, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
 
 
 class CustomPagination(PageNumberPagination):
-    """Custom pagination with page size and metadata customization."""
+    """
+    Custom pagination with page size and metadata customization.
+
+    Views that declare ``cursor_ordering`` can opt into keyset pagination by passing the
+    ``cursor`` query parameter (empty for the first page), page-number mode stays the default.
+    """
 
     page_size = 10  # Default page size
     page_size_query_param = 'page_size'  # Custom page size
     max_page_size = 700  # Limit maximum page size
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if getattr(view, 'cursor_ordering', None) and KeysetPagination.cursor_query_param in request.query_params:
+            self.keyset = KeysetPagination()
+            self.keyset.page_size = self.page_size
+            self.keyset.max_page_size = self.max_page_size
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
 
     def get_paginated_response(self, data):
         """Customize the paginated response."""
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+
         return Response({
             'total_pages': self.page.paginator.num_pages,
             'total_objects': self.page.paginator.count,
@@ -19,4 +149,3 @@ class CustomPagination(PageNumberPagination):
             'previous': self.get_previous_link(),
             'results': data,  # Actual paginated data
         })
-
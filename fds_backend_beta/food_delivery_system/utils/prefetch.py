@@ -0,0 +1,112 @@
+import sys
+
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+def _resolve_serializer(serializer, reference):
+    """
+    Resolve a serializer referenced by name (to allow forward references) against the module
+    of the serializer that declares the hint.
+    """
+    if isinstance(reference, str):
+        return getattr(sys.modules[type(serializer).__module__], reference)
+    return reference
+
+
+def _nested_serializers(serializer):
+    """
+    Yield (relation path, nested serializer) pairs for every relation the serializer renders.
+
+    Declared nested serializer fields are discovered automatically, relations that are read
+    outside of declared fields (e.g. in a SerializerMethodField or in to_representation) are
+    declared on the serializer via ``Meta.related_hints``, keyed by the field that reads them::
+
+        related_hints = {"role": "staff", "items": ("order_items", "OrderItemSerializer")}
+    """
+    hints = getattr(getattr(serializer, "Meta", None), "related_hints", {})
+
+    for name, field in serializer.fields.items():
+        if hasattr(serializer, "renders") and not serializer.renders(name):
+            continue
+        if name in hints:
+            hint = hints[name]
+            if isinstance(hint, str):
+                yield hint, None
+            else:
+                relation, nested_class = hint
+                if hasattr(serializer, "nested_serializer"):     # Renders the matching branch of a sparse fieldset
+                    yield relation, serializer.nested_serializer(name, nested_class, context=serializer.context)
+                else:
+                    yield relation, _resolve_serializer(serializer, nested_class)(context=serializer.context)
+            continue
+
+        if field.write_only or field.source == "*":
+            continue
+        if isinstance(field, serializers.ListSerializer):
+            yield field.source, field.child
+        elif isinstance(field, serializers.BaseSerializer):
+            yield field.source, field
+
+
+def build_prefetch_plan(serializer, model=None):
+    """
+    Walk a serializer tree and return the ``(select_related, prefetch_related)`` lookups needed to
+    render it without issuing per-row queries.
+
+    Forward foreign keys and one-to-one relations (in both directions) are joined with
+    ``select_related``, to-many relations are fetched with a ``Prefetch`` whose queryset carries the
+    plan of the nested serializer.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    model = model or serializer.Meta.model
+
+    select_related, prefetch_related = [], []
+    for relation, nested in _nested_serializers(serializer):
+        field = model._meta.get_field(relation)
+        related_model = field.related_model
+
+        if nested is None:
+            nested_select, nested_prefetch = [], []
+        else:
+            nested_select, nested_prefetch = build_prefetch_plan(nested, related_model)
+
+        if field.one_to_many or field.many_to_many:
+            queryset = related_model._default_manager.all()
+            if nested_select:
+                queryset = queryset.select_related(*nested_select)
+            if nested_prefetch:
+                queryset = queryset.prefetch_related(*nested_prefetch)
+            prefetch_related.append(Prefetch(relation, queryset=queryset))
+        else:
+            select_related.append(relation)
+            select_related.extend(f"{relation}__{lookup}" for lookup in nested_select)
+            for lookup in nested_prefetch:
+                prefetch_related.append(Prefetch(f"{relation}__{lookup.prefetch_through}", queryset=lookup.queryset))
+
+    return select_related, prefetch_related
+
+
+def apply_prefetch_plan(queryset, serializer):
+    """
+    Apply the prefetch plan of ``serializer`` to ``queryset``.
+    """
+    select_related, prefetch_related = build_prefetch_plan(serializer, queryset.model)
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    return queryset
+
+
+class PrefetchPlanMixin:
+    """
+    ViewSet mixin that applies the prefetch plan of the view's serializer to every queryset
+    read through ``filter_queryset`` (list, retrieve and ``get_object``), so the number of
+    queries per request stays flat regardless of the page size.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return apply_prefetch_plan(queryset, self.get_serializer())
@@ -0,0 +1,36 @@
+import orjson
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+_fallback = JSONEncoder()
+
+
+def _default(obj):
+    # orjson writes str, int, float, bool, None, dict, list, tuple, datetime, date, time, UUID,
+    # dataclasses and numpy arrays itself; everything else (Decimal, lazy strings, timedelta,
+    # querysets...) is converted the way DRF's encoder does.
+    return _fallback.default(obj)
+
+
+class ORJSONRenderer(BaseRenderer):
+    """
+    Drop-in replacement for DRF's JSONRenderer backed by orjson, which renders the output of the
+    serializers several times faster and straight to bytes.
+
+    Output is compact UTF-8, like JSONRenderer with the default settings; ``indent`` in the
+    accepted media type (the browsable API asks for it) gives 2-space indented output. Unlike
+    JSONRenderer, datetimes that reach the renderer unformatted keep their microseconds.
+    """
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        options = OPTIONS
+        if accepted_media_type and 'indent' in accepted_media_type:
+            options |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=_default, option=options)
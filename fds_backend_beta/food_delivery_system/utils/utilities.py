@@ -31,8 +31,11 @@ class UserPermissions:
         Assign permissions based on the action and user type, leveraging role-based access from the Staff model.
         """
         # import ipdb;ipdb.set_trace()
+        # DRF views expose the request, GraphQL mutations pass the request itself
+        path = view.request.path if hasattr(view, "request") else view.path
+
         # Deny access to the `create` endpoint for non-customers
-        if not "/graphql/" in view.path and view.action == 'create':
+        if not "/graphql/" in path and getattr(view, "action", None) == 'create':
             # Ensure the user is authenticated and is a customer
             if not view.request.user or not view.request.user.is_authenticated:
                 raise PermissionDenied("You must be logged in to create an order.")
@@ -45,7 +48,7 @@ class UserPermissions:
             # Apply `IsCustomer` permission for customers and admin.
             return [permissions.IsAuthenticated(), IsCustomer()]
 
-        elif "/graphql" in view.path and view.method == 'POST':     # Implementing role based permissions for GraphQL-query requests
+        elif "/graphql" in path and view.method == 'POST':     # Implementing role based permissions for GraphQL-query requests
             # import ipdb;ipdb.set_trace()
             # Ensure the user is authenticated and is a customer
             if not view.user or not view.user.is_authenticated:
@@ -112,7 +115,7 @@ class RBACPermissionManager:
             "group": "Managers",
         },
         "chef": {
-            "permissions": ["can_manage_menuitems", "can_mark_unavailable", "can_update_order_status"],
+            "permissions": ["can_manage_menuitems", "can_mark_available", "can_mark_unavailable", "can_update_order_status"],
             "group": "Chefs",
         },
         "delivery": {